@@ -0,0 +1,293 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from styled_pivot_automation_good_version_fix import (
+    ALL_COLS, EXCEL_MAX_ROWS, EXECUTION_BACKENDS, PIVOT_GROUPS, CYCLE_TABLE_BUILDERS, FilterPlan, create_final_report,
+    cycle_inputs, get_filtered_df, get_slpd_sheet_name, load_slpd_data, open_filter_plan, open_report_writer,
+    prepare_slpd_frame, resolve_reader_engine, slpd_input_format, spec_pivot_table, write_pivot_to_sheet)
+
+# Value pools of the synthetic export. They include every literal the report's specs filter on,
+# padded with look-alikes so the filters see realistic cardinalities.
+PROCESS_STEPS = [
+    'Carry Forward', 'Release Margin (PE/DE Before Change)', 'Value TC (Ins. Contracts) (Period Start)',
+    'Value TC (Ins. Contr.) (PE/DE Bef.Chg.)', 'Capture (Central GAAP) (PE/DE Bef. Chg.)', 'Capture (Central GAAP) (PS - Bef. Chge)',
+    'Unwind & Release (PS - Before Change)', 'Unwind and Release (PE/DE Before Change)',
+    'Recognize Profit (Prd Start - Bef. Chge)', 'Recognize Profit (PE/DE Before Change)',
+    'Allocate (Disclosure)(Per.St.- Aft.Chg.)', 'Allocate (Disclosure) (PE After Change)',
+    'Interest Accretion (PE/DE Before Change)', 'Change in Discount Rate (PE/DE)', 'Inflation Adjustment (PE/DE)',
+    'Experience Adjustment (PE/DE Before Change)', 'Assumption Change (PE/DE)', 'New Business (PS - Before Change)',
+]
+COST_ELEMENTS = [
+    '6000', 'Z2002', 'Z4000', 'Z3100', 'Z1013', 'Z2004', 'Z1017', 'Z2005', 'Z2007', 'Z2012', 'Z2017', 'Z2008', 'Z5040', 'Z5050',
+    'Z6001', 'Z1012', '3103', '7000', '7005', '7010', 'CRES', 'ZR100', 'ZR102', 'ZR200', 'ZR202',
+] + [f"Z{9000 + i}" for i in range(15)]
+GL_DESCRIPTIONS = [
+    'Actual Acquisition Cost - P&L VFA', 'LRC Acq.Cost amortization Expenses P&L   VFA', 'LIC PVFCF RA - BS VFA',
+    'LIC PVFCF Claims - BS VFA', 'LIC ULAE- VFA', 'LIC Change Claims- Current Service - P&L VFA',
+    'LIC Change Claims- Past Service - P&L VFA', 'LIC Change RA- Past Service - P&L VFA', 'LIC Change RA-Current Service - P&L VFA',
+    'LIC Change ULAE Current Service - P&L VFA', 'LIC Change ULAE Past Service- P&L VFA',
+    'LIC -InsFinExp Change in Inflation BE- P&L VFA', 'LIC -InsFinExp Change in Inflation BE - P&L PAA',
+    'LRC PVFCF - BS VFA', 'LRC RA - BS VFA', 'LRC CSM - BS VFA', 'LRC something VFA', 'Other',
+]
+ACCOUNTING_CHANGES = [100, 120, 200, 300, 405, 410, 505, 506, 600, 601, 608, 620, 801]
+BENCHMARK_SIZES = (100000, 1000000, 5000000)
+# Memory budget of the streamed report run (create_final_report's memory_budget_mb)
+STREAM_BUDGET_MB = 256
+
+def make_synthetic_slpd(rows, seed=0, years=3):
+    """Builds a random SLPD-shaped frame with the report's 13 columns, posting mostly on quarter edges over `years` years."""
+    rng = np.random.default_rng(seed)
+    quarter_ends = pd.period_range(end=pd.Period('2024Q4'), periods=4 * years, freq='Q')
+    day_pool = pd.DatetimeIndex(list(quarter_ends.start_time.normalize()) + list(quarter_ends.end_time.normalize())
+                                + list((quarter_ends.start_time + pd.Timedelta(days=40)).normalize()))
+    day_weights = np.repeat([0.25, 0.6, 0.15], len(quarter_ends)) / len(quarter_ends)
+    gl_accounts = np.concatenate([rng.choice(np.arange(110000, 299999, 500), 40, replace=False),
+                                  rng.choice(np.arange(400000, 899999, 500), 20, replace=False)])
+    sub_accounts = np.array([f"{prefix}{i:05d}" for prefix in '12' for i in rng.choice(100000, 100, replace=False)])
+    coverages = max(rows // 50, 1)
+    coverage_ids = np.char.add(rng.choice(['VFP-', 'GMM-', 'PAA-'], coverages, p=[0.7, 0.2, 0.1]), np.arange(coverages).astype(str))
+    return pd.DataFrame({
+        ALL_COLS['amount_col']: rng.normal(0, 1000, rows).round(2),
+        ALL_COLS['date_col']: day_pool[rng.choice(len(day_pool), rows, p=day_weights)],
+        ALL_COLS['class_col']: rng.choice(['VFP', 'GMM', 'PAA'], rows, p=[0.7, 0.2, 0.1]),
+        ALL_COLS['cost_elem_col']: rng.choice(COST_ELEMENTS, rows),
+        ALL_COLS['gl_col']: rng.choice(gl_accounts, rows),
+        ALL_COLS['lifecycle_col']: rng.choice([0, 10, 20, 50], rows),
+        ALL_COLS['sub_acc_col']: rng.choice(sub_accounts, rows),
+        ALL_COLS['proc_step_col']: rng.choice(PROCESS_STEPS, rows),
+        ALL_COLS['loss_comp_col']: rng.choice([0, 1], rows, p=[0.9, 0.1]),
+        ALL_COLS['coverage_id_col']: coverage_ids[rng.integers(0, coverages, rows)],
+        ALL_COLS['desc_gl_col']: rng.choice(GL_DESCRIPTIONS, rows),
+        ALL_COLS['occ_year_col']: rng.choice(np.arange(2018, 2025), rows),
+        ALL_COLS['acc_change_col']: rng.choice(ACCOUNTING_CHANGES, rows),
+    })
+
+def write_synthetic_workbook(path, rows, seed=0):
+    """Writes a synthetic SLPD export to path: CSV or Parquet by extension, else an 'SLPD' sheet."""
+    input_format = slpd_input_format(path)
+    if input_format == 'csv':
+        make_synthetic_slpd(rows, seed).to_csv(path, index=False)
+        return
+    if input_format == 'parquet':
+        make_synthetic_slpd(rows, seed).to_parquet(path, index=False)
+        return
+    if rows >= EXCEL_MAX_ROWS:
+        raise ValueError(f"{rows} rows do not fit on one Excel sheet ({EXCEL_MAX_ROWS - 1} data rows at most)")
+    engine = 'xlsxwriter' if importlib.util.find_spec('xlsxwriter') else 'openpyxl'
+    make_synthetic_slpd(rows, seed).to_excel(path, sheet_name='SLPD', index=False, engine=engine)
+
+def benchmark_reader_engines(path):
+    """Times sheet detection plus the full read for every installed reader engine, checking each frame against the first."""
+    results = {}
+    reference = None
+    engines = ['openpyxl', 'calamine']
+    if path.lower().endswith('.xls'):
+        engines = ['xlrd', 'calamine']
+    for engine in engines:
+        if resolve_reader_engine(path, engine) != engine:
+            continue
+        start = time.perf_counter()
+        sheet_name = get_slpd_sheet_name(path, engine=engine)
+        try:
+            df = pd.read_excel(path, sheet_name=sheet_name, header=0, engine=engine)
+        except Exception as e:
+            print(f"{engine}: cannot read {path}: {e}")
+            continue
+        results[engine] = time.perf_counter() - start
+        if reference is None:
+            reference = df
+        else:
+            pd.testing.assert_frame_equal(reference, df)
+
+    baseline = results.get(engines[0])
+    for engine, seconds in results.items():
+        speedup = f"{baseline / seconds:.1f}x" if baseline else "n/a"
+        print(f"{engine:<10} {seconds:8.2f}s  speedup vs {engines[0]}: {speedup}")
+    return results
+
+def _timed(stages, name, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    stages[name] = time.perf_counter() - start
+    return result
+
+def _all_specs():
+    """Yields (sheet_name, spec) for every filtered table of PIVOT_GROUPS, side-by-side halves included."""
+    for sheet_name, pivots in PIVOT_GROUPS.items():
+        for pivot_spec in pivots:
+            if pivot_spec.get('layout') == 'side_by_side':
+                yield sheet_name, pivot_spec['table1']
+                yield sheet_name, pivot_spec['table2']
+            elif 'filters' in pivot_spec:
+                yield sheet_name, pivot_spec
+
+def benchmark_size(rows, workdir, seed=0, writer_backend='openpyxl'):
+    """Times every report stage on a synthetic export of `rows` rows, loaded and streamed; returns {stage: seconds}."""
+    stages = {}
+    raw = _timed(stages, 'generate', make_synthetic_slpd, rows, seed)
+    input_path = os.path.join(workdir, f"synthetic_slpd_{rows}.xlsx")
+    csv_path = os.path.join(workdir, f"synthetic_slpd_{rows}.csv")
+    parquet_path = os.path.join(workdir, f"synthetic_slpd_{rows}.parquet")
+    cache_dir = os.path.join(workdir, 'cache')
+    _timed(stages, 'write_input_csv', raw.to_csv, csv_path, index=False)
+    _timed(stages, 'write_input_parquet', raw.to_parquet, parquet_path, index=False)
+    _timed(stages, 'load_csv', load_slpd_data, csv_path, ALL_COLS, use_cache=False)
+    df = _timed(stages, 'load_parquet', load_slpd_data, parquet_path, ALL_COLS, use_cache=False)
+    if rows < EXCEL_MAX_ROWS:
+        engine = 'xlsxwriter' if importlib.util.find_spec('xlsxwriter') else 'openpyxl'
+        _timed(stages, 'write_input_xlsx', raw.to_excel, input_path, sheet_name='SLPD', index=False, engine=engine)
+        _timed(stages, 'load', load_slpd_data, input_path, ALL_COLS, use_cache=False)
+        _timed(stages, 'load_cache_miss', load_slpd_data, input_path, ALL_COLS, cache_dir=cache_dir)
+        df = _timed(stages, 'load_cache_hit', load_slpd_data, input_path, ALL_COLS, cache_dir=cache_dir)
+    else:
+        input_path = parquet_path
+    del raw
+
+    for sheet_name, spec in _all_specs():
+        filtered_df, _ = _timed(stages, f"filter/{sheet_name}/{spec['title']}", get_filtered_df, df, spec, ALL_COLS)
+        _timed(stages, f"pivot/{sheet_name}/{spec['title']}", spec_pivot_table, filtered_df, spec, ALL_COLS)
+
+    filter_plan = FilterPlan(df, ALL_COLS)
+    for sheet_name, pivots in PIVOT_GROUPS.items():
+        for cycle_type, (df1, df2) in cycle_inputs(filter_plan, sheet_name, pivots).items():
+            spec = next(p for p in pivots if p.get('type') == cycle_type)
+            _timed(stages, f"cycle/{sheet_name}/{spec['title']}", CYCLE_TABLE_BUILDERS[cycle_type], df1, df2, spec, ALL_COLS)
+
+    output_path = os.path.join(workdir, f"pivots_{rows}.xlsx")
+    with open_report_writer(output_path, writer_backend) as writer:
+        next_row = {}
+        for sheet_name, spec in _all_specs():
+            pivot_df = spec_pivot_table(filter_plan.filter(spec)[0], spec, ALL_COLS)
+            last_row = _timed(stages, f"write_pivot/{sheet_name}/{spec['title']}", write_pivot_to_sheet,
+                              writer, sheet_name, pivot_df, next_row.get(sheet_name, 1), spec['title'], {})
+            next_row[sheet_name] = last_row + 10
+        save_start = time.perf_counter()
+    stages['write_pivot/save'] = time.perf_counter() - save_start
+
+    report_path = os.path.join(workdir, f"final_report_{rows}.xlsx")
+    _timed(stages, 'total', create_final_report, input_path, report_path, use_cache=False, writer_backend=writer_backend, raise_errors=True)
+    streamed_path = os.path.join(workdir, f"final_report_{rows}_streamed.xlsx")
+    _timed(stages, 'total_streamed', create_final_report, parquet_path, streamed_path, writer_backend=writer_backend,
+           memory_budget_mb=STREAM_BUDGET_MB, raise_errors=True)
+    return stages
+
+def run_benchmark_suite(sizes, results_path, seed=0, writer_backend='openpyxl', workdir=None):
+    """Benchmarks every size in `sizes` and saves the timings with run metadata as JSON."""
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='slpd_bench_')
+    try:
+        runs = []
+        for rows in sizes:
+            print(f"Benchmarking {rows} rows...")
+            stages = benchmark_size(rows, workdir, seed=seed, writer_backend=writer_backend)
+            runs.append({'rows': rows, 'stages': stages})
+            print(f"  total: {stages.get('total', float('nan')):.2f}s")
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'platform': platform.platform(),
+        'cpu_count': os.cpu_count(), 'seed': seed, 'writer_backend': writer_backend, 'runs': runs,
+    }
+    with open(results_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"Results written to {results_path}")
+    return results
+
+def check_backends(df, backends=None, rtol=1e-9, atol=1e-6):
+    """Checks every table of PIVOT_GROUPS on each installed execution backend against pandas; returns the number of mismatches."""
+    reference = FilterPlan(df, ALL_COLS)
+    mismatches = 0
+    for backend in backends or [name for name in EXECUTION_BACKENDS if name != 'pandas']:
+        try:
+            plan = open_filter_plan(df, ALL_COLS, backend)
+        except ImportError as e:
+            print(f"{backend:<8} skipped ({e})")
+            continue
+        start = time.perf_counter()
+        failed = []
+        for sheet_name, spec in _all_specs():
+            try:
+                (frame, display_filters), (expected_frame, expected_filters) = plan.filter(spec), reference.filter(spec)
+                assert display_filters == expected_filters, "display filters differ"
+                assert_frame_equal(frame, expected_frame)
+                assert_frame_equal(plan.pivot(spec), reference.pivot(spec), check_exact=False, rtol=rtol, atol=atol)
+            except AssertionError as e:
+                failed.append(f"{sheet_name}/{spec['title']}: {str(e).splitlines()[0] if str(e) else 'assertion failed'}")
+        print(f"{backend:<8} {len(failed)} mismatching table(s) (checked in {time.perf_counter() - start:.2f}s)")
+        for line in failed:
+            print(f"  {line}")
+        mismatches += len(failed)
+    return mismatches
+
+def compare_results(baseline_path, current_path, threshold=1.1):
+    """Prints the stages that got slower than threshold x the baseline, for the sizes both files share."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {run['rows']: run['stages'] for run in json.load(f)['runs']}
+    with open(current_path, encoding='utf-8') as f:
+        current = {run['rows']: run['stages'] for run in json.load(f)['runs']}
+    regressions = 0
+    for rows in sorted(set(baseline) & set(current)):
+        for stage, seconds in current[rows].items():
+            before = baseline[rows].get(stage)
+            if before and seconds > before * threshold and seconds - before > 0.05:
+                regressions += 1
+                print(f"{rows:>9} rows  {stage:<70} {before:8.2f}s -> {seconds:8.2f}s ({seconds / before:.2f}x)")
+    print(f"{regressions} stage(s) slower than {threshold:.2f}x the baseline")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SLPD report on synthetic exports.")
+    subparsers = parser.add_subparsers(dest='command')
+    readers = subparsers.add_parser('readers', help="compare the Excel reader engines on one workbook")
+    readers.add_argument('--rows', type=int, default=200000)
+    readers.add_argument('--path', default='synthetic_slpd.xlsx')
+    generate = subparsers.add_parser('generate', help="write a synthetic SLPD export")
+    generate.add_argument('path', help=".xlsx, .csv or .parquet")
+    generate.add_argument('--rows', type=int, default=100000)
+    generate.add_argument('--seed', type=int, default=0)
+    suite = subparsers.add_parser('suite', help="time every report stage and save the timings as JSON")
+    suite.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES))
+    suite.add_argument('--out', default='slpd_benchmark_results.json')
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--writer', default='openpyxl')
+    suite.add_argument('--workdir', default=None, help="keep the generated files here instead of a temporary folder")
+    backends = subparsers.add_parser('backends', help="check the execution backends against pandas on every table")
+    backends.add_argument('--input', default=None, help="SLPD export to check on (default: a synthetic one)")
+    backends.add_argument('--rows', type=int, default=200000)
+    backends.add_argument('--seed', type=int, default=0)
+    compare = subparsers.add_parser('compare', help="list stages slower than in a baseline results file")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=1.1)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        write_synthetic_workbook(args.path, args.rows, args.seed)
+    elif args.command == 'suite':
+        run_benchmark_suite(args.sizes, args.out, seed=args.seed, writer_backend=args.writer, workdir=args.workdir)
+    elif args.command == 'backends':
+        df = load_slpd_data(args.input, ALL_COLS, use_cache=False) if args.input else prepare_slpd_frame(make_synthetic_slpd(args.rows, args.seed), ALL_COLS)
+        raise SystemExit(1 if check_backends(df) else 0)
+    elif args.command == 'compare':
+        raise SystemExit(1 if compare_results(args.baseline, args.current, args.threshold) else 0)
+    else:
+        path = getattr(args, 'path', 'synthetic_slpd.xlsx')
+        if not os.path.exists(path):
+            rows = getattr(args, 'rows', 200000)
+            print(f"Writing {rows} synthetic rows to {path}")
+            write_synthetic_workbook(path, rows)
+        benchmark_reader_engines(path)
@@ -2,477 +2,721 @@ import pandas as pd
 import numpy as np
 import os
 import re
+import hashlib
+import io
+import json
+import functools
+import itertools
+import sys
+import tracemalloc
+import glob
+import argparse
+import time
+import contextlib
+import importlib.util
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 from datetime import datetime
-import tkinter as tk
-from tkinter import filedialog
-from openpyxl import Workbook
-from openpyxl.styles import Font, Border, Side, PatternFill
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pandas.io.parsers import TextParser
+import openpyxl
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font, Border, Side, PatternFill, Alignment, NamedStyle
 from openpyxl.utils import get_column_letter
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.worksheet._writer import WorksheetWriter
 
-def write_pivot_to_sheet(writer, sheet_name, pivot_df, start_row, title, filters, title_fill=None, start_col=1):
-    """Writes a styled pivot table with a title and filters to a specific location on a sheet."""
-    
-    if sheet_name not in writer.book.sheetnames:
-        ws = writer.book.create_sheet(sheet_name)
-        writer.sheets[sheet_name] = ws
-    else:
-        ws = writer.sheets[sheet_name]
+ALL_COLS = {
+    'amount_col': 'Amount in Functional Currency', 'date_col': 'Posting Date',
+    'class_col': 'Classification', 'cost_elem_col': 'Cost or Revenue Element',
+    'gl_col': 'G/L Account', 'lifecycle_col': 'Subledger Account Lifecycle Stage',
+    'sub_acc_col': 'Subledger Account', 'proc_step_col': 'Description Process Step ID',
+    'loss_comp_col': 'Contributes to Loss Component', 'coverage_id_col': 'Coverage ID',
+    'desc_gl_col': 'Description G/L Account', 'occ_year_col': 'Description Occurrence Year',
+    'acc_change_col': 'Accounting Change'
+}
 
-    if title:
-        cell = ws.cell(row=start_row, column=start_col, value=title)
-        cell.font = Font(bold=True, size=14)
-        if title_fill:
-            cell.fill = title_fill
-        start_row += 2
+# Parsed-source cache. Bump SLPD_CACHE_VERSION whenever prepare_slpd_frame changes
+# the typed frame, so stale entries are never served.
+SLPD_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.slpd_cache')
+SLPD_CACHE_MAX_BYTES = 2 * 1024 ** 3
+SLPD_CACHE_VERSION = 3
 
-    if filters:
-        filter_start_row = start_row
-        ws.cell(row=filter_start_row, column=start_col, value="Filters Used:").font = Font(bold=True)
-        filter_row_offset = 1
-        for key, value in filters.items():
-            cell = ws.cell(row=filter_start_row + filter_row_offset, column=start_col, value=f"• {key}:")
-            cell.font = Font(bold=True)
-            
-            if isinstance(value, list) and len(value) > 1:
-                filter_row_offset += 1
-                for item in value:
-                    ws.cell(row=filter_start_row + filter_row_offset, column=start_col + 1, value=str(item))
-                    filter_row_offset += 1
-            else:
-                ws.cell(row=filter_start_row + filter_row_offset, column=start_col + 1, value=str(value))
-                filter_row_offset += 1
-        start_row = filter_start_row + filter_row_offset
-
-    pivot_start_row = start_row + 2
-    pivot_df.to_excel(writer, sheet_name=sheet_name, startrow=pivot_start_row - 1, startcol=start_col - 1)
-    
-    lighter_blue_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-    header_font = Font(bold=True, color="000000")
+# Stored per-quarter cycle aggregates (cycle_history_dir). Bump when cycle_cells changes what it stores.
+CYCLE_HISTORY_VERSION = 1
+
+# Low-cardinality text columns kept as categoricals, so filters run once per distinct value
+CATEGORICAL_COLS = ['class_col', 'sub_acc_col', 'proc_step_col', 'cost_elem_col', 'coverage_id_col', 'desc_gl_col']
+
+READER_ENGINES = ('auto', 'calamine', 'xlrd', 'openpyxl')
+
+# Non-Excel SLPD exports, recognised by extension
+SLPD_CSV_EXTENSIONS = ('.csv', '.csv.gz', '.txt')
+SLPD_PARQUET_EXTENSIONS = ('.parquet', '.pq')
+SLPD_CSV_BLOCK_BYTES = 16 * 1024 ** 2
+# Streaming reads (memory_budget_mb): rows per read chunk, and how many typed copies of a batch's rows
+# are alive while it is aggregated (filtered frames, masks and groupby temporaries)
+SLPD_STREAM_CHUNK_ROWS = 50000
+SLPD_STREAM_WORKING_COPIES = 6
+
+# Posting dates are parsed once at load; pivot headers and the Source_Data dump show them in this format
+DATE_FORMAT = '%Y-%m-%d'
+
+# How the raw SLPD rows are dumped: 'full' writes them through pandas/openpyxl, 'stream' writes the
+# sheet XML directly into the saved package, 'parquet' writes a sidecar file instead of a sheet.
+SOURCE_DATA_MODES = ('full', 'stream', 'parquet')
+EXCEL_MAX_ROWS = 1048576
+SOURCE_DATA_CHUNK_ROWS = 50000
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+# In a report run with exceptions_only, specs with 'exceptions_only' write just the rows with an amount beyond
+# this (or the spec's own 'exceptions_tolerance') in absolute value; half a cent absorbs float noise in amounts
+# that net to zero
+EXCEPTIONS_TOLERANCE = 0.005
+# Smallest change between two saved runs that the diff workbook lists (see diff_report_results)
+DIFF_TOLERANCE = 0.005
+# Most failing rows a Coverage ID check table shows (see coverage_check_table)
+COVERAGE_CHECK_MAX_ROWS = 50000
+# Source rows from which sheet_group_runner uses a process pool when no worker count is given; on
+# smaller exports, copying the frame into each worker costs more than the groups take to aggregate
+PARALLEL_SHEET_GROUPS_MIN_ROWS = 500000
+
+def register_report_styles(book):
+    """Registers the shared named styles used by the report, once per workbook."""
+    existing = set(book.named_styles)
     thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    styles = [
+        NamedStyle(name='Report Title', font=Font(bold=True, size=14)),
+        NamedStyle(name='Filter Label', font=Font(bold=True)),
+        NamedStyle(name='Pivot Header', font=Font(bold=True, color="000000"), border=thin_border,
+                   fill=PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid"),
+                   alignment=Alignment(horizontal='center', vertical='top')),
+        NamedStyle(name='Pivot Index', font=Font(bold=True), border=thin_border,
+                   alignment=Alignment(horizontal='center', vertical='top')),
+        NamedStyle(name='Pivot Cell', border=thin_border),
+    ]
+    for style in styles:
+        if style.name not in existing:
+            book.add_named_style(style)
 
-    header_rows = pivot_df.columns.nlevels
-    data_rows = len(pivot_df)
-    num_cols = len(pivot_df.columns) + pivot_df.index.nlevels
+def pivot_column_widths(pivot_df):
+    """Computes Excel column widths for a pivot written with its index, from the frame's string lengths."""
+    widths = []
+    for level in range(pivot_df.index.nlevels):
+        labels = pd.Series(pivot_df.index.get_level_values(level), dtype=object).astype(str)
+        width = max(labels.str.len().max() if len(labels) else 0, len(str(pivot_df.index.names[level] or '')))
+        if level == 0 and pivot_df.columns.nlevels > 1:
+            width = max([width] + [len(str(name)) for name in pivot_df.columns.names if name is not None])
+        widths.append(width)
+    for position in range(pivot_df.shape[1]):
+        column = pivot_df.columns[position]
+        header = column if isinstance(column, tuple) else (column,)
+        values = pivot_df.iloc[:, position].astype(str)
+        widths.append(max([values.str.len().max() if len(values) else 0] + [len(str(label)) for label in header]))
+    return [int(width) + 2 for width in widths]
 
-    for r in ws.iter_rows(min_row=pivot_start_row, max_row=pivot_start_row + header_rows + data_rows - 1, min_col=start_col, max_col=start_col + num_cols - 1):
-        for cell in r:
-            cell.border = thin_border
+def filter_block_rows(filters):
+    """Lays out a 'Filters Used' block as (row offset, label, value) rows; label or value may be None."""
+    rows = [(0, "Filters Used:", None)]
+    offset = 1
+    for key, value in filters.items():
+        if isinstance(value, list) and len(value) > 1:
+            rows.append((offset, f"• {key}:", None))
+            offset += 1
+            for item in value:
+                rows.append((offset, None, str(item)))
+                offset += 1
+        else:
+            rows.append((offset, f"• {key}:", str(value)))
+            offset += 1
+    return rows, offset
 
-    for r in range(pivot_start_row, pivot_start_row + header_rows):
-        for c in range(start_col, start_col + num_cols):
-            ws.cell(row=r, column=c).fill = lighter_blue_fill
-            ws.cell(row=r, column=c).font = header_font
+def pivot_block_geometry(pivot_df):
+    """Returns (header rows, index columns, total columns, Grand Total row offset or None) of a pivot as to_excel lays it out."""
+    # pandas always adds a row for the index names under multi-level column headers
+    header_rows = pivot_df.columns.nlevels
+    if header_rows > 1:
+        header_rows += 1
+    index_cols = pivot_df.index.nlevels
+    num_cols = len(pivot_df.columns) + index_cols
 
+    grand_total_offset = None
     if 'Grand Total' in pivot_df.index:
         try:
-            grand_total_row_idx = pivot_df.index.get_loc('Grand Total')
-            if isinstance(grand_total_row_idx, int):
-                grand_total_row = pivot_start_row + header_rows + grand_total_row_idx
-                for c in range(start_col, start_col + num_cols):
-                    ws.cell(row=grand_total_row, column=c).fill = lighter_blue_fill
-                    ws.cell(row=grand_total_row, column=c).font = header_font
+            # On a MultiIndex get_loc returns a slice or mask over the 'Grand Total' rows
+            loc = pivot_df.index.get_loc('Grand Total')
+            if isinstance(loc, slice):
+                positions = range(len(pivot_df))[loc]
+            elif isinstance(loc, np.ndarray):
+                positions = np.flatnonzero(loc)
+            else:
+                positions = [loc]
+            if len(positions) == 1:
+                grand_total_offset = header_rows + int(positions[0])
         except (KeyError, TypeError):
             pass
+    return header_rows, index_cols, num_cols, grand_total_offset
 
-    for i in range(num_cols):
-        col_letter = get_column_letter(start_col + i)
-        max_length = 0
-        for r in range(pivot_start_row, pivot_start_row + header_rows + data_rows):
-            cell = ws.cell(row=r, column=start_col + i)
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        ws.column_dimensions[col_letter].width = max_length + 2
+def _merged_label_mask(index):
+    """Marks where to_excel's merged layout shows each level's labels: where it or an outer level changes, every row for the innermost."""
+    changed = np.zeros(len(index), dtype=bool)
+    changed[:1] = True
+    masks = []
+    for codes in index.codes[:-1] if isinstance(index, pd.MultiIndex) else []:
+        codes = np.asarray(codes)
+        changed[1:] |= codes[1:] != codes[:-1]
+        masks.append(changed.copy())
+    return masks + [np.ones(len(index), dtype=bool)]
 
-    return ws.max_row
+def pivot_excel_cells(pivot_df):
+    """Lays pivot_df out as to_excel does, as 0-based {(row, col): value}; merged labels sit on the first cell of their span."""
+    header_rows, index_cols, _, _ = pivot_block_geometry(pivot_df)
+    index, columns = pivot_df.index, pivot_df.columns
+    cells = {}
+    if isinstance(columns, pd.MultiIndex):
+        # a header row per column level, with the level's name just left of its labels
+        for level, shown in enumerate(_merged_label_mask(columns)):
+            cells[(level, index_cols - 1)] = columns.names[level]
+            labels = columns.get_level_values(level)
+            for j in np.flatnonzero(shown):
+                cells[(level, index_cols + int(j))] = labels[j]
+    else:
+        for j, label in enumerate(columns):
+            cells[(0, index_cols + j)] = label
+    names = list(index.names)
+    # a frame without columns gets its index names a row lower, below the header when all are set
+    name_row = header_rows if not len(columns) and all(name not in (None, '') for name in names) else header_rows - 1
+    if (any(name is not None for name in names) if isinstance(index, pd.MultiIndex) else names[0]):
+        for k, name in enumerate(names):
+            cells[(name_row, k)] = name
+    for level, shown in enumerate(_merged_label_mask(index)):
+        # row labels that are periods are written as their start date
+        labels = index.get_level_values(level)
+        labels = labels.to_timestamp() if isinstance(labels, pd.PeriodIndex) else labels
+        for i in np.flatnonzero(shown):
+            cells[(header_rows + int(i), level)] = labels[i]
+    values = pivot_df.to_numpy(dtype=object)
+    for i, j in np.ndindex(values.shape):
+        cells[(header_rows + i, index_cols + j)] = values[i, j]
+    return {key: _excel_value(value) for key, value in cells.items()}
 
-def create_lrc_cycle_table(writer, sheet_name, pvbe_df, ra_df, pivot_spec, start_row, all_cols, table_positions):
-    import pandas as pd
+def _excel_value(value):
+    # as to_excel writes them: missing values empty, infinities and periods as text
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, (float, np.floating)) and np.isinf(value):
+        return 'inf' if value > 0 else '-inf'
+    return str(value) if isinstance(value, pd.Period) else value
 
-    amount_col = all_cols['amount_col']
-    date_col = all_cols['date_col']
-    acc_change_col = all_cols['acc_change_col']
-    proc_step_col = all_cols['proc_step_col']
-
-    pvbe_df['Component'] = 'PVBE'
-    ra_df['Component'] = 'RA'
-    base_df = pd.concat([pvbe_df, ra_df])
-    
-    base_df[date_col] = pd.to_datetime(base_df[date_col], errors='coerce')
-    base_df['Quarter'] = base_df[date_col].dt.to_period('Q')
-    base_df['IsQuarterEnd'] = base_df[date_col].dt.is_quarter_end
-    base_df['IsQuarterStart'] = base_df[date_col].dt.is_quarter_start
-    
-    quarter_end_dates = base_df[base_df['IsQuarterEnd']][date_col].drop_duplicates().sort_values()
-    quarter_mapping = {date.to_period('Q'): date.strftime('%d/%m/%Y') for date in quarter_end_dates}
-    quarters = sorted(quarter_mapping.keys())
-    
-    row_specs = [
-        {'name': 'יתרת פתיחה', 'type': 'opening_balance'},
-        {'name': 'עסק חדש', 'type': 'acc_filter', 'acc_code': 100, 'date_filter': 'quarter_start'},
-        {'name': 'שחרור', 'type': 'acc_filter', 'acc_code': 405, 'date_filter': 'quarter_end'},
-        {'name': 'תיאומים בהתאם לניסיון', 'type': 'acc_filter', 'acc_code': 505, 'date_filter': 'quarter_end', 'ra_zero': True},
-        {'name': 'שינוי הנחות', 'type': 'acc_filter', 'acc_code': 600, 'date_filter': 'quarter_end'},
-        {'name': 'שינוי ל LRR', 'type': 'empty'},
-        {'name': 'זקיפה לCSM', 'type': 'csm_calculation'},
-        {'name': 'הוצאות מימון', 'type': 'sum_finance'},
-        {'name': 'צבירת ריבית', 'type': 'acc_filter', 'acc_code': 200, 'date_filter': 'quarter_end'},
-        {'name': 'שינוי בריבית שוטפת', 'type': 'acc_filter', 'acc_code': 300, 'date_filter': 'quarter_end'},
-        {'name': 'אינפלציה', 'type': 'acc_filter', 'acc_code': 601, 'date_filter': 'quarter_end'},
-        {'name': 'יתרת סגירה ליום', 'type': 'sum_movements'},
-        {'name': 'Check', 'type': 'validation_check'}
-    ]
-    
-    result_data = []
-    for i, quarter in enumerate(quarters):
-        quarter_label = quarter_mapping.get(quarter, str(quarter))
-        for row_spec in row_specs:
-            row_data = {'Row': row_spec['name'], 'Quarter': quarter_label, 'PVBE': 0, 'RA': 0}
-            if row_spec['type'] not in ['sum_finance', 'sum_movements', 'validation_check', 'empty', 'tbd']:
-                df_slice = pd.DataFrame() 
-                if row_spec['type'] == 'opening_balance':
-                    if i > 0:
-                        df_slice = base_df[(base_df['Quarter'] == quarters[i-1]) & base_df['IsQuarterEnd']]
-                    else:
-                        df_slice = base_df[(base_df['Quarter'] == quarter) & base_df['IsQuarterStart']]
-                elif row_spec['type'] == 'acc_filter':
-                    df_slice = base_df[base_df[acc_change_col] == row_spec['acc_code']]
-                    date_filter = row_spec['date_filter']
-                    if date_filter == 'quarter_end':
-                        df_slice = df_slice[df_slice['IsQuarterEnd'] & (df_slice['Quarter'] == quarter)]
-                    elif date_filter == 'quarter_start':
-                        df_slice = df_slice[df_slice['IsQuarterStart'] & (df_slice['Quarter'] == quarter)]
-                elif row_spec['type'] == 'csm_calculation':
-                    pvbe_csm, ra_csm = 0, 0
-                    q_df = base_df[base_df['Quarter'] == quarter]
-                    if i == 0:
-                        c1 = (q_df['Component'] == 'PVBE') & q_df[proc_step_col].str.contains('Recognize Profit (Prd Start - Bef. Chge)', regex=True, na=False) & (q_df[acc_change_col] == 801) & q_df['IsQuarterStart']
-                        c2 = (q_df['Component'] == 'PVBE') & q_df[proc_step_col].str.contains('Allocate (Disclosure) (PE After Change)', regex=True, na=False) & (q_df[acc_change_col] == 620) & q_df['IsQuarterEnd']
-                        c3 = (q_df['Component'] == 'PVBE') & q_df[proc_step_col].str.contains('Recognize Profit (PE/DE Before Change)', regex=True, na=False) & (q_df[acc_change_col] == 410) & q_df['IsQuarterEnd']
-                        pvbe_csm = q_df[c1 | c2 | c3][amount_col].sum()
-                        c4 = (q_df['Component'] == 'RA') & q_df[proc_step_col].str.contains('Allocate (Disclosure)(Per.St.- Aft.Chg.)', regex=True, na=False) & (q_df[acc_change_col] == 120) & q_df['IsQuarterStart']
-                        c5 = (q_df['Component'] == 'RA') & q_df[proc_step_col].str.contains('Allocate (Disclosure) (PE After Change)', regex=True, na=False) & (q_df[acc_change_col] == 620) & q_df['IsQuarterEnd']
-                        ra_csm = q_df[c4 | c5][amount_col].sum()
-                    else:
-                        c1 = (q_df['Component'] == 'PVBE') & q_df[proc_step_col].str.contains('Allocate (Disclosure)(Per.St.- Aft.Chg.)', regex=True, na=False) & (q_df[acc_change_col] == 120) & q_df['IsQuarterStart']
-                        pvbe_csm = q_df[c1][amount_col].sum()
-                        c4 = (q_df['Component'] == 'RA') & q_df[proc_step_col].str.contains('Allocate (Disclosure)(Per.St.- Aft.Chg.)', regex=True, na=False) & (q_df[acc_change_col] == 120) & q_df['IsQuarterStart']
-                        c5 = (q_df['Component'] == 'RA') & q_df[proc_step_col].str.contains('Allocate (Disclosure) (PE After Change)', regex=True, na=False) & (q_df[acc_change_col] == 620) & q_df['IsQuarterEnd']
-                        ra_csm = q_df[c4 | c5][amount_col].sum()
-                    row_data['PVBE'] = pvbe_csm
-                    row_data['RA'] = ra_csm
-                
-                if not df_slice.empty:
-                    row_data['PVBE'] = df_slice[df_slice['Component'] == 'PVBE'][amount_col].sum()
-                    if not (row_spec.get('type') == 'acc_filter' and row_spec.get('ra_zero')):
-                        row_data['RA'] = df_slice[df_slice['Component'] == 'RA'][amount_col].sum()
-
-            result_data.append(row_data)
-
-    result_df = pd.DataFrame(result_data)
-    pivot_df = result_df.pivot_table(index='Row', columns='Quarter', values=['PVBE', 'RA'], aggfunc='sum', fill_value=0)
-    
-    if not pivot_df.empty:
-        new_columns = [(val, q_label) for q in quarters for val in ['PVBE', 'RA'] if (val, (q_label := quarter_mapping.get(q, str(q)))) in pivot_df.columns]
-        pivot_df = pivot_df[new_columns]
-        finance_rows = ['צבירת ריבית', 'שינוי בריבית שוטפת', 'אינפלציה']
-        closing_rows = ['יתרת פתיחה', 'עסק חדש', 'שחרור', 'תיאומים בהתאם לניסיון', 'שינוי הנחות', 'שינוי ל LRR', 'זקיפה לCSM', 'הוצאות מימון']
-        pivot_df.loc['יתרת סגירה ליום'] = pivot_df.loc[closing_rows].sum()
-
-        # --- NEW LOGIC FOR VALIDATION CHECK ---
-        check_values = {}
-        for q_label in pivot_df.columns.get_level_values('Quarter').unique():
-            original_quarter = next((q for q, label in quarter_mapping.items() if label == q_label), None)
-            if original_quarter:
-                # Get the actual closing balance from the source data for that quarter
-                actual_closing_pvbe = base_df[(base_df['Quarter'] == original_quarter) & base_df['IsQuarterEnd'] & (base_df['Component'] == 'PVBE')][amount_col].sum()
-                actual_closing_ra = base_df[(base_df['Quarter'] == original_quarter) & base_df['IsQuarterEnd'] & (base_df['Component'] == 'RA')][amount_col].sum()
-                
-                # Get the calculated closing balance from the pivot table
-                calculated_closing_pvbe = pivot_df.loc['יתרת סגירה ליום', ('PVBE', q_label)]
-                calculated_closing_ra = pivot_df.loc['יתרת סגירה ליום', ('RA', q_label)]
-
-                # The check is the difference, which should be zero
-                check_values[('PVBE', q_label)] = calculated_closing_pvbe - actual_closing_pvbe
-                check_values[('RA', q_label)] = calculated_closing_ra - actual_closing_ra
-        
-        pivot_df.loc['Check - תקין'] = pd.Series(check_values).fillna(0)
-        # --- END OF NEW LOGIC ---
+def write_pivot_to_sheet(writer, sheet_name, pivot_df, start_row, title, filters, title_color=None, start_col=1):
+    """Writes a styled pivot table with a title and filters to a specific location on a sheet."""
+    if title:
+        writer.write_title(sheet_name, start_row, start_col, title, fill_color=title_color)
+        start_row += 2
 
-        final_row_order = [spec['name'] for spec in row_specs]
-        pivot_df = pivot_df.reindex(final_row_order)
+    if filters:
+        start_row = writer.write_filters(sheet_name, start_row, start_col, filters)
 
-    pivot_df.index.name = None
-    table_positions[sheet_name].append((pivot_spec['title'], start_row))
-    display_filters = {'Data Source': 'Based on Filtered & CRE 6000 tables'}
-    return write_pivot_to_sheet(writer, sheet_name, pivot_df, start_row, pivot_spec['title'], display_filters) + 10
+    return writer.write_pivot(sheet_name, pivot_df, start_row + 2, start_col)
 
-def create_lic_cycle_table(writer, sheet_name, filtered_out_df, filtered_in_df, pivot_spec, start_row, all_cols, table_positions):
-    import pandas as pd
+def pivot_block_end_row(pivot_df, start_row, title, filters):
+    """Returns the last row write_pivot_to_sheet fills for a table starting at start_row, without writing it."""
+    row = start_row + (2 if title else 0)
+    if filters:
+        row += filter_block_rows(filters)[1]
+    return row + 2 + pivot_block_geometry(pivot_df)[0] + len(pivot_df) - 1
 
-    amount_col = all_cols['amount_col']
-    date_col = all_cols['date_col']
-    acc_change_col = all_cols['acc_change_col']
-    proc_step_col = all_cols['proc_step_col']
-
-    filtered_out_df['Component'] = 'PVBE'
-    filtered_in_df['Component'] = 'RA'
-    base_df = pd.concat([filtered_out_df, filtered_in_df])
-    
-    base_df[date_col] = pd.to_datetime(base_df[date_col], errors='coerce')
-    base_df['Quarter'] = base_df[date_col].dt.to_period('Q')
-    base_df['IsQuarterEnd'] = base_df[date_col].dt.is_quarter_end
-    base_df['IsQuarterStart'] = base_df[date_col].dt.is_quarter_start
-    
-    quarter_end_dates = base_df[base_df['IsQuarterEnd']][date_col].drop_duplicates().sort_values()
-    quarter_mapping = {date.to_period('Q'): date.strftime('%d/%m/%Y') for date in quarter_end_dates}
-    quarters = sorted(quarter_mapping.keys())
-    
-    row_specs = [
-        {'name': 'יתרת פתיחה', 'type': 'opening_balance'},
-        # Current Year Section
-        {'name': 'תביעות והוצאות שירותי ביטוח אחרות שהתהוו', 'type': 'claims_incurred_current'},
-        {'name': 'שחרור', 'type': 'acc_filter', 'acc_code': 405, 'date_filter': 'quarter_end'},
-        {'name': 'תיאומים בהתאם לניסיון', 'type': 'acc_filter', 'acc_code': 505, 'date_filter': 'quarter_end'},
-        {'name': 'שינוי הנחות', 'type': 'acc_filter', 'acc_code': 600, 'date_filter': 'quarter_end'},
-        # Previous Year Section
-        {'name': 'שינויים המתייחסים לשירותי עבר- תיאום להתחייבויות בגין תביעות שהתהוו', 'type': 'claims_incurred_past'},
-        {'name': 'שחרור', 'type': 'acc_filter', 'acc_code': 405, 'date_filter': 'quarter_end', 'year_type': 'previous'},
-        {'name': 'תיאומים בהתאם לניסיון', 'type': 'acc_filter', 'acc_code': 506, 'date_filter': 'quarter_end'},
-        {'name': 'שינוי הנחות', 'type': 'acc_filter', 'acc_code': 600, 'date_filter': 'quarter_end', 'year_type': 'previous'},
-        {'name': 'שינוי ל LRR', 'type': 'acc_filter', 'acc_code': 608, 'date_filter': 'quarter_end'},
-        {'name': 'הוצאות מימון', 'type': 'sum_finance'},
-        {'name': 'צבירת ריבית', 'type': 'acc_filter', 'acc_code': 200, 'date_filter': 'quarter_end'},
-        {'name': 'שינוי בריבית שוטפת', 'type': 'acc_filter', 'acc_code': 300, 'date_filter': 'quarter_end'},
-        {'name': 'אינפלציה', 'type': 'acc_filter', 'acc_code': 601, 'date_filter': 'quarter_end'},
-        {'name': 'יתרת סגירה ליום', 'type': 'sum_movements'},
-        {'name': 'Check - תקין', 'type': 'validation_check'}
-    ]
-    
-    result_data = []
-    for i, quarter in enumerate(quarters):
-        quarter_label = quarter_mapping.get(quarter, str(quarter))
-        for row_spec in row_specs:
-            row_data = {'Row': row_spec['name'], 'Quarter': quarter_label, 'PVBE': 0, 'RA': 0}
-            
-            if row_spec['type'] not in ['sum_finance', 'sum_movements', 'validation_check', 'claims_incurred_current', 'claims_incurred_past']:
-                df_slice = pd.DataFrame()
-                if row_spec['type'] == 'opening_balance':
-                    if i > 0:
-                        df_slice = base_df[(base_df['Quarter'] == quarters[i-1]) & base_df['IsQuarterEnd']]
-                    else:
-                        df_slice = base_df[(base_df['Quarter'] == quarter) & base_df['IsQuarterStart']]
-                elif row_spec['type'] == 'acc_filter':
-                    df_slice = base_df[base_df[acc_change_col] == row_spec['acc_code']]
-                    date_filter = row_spec['date_filter']
-                    
-                    # Handle current vs previous year logic
-                    if row_spec.get('year_type') == 'previous':
-                        if i > 0:
-                            target_quarter = quarters[i-1]
-                        else:
-                            target_quarter = quarter  # fallback for first quarter
-                    else:
-                        target_quarter = quarter
-                    
-                    if date_filter == 'quarter_end':
-                        df_slice = df_slice[df_slice['IsQuarterEnd'] & (df_slice['Quarter'] == target_quarter)]
-                    elif date_filter == 'quarter_start':
-                        df_slice = df_slice[df_slice['IsQuarterStart'] & (df_slice['Quarter'] == target_quarter)]
-                
-                if not df_slice.empty:
-                    row_data['PVBE'] = df_slice[df_slice['Component'] == 'PVBE'][amount_col].sum()
-                    row_data['RA'] = df_slice[df_slice['Component'] == 'RA'][amount_col].sum()
-            
-            elif row_spec['type'] == 'claims_incurred_current':
-                # Sum of current year: שחרור + תיאומים בהתאם לניסיון + שינוי הנחות
-                release_current = base_df[(base_df[acc_change_col] == 405) & base_df['IsQuarterEnd'] & (base_df['Quarter'] == quarter)]
-                experience_current = base_df[(base_df[acc_change_col] == 505) & base_df['IsQuarterEnd'] & (base_df['Quarter'] == quarter)]
-                discount_current = base_df[(base_df[acc_change_col] == 600) & base_df['IsQuarterEnd'] & (base_df['Quarter'] == quarter)]
-                
-                row_data['PVBE'] = (release_current[release_current['Component'] == 'PVBE'][amount_col].sum() + 
-                                   experience_current[experience_current['Component'] == 'PVBE'][amount_col].sum() + 
-                                   discount_current[discount_current['Component'] == 'PVBE'][amount_col].sum())
-                row_data['RA'] = (release_current[release_current['Component'] == 'RA'][amount_col].sum() + 
-                                 experience_current[experience_current['Component'] == 'RA'][amount_col].sum() + 
-                                 discount_current[discount_current['Component'] == 'RA'][amount_col].sum())
-            
-            elif row_spec['type'] == 'claims_incurred_past':
-                # Sum of previous year: שחרור + תיאומים בהתאם לניסיון + שינוי הנחות
-                if i > 0:
-                    prev_quarter = quarters[i-1]
-                    release_past = base_df[(base_df[acc_change_col] == 405) & base_df['IsQuarterEnd'] & (base_df['Quarter'] == prev_quarter)]
-                    experience_past = base_df[(base_df[acc_change_col] == 506) & base_df['IsQuarterEnd'] & (base_df['Quarter'] == prev_quarter)]
-                    discount_past = base_df[(base_df[acc_change_col] == 600) & base_df['IsQuarterEnd'] & (base_df['Quarter'] == prev_quarter)]
-                    
-                    row_data['PVBE'] = (release_past[release_past['Component'] == 'PVBE'][amount_col].sum() + 
-                                       experience_past[experience_past['Component'] == 'PVBE'][amount_col].sum() + 
-                                       discount_past[discount_past['Component'] == 'PVBE'][amount_col].sum())
-                    row_data['RA'] = (release_past[release_past['Component'] == 'RA'][amount_col].sum() + 
-                                     experience_past[experience_past['Component'] == 'RA'][amount_col].sum() + 
-                                     discount_past[discount_past['Component'] == 'RA'][amount_col].sum())
-
-            result_data.append(row_data)
-
-    result_df = pd.DataFrame(result_data)
-    pivot_df = result_df.pivot_table(index='Row', columns='Quarter', values=['PVBE', 'RA'], aggfunc='sum', fill_value=0)
-    
-    if not pivot_df.empty:
-        new_columns = [(val, q_label) for q in quarters for val in ['PVBE', 'RA'] if (val, (q_label := quarter_mapping.get(q, str(q)))) in pivot_df.columns]
-        pivot_df = pivot_df[new_columns]
-        
-        # Calculate finance expenses sum
-        finance_rows = ['צבירת ריבית', 'שינוי בריבית שוטפת', 'אינפלציה']
-        pivot_df.loc['הוצאות מימון'] = pivot_df.loc[finance_rows].sum()
-        
-        # Calculate closing balance sum
-        closing_rows = ['יתרת פתיחה', 'תביעות והוצאות שירותי ביטוח אחרות שהתהוו', 'שחרור', 'תיאומים בהתאם לניסיון', 'שינוי הנחות', 
-                       'שינויים המתייחסים לשירותי עבר- תיאום להתחייבויות בגין תביעות שהתהוו', 'שינוי ל LRR', 'הוצאות מימון']
-        pivot_df.loc['יתרת סגירה ליום'] = pivot_df.loc[closing_rows].sum()
-        
-        # Calculate validation check (closing balance - sum of movements)
-        validation_rows = [
-            'יתרת פתיחה', 'תביעות והוצאות שירותי ביטוח אחרות שהתהוו', 'שחרור', 
-            'תיאומים בהתאם לניסיון', 'שינוי הנחות', 
-            'שינויים המתייחסים לשירותי עבר- תיאום להתחייבויות בגין תביעות שהתהוו', 
-            'שינוי ל LRR', 'הוצאות מימון'
-        ]
-        movements_sum = pivot_df.loc[validation_rows].sum()
-        pivot_df.loc['Check - תקין'] = movements_sum - pivot_df.loc['יתרת סגירה ליום']
-        
-        final_row_order = [spec['name'] for spec in row_specs]
-        pivot_df = pivot_df.reindex(final_row_order)
+# Process steps the cycle rules single out, matched as literal substrings. A step's code is its
+# position in this table plus one; 0 means it matches none of them.
+PROCESS_STEP_CLASSES = [
+    ('recognize_profit_period_start', 'Recognize Profit (Prd Start - Bef. Chge)'),
+    ('recognize_profit_before_change', 'Recognize Profit (PE/DE Before Change)'),
+    ('allocate_period_start', 'Allocate (Disclosure)(Per.St.- Aft.Chg.)'),
+    ('allocate_after_change', 'Allocate (Disclosure) (PE After Change)'),
+]
+PROCESS_STEP_CODES = {name: code for code, (name, _) in enumerate(PROCESS_STEP_CLASSES, start=1)}
 
-    pivot_df.index.name = None
-    table_positions[sheet_name].append((pivot_spec['title'], start_row))
-    display_filters = {'Data Source': 'Based on Filtered Out & Filtered In tables'}
-    return write_pivot_to_sheet(writer, sheet_name, pivot_df, start_row, pivot_spec['title'], display_filters) + 10
+def classify_process_steps(series):
+    """Returns the PROCESS_STEP_CLASSES code of every row as int8, matching each distinct step once."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    steps = pd.Series(uniques, dtype=object)
+    # trailing slot stays 0 for missing steps (code -1)
+    classes = np.zeros(len(steps) + 1, dtype=np.int8)
+    for code, (_, pattern) in enumerate(PROCESS_STEP_CLASSES, start=1):
+        matched = steps.str.contains(pattern, regex=False, na=False).to_numpy(dtype=bool)
+        classes[:-1][matched & (classes[:-1] == 0)] = code
+    return classes[codes]
 
-def create_csm_cycle_table(writer, sheet_name, csm_df, fv_df, pivot_spec, start_row, all_cols, table_positions):
-    import pandas as pd
+# Cycle table rows. A row's value per quarter and component is the sum of its 'terms' cells, plus
+# the 'sum_of' rows, minus the 'less_rows' rows. A term selects the amounts
+# posted on the quarter's first ('start') or last ('end') day, optionally narrowed to one
+# accounting change ('acc'), component and PROCESS_STEP_CLASSES entry ('step'); 'offset': -1 reads the
+# previous reported quarter instead. 'first' replaces 'terms' for the first quarter and
+# 'components' limits which columns the row fills. Rows sharing a name are summed together.
+LRC_CYCLE_ROWS = [
+    {'name': 'יתרת פתיחה', 'terms': [{'at': 'end', 'offset': -1}], 'first': [{'at': 'start'}]},
+    {'name': 'עסק חדש', 'terms': [{'acc': 100, 'at': 'start'}]},
+    {'name': 'שחרור', 'terms': [{'acc': 405, 'at': 'end'}]},
+    {'name': 'תיאומים בהתאם לניסיון', 'terms': [{'acc': 505, 'at': 'end'}], 'components': ['PVBE']},
+    {'name': 'שינוי הנחות', 'terms': [{'acc': 600, 'at': 'end'}]},
+    {'name': 'שינוי ל LRR'},
+    {'name': 'זקיפה לCSM',
+     'first': [
+         {'component': 'PVBE', 'step': 'recognize_profit_period_start', 'acc': 801, 'at': 'start'},
+         {'component': 'PVBE', 'step': 'allocate_after_change', 'acc': 620, 'at': 'end'},
+         {'component': 'PVBE', 'step': 'recognize_profit_before_change', 'acc': 410, 'at': 'end'},
+         {'component': 'RA', 'step': 'allocate_period_start', 'acc': 120, 'at': 'start'},
+         {'component': 'RA', 'step': 'allocate_after_change', 'acc': 620, 'at': 'end'},
+     ],
+     'terms': [
+         {'component': 'PVBE', 'step': 'allocate_period_start', 'acc': 120, 'at': 'start'},
+         {'component': 'RA', 'step': 'allocate_period_start', 'acc': 120, 'at': 'start'},
+         {'component': 'RA', 'step': 'allocate_after_change', 'acc': 620, 'at': 'end'},
+     ]},
+    {'name': 'הוצאות מימון', 'sum_of': ['צבירת ריבית', 'שינוי בריבית שוטפת', 'אינפלציה']},
+    {'name': 'צבירת ריבית', 'terms': [{'acc': 200, 'at': 'end'}]},
+    {'name': 'שינוי בריבית שוטפת', 'terms': [{'acc': 300, 'at': 'end'}]},
+    {'name': 'אינפלציה', 'terms': [{'acc': 601, 'at': 'end'}]},
+    {'name': 'יתרת סגירה ליום', 'sum_of': ['יתרת פתיחה', 'עסק חדש', 'שחרור', 'תיאומים בהתאם לניסיון', 'שינוי הנחות', 'שינוי ל LRR', 'זקיפה לCSM', 'הוצאות מימון']},
+    {'name': 'Check - תקין'},
+]
 
-    amount_col = all_cols['amount_col']
-    date_col = all_cols['date_col']
-    acc_change_col = all_cols['acc_change_col']
-    proc_step_col = all_cols['proc_step_col']
-
-    # Use only CSM data for the cycle (as per user instruction to disregard F.V for columns)
-    base_df = csm_df.copy()
-    base_df['Component'] = 'CSM'
-    
-    base_df[date_col] = pd.to_datetime(base_df[date_col], errors='coerce')
-    base_df['Quarter'] = base_df[date_col].dt.to_period('Q')
-    base_df['IsQuarterEnd'] = base_df[date_col].dt.is_quarter_end
-    base_df['IsQuarterStart'] = base_df[date_col].dt.is_quarter_start
-    
-    quarter_end_dates = base_df[base_df['IsQuarterEnd']][date_col].drop_duplicates().sort_values()
-    quarter_mapping = {date.to_period('Q'): date.strftime('%d/%m/%Y') for date in quarter_end_dates}
-    quarters = sorted(quarter_mapping.keys())
-    
-    row_specs = [
-        {'name': 'יתרת פתיחה', 'type': 'opening_balance'},
-        {'name': 'תיאומים בהתאם לניסיון', 'type': 'acc_filter', 'acc_code': 505, 'date_filter': 'quarter_end'},
-        {'name': 'שינוי הנחות', 'type': 'acc_filter', 'acc_code': 600, 'date_filter': 'quarter_end'},
-        {'name': 'הוצאות מימון', 'type': 'sum_finance'},
-        {'name': 'צבירת ריבית', 'type': 'acc_filter', 'acc_code': 200, 'date_filter': 'quarter_end'},
-        {'name': 'שינוי בריבית שוטפת', 'type': 'acc_filter', 'acc_code': 300, 'date_filter': 'quarter_end'},
-        {'name': 'אינפלציה', 'type': 'acc_filter', 'acc_code': 601, 'date_filter': 'quarter_end'},
-        {'name': 'CSM', 'type': 'acc_filter', 'acc_code': 410, 'date_filter': 'quarter_end'},
-        {'name': 'יתרת סגירה ליום', 'type': 'sum_movements'},
-        {'name': 'Check - תקין', 'type': 'validation_check'}
-    ]
-    
-    result_data = []
-    for i, quarter in enumerate(quarters):
-        quarter_label = quarter_mapping.get(quarter, str(quarter))
-        for row_spec in row_specs:
-            row_data = {'Row': row_spec['name'], 'Quarter': quarter_label, 'CSM': 0}
-            if row_spec['type'] not in ['sum_finance', 'sum_movements', 'validation_check']:
-                df_slice = pd.DataFrame()
-                if row_spec['type'] == 'opening_balance':
-                    if i > 0:
-                        df_slice = base_df[(base_df['Quarter'] == quarters[i-1]) & base_df['IsQuarterEnd']]
-                    else:
-                        df_slice = base_df[(base_df['Quarter'] == quarter) & base_df['IsQuarterStart']]
-                elif row_spec['type'] == 'acc_filter':
-                    df_slice = base_df[base_df[acc_change_col] == row_spec['acc_code']]
-                    date_filter = row_spec['date_filter']
-                    if date_filter == 'quarter_end':
-                        df_slice = df_slice[df_slice['IsQuarterEnd'] & (df_slice['Quarter'] == quarter)]
-                    elif date_filter == 'quarter_start':
-                        df_slice = df_slice[df_slice['IsQuarterStart'] & (df_slice['Quarter'] == quarter)]
-                
-                if not df_slice.empty:
-                    row_data['CSM'] = df_slice[amount_col].sum()
-
-            result_data.append(row_data)
-
-    result_df = pd.DataFrame(result_data)
-    pivot_df = result_df.pivot_table(index='Row', columns='Quarter', values=['CSM'], aggfunc='sum', fill_value=0)
-    
-    if not pivot_df.empty:
-        new_columns = [('CSM', q_label) for q in quarters if ('CSM', (q_label := quarter_mapping.get(q, str(q)))) in pivot_df.columns]
-        pivot_df = pivot_df[new_columns]
-        
-        # Calculate finance expenses sum
-        finance_rows = ['צבירת ריבית', 'שינוי בריבית שוטפת', 'אינפלציה']
-        pivot_df.loc['הוצאות מימון'] = pivot_df.loc[finance_rows].sum()
-        
-        # Calculate closing balance sum
-        closing_rows = ['יתרת פתיחה', 'תיאומים בהתאם לניסיון', 'שינוי הנחות', 'הוצאות מימון', 'CSM']
-        pivot_df.loc['יתרת סגירה ליום'] = pivot_df.loc[closing_rows].sum()
-        
-        final_row_order = [spec['name'] for spec in row_specs]
-        pivot_df = pivot_df.reindex(final_row_order)
+LIC_MOVEMENT_ROWS = ['יתרת פתיחה', 'תביעות והוצאות שירותי ביטוח אחרות שהתהוו', 'שחרור', 'תיאומים בהתאם לניסיון', 'שינוי הנחות',
+                     'שינויים המתייחסים לשירותי עבר- תיאום להתחייבויות בגין תביעות שהתהוו', 'שינוי ל LRR', 'הוצאות מימון']
+
+LIC_CYCLE_ROWS = [
+    {'name': 'יתרת פתיחה', 'terms': [{'at': 'end', 'offset': -1}], 'first': [{'at': 'start'}]},
+    # Current Year Section
+    {'name': 'תביעות והוצאות שירותי ביטוח אחרות שהתהוו', 'terms': [{'acc': 405, 'at': 'end'}, {'acc': 505, 'at': 'end'}, {'acc': 600, 'at': 'end'}]},
+    {'name': 'שחרור', 'terms': [{'acc': 405, 'at': 'end'}]},
+    {'name': 'תיאומים בהתאם לניסיון', 'terms': [{'acc': 505, 'at': 'end'}]},
+    {'name': 'שינוי הנחות', 'terms': [{'acc': 600, 'at': 'end'}]},
+    # Previous Year Section
+    {'name': 'שינויים המתייחסים לשירותי עבר- תיאום להתחייבויות בגין תביעות שהתהוו',
+     'terms': [{'acc': 405, 'at': 'end', 'offset': -1}, {'acc': 506, 'at': 'end', 'offset': -1}, {'acc': 600, 'at': 'end', 'offset': -1}], 'first': []},
+    {'name': 'שחרור', 'terms': [{'acc': 405, 'at': 'end', 'offset': -1}], 'first': [{'acc': 405, 'at': 'end'}]},
+    {'name': 'תיאומים בהתאם לניסיון', 'terms': [{'acc': 506, 'at': 'end'}]},
+    {'name': 'שינוי הנחות', 'terms': [{'acc': 600, 'at': 'end', 'offset': -1}], 'first': [{'acc': 600, 'at': 'end'}]},
+    {'name': 'שינוי ל LRR', 'terms': [{'acc': 608, 'at': 'end'}]},
+    {'name': 'הוצאות מימון', 'sum_of': ['צבירת ריבית', 'שינוי בריבית שוטפת', 'אינפלציה']},
+    {'name': 'צבירת ריבית', 'terms': [{'acc': 200, 'at': 'end'}]},
+    {'name': 'שינוי בריבית שוטפת', 'terms': [{'acc': 300, 'at': 'end'}]},
+    {'name': 'אינפלציה', 'terms': [{'acc': 601, 'at': 'end'}]},
+    {'name': 'יתרת סגירה ליום', 'sum_of': LIC_MOVEMENT_ROWS},
+    {'name': 'Check - תקין', 'sum_of': LIC_MOVEMENT_ROWS, 'less_rows': ['יתרת סגירה ליום']},
+]
+
+CSM_CYCLE_ROWS = [
+    {'name': 'יתרת פתיחה', 'terms': [{'at': 'end', 'offset': -1}], 'first': [{'at': 'start'}]},
+    {'name': 'תיאומים בהתאם לניסיון', 'terms': [{'acc': 505, 'at': 'end'}]},
+    {'name': 'שינוי הנחות', 'terms': [{'acc': 600, 'at': 'end'}]},
+    {'name': 'הוצאות מימון', 'sum_of': ['צבירת ריבית', 'שינוי בריבית שוטפת', 'אינפלציה']},
+    {'name': 'צבירת ריבית', 'terms': [{'acc': 200, 'at': 'end'}]},
+    {'name': 'שינוי בריבית שוטפת', 'terms': [{'acc': 300, 'at': 'end'}]},
+    {'name': 'אינפלציה', 'terms': [{'acc': 601, 'at': 'end'}]},
+    {'name': 'CSM', 'terms': [{'acc': 410, 'at': 'end'}]},
+    {'name': 'יתרת סגירה ליום', 'sum_of': ['יתרת פתיחה', 'תיאומים בהתאם לניסיון', 'שינוי הנחות', 'הוצאות מימון', 'CSM']},
+    {'name': 'Check - תקין'},
+]
+
+def cycle_history_input_dir(history_dir, file_path):
+    """Returns the subfolder of history_dir that keeps one input file's cycle history, so inputs never share quarters."""
+    path = os.path.abspath(file_path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(history_dir, f"{stem}_{hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]}")
+
+def cycle_history_paths(history_dir, history_key):
+    """Returns the (cells, fingerprints) file paths of one cycle table's stored history."""
+    name = hashlib.sha1(history_key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(history_dir, f"cycle_{name}.parquet"), os.path.join(history_dir, f"cycle_{name}.json")
+
+def load_cycle_history(history_dir, history_key):
+    """Loads the stored cells and per-quarter fingerprints of a cycle table, or (None, {}) when there are none."""
+    cells_path, fingerprints_path = cycle_history_paths(history_dir, history_key)
+    try:
+        with open(fingerprints_path, encoding='utf-8') as f:
+            stored = json.load(f)
+        if stored.get('version') != CYCLE_HISTORY_VERSION or stored.get('key') != history_key:
+            return None, {}
+        cells = pd.read_parquet(cells_path)
+        cells['quarter'] = pd.PeriodIndex(cells['quarter'], freq='Q').to_numpy()
+        return cells, stored['fingerprints']
+    except FileNotFoundError:
+        return None, {}
+    except Exception as e:
+        print(f"Ignoring unreadable cycle history for '{history_key}': {e}")
+        return None, {}
+
+def save_cycle_history(history_dir, history_key, cells, fingerprints):
+    """Stores a cycle table's cells and fingerprints, replacing both files atomically."""
+    os.makedirs(history_dir, exist_ok=True)
+    cells_path, fingerprints_path = cycle_history_paths(history_dir, history_key)
+    stored = cells.assign(quarter=cells['quarter'].astype(str))
+    stored.to_parquet(f"{cells_path}.{os.getpid()}.tmp", index=False)
+    os.replace(f"{cells_path}.{os.getpid()}.tmp", cells_path)
+    with open(f"{fingerprints_path}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'version': CYCLE_HISTORY_VERSION, 'key': history_key, 'fingerprints': fingerprints}, f, ensure_ascii=False, indent=1)
+    os.replace(f"{fingerprints_path}.{os.getpid()}.tmp", fingerprints_path)
+
+def cycle_cells(frames, all_cols, history_dir=None, history_key=None, coverage_col=None):
+    """Sums each component frame's amounts per quarter-edge posting day, accounting change and process step class.
+
+    history_dir (one input's, see cycle_history_input_dir) reuses the stored cells of unchanged quarters;
+    coverage_col also splits the cells by that column, and its history is kept apart from the unsplit one."""
+    amount_col, date_col = all_cols['amount_col'], all_cols['date_col']
+    acc_change_col, proc_step_col = all_cols['acc_change_col'], all_cols['proc_step_col']
+    if history_dir and coverage_col:
+        history_key = f"{history_key}|{coverage_col}"
+    stored_cells, stored_fingerprints = load_cycle_history(history_dir, history_key) if history_dir else (None, {})
+    parts, fingerprints, reused = [], {}, []
+    for component, frame in frames.items():
+        codes, calendar = posting_calendar(frame[date_col])
+        keep = calendar['at'].to_numpy()[codes] != ''
+        if coverage_col:
+            coverages = frame[coverage_col].astype('category')
+            coverage_codes = coverages.cat.codes.to_numpy()
+            keep &= coverage_codes >= 0
+        codes = codes[keep]
+        if coverage_col:
+            coverage_codes = coverage_codes[keep]
+        accs = frame[acc_change_col].to_numpy()[keep]
+        steps = classify_process_steps(frame[proc_step_col])[keep]
+        amounts = frame[amount_col].to_numpy()[keep]
+        if history_dir:
+            quarters = calendar['quarter'].array.asi8[codes]
+            hashed = {'date': calendar['day'].array.asi8[codes], 'acc': accs, 'step': steps, 'amount': amounts}
+            if coverage_col:
+                # a row moving to another coverage changes its quarter's cells
+                hashed['coverage'] = coverages.cat.categories.take(coverage_codes)
+            row_hashes = pd.util.hash_pandas_object(pd.DataFrame(hashed), index=False)
+            # order-independent fingerprint: row count and wrapping uint64 sum of the row hashes
+            order = np.argsort(quarters, kind='stable')
+            ordinals, starts = np.unique(quarters[order], return_index=True)
+            totals = np.add.reduceat(row_hashes.to_numpy()[order], starts) if len(order) else []
+            sizes = np.diff(np.append(starts, len(order)))
+            changed = []
+            for ordinal, size, total in zip(ordinals, sizes, totals):
+                label = f"{component}|{pd.Period(ordinal=ordinal, freq='Q')}"
+                fingerprints[label] = [int(size), str(total)]
+                if stored_fingerprints.get(label) != fingerprints[label]:
+                    changed.append(ordinal)
+            selected = np.isin(quarters, changed)
+            codes, accs, steps, amounts = codes[selected], accs[selected], steps[selected], amounts[selected]
+            if coverage_col:
+                coverage_codes = coverage_codes[selected]
+            if stored_cells is not None:
+                unchanged = [label for label in stored_fingerprints if label.startswith(f"{component}|")
+                             and (label not in fingerprints or fingerprints[label] == stored_fingerprints[label])]
+                for label in unchanged:
+                    fingerprints[label] = stored_fingerprints[label]
+                stored_quarters = {pd.Period(label.split('|', 1)[1], freq='Q') for label in unchanged}
+                component_cells = stored_cells[stored_cells['component'] == component]
+                reused.append(component_cells[component_cells['quarter'].isin(stored_quarters)])
+        keys, names = [codes, accs, steps], ['date', 'acc', 'step']
+        if coverage_col:
+            keys.append(coverage_codes)
+            names.append('coverage')
+        sums = pd.Series(amounts, name='amount').groupby(keys).sum()
+        part = sums.rename_axis(names).reset_index()
+        if coverage_col:
+            part['coverage'] = coverages.cat.categories.take(part['coverage'].to_numpy())
+        part.insert(0, 'component', component)
+        # map the date codes to their day and quarter on the aggregate, not per row
+        date_codes = part['date'].to_numpy()
+        part['date'] = calendar['day'].to_numpy()[date_codes]
+        part['quarter'] = calendar['quarter'].to_numpy()[date_codes]
+        part['at'] = calendar['at'].to_numpy()[date_codes]
+        parts.append(part)
+    cells = pd.concat(parts + reused, ignore_index=True)
+    if history_dir:
+        save_cycle_history(history_dir, history_key, cells, fingerprints)
+    return cells
+
+def build_cycle_table(frames, row_specs, all_cols, history_dir=None, history_key=None):
+    """Builds a cycle table (rows x (component, quarter end)) from row_specs with one pass over the data."""
+    return cycle_table_from_cells(cycle_cells(frames, all_cols, history_dir, history_key), list(frames), row_specs)
+
+def cycle_table_from_cells(cells, components, row_specs, quarters=None):
+    """Lays a cycle table out from cycle_cells output; quarters defaults to the quarters the cells close."""
+    if quarters is None:
+        quarters = sorted(cells.loc[cells['at'] == 'end', 'quarter'].unique())
+    labels = [quarter.end_time.strftime('%d/%m/%Y') for quarter in quarters]
+    position = {quarter: i for i, quarter in enumerate(quarters)}
+    columns = [(component, i) for i in range(len(quarters)) for component in components]
+
+    def term_values(term):
+        selected = cells['at'] == term['at']
+        if 'acc' in term:
+            selected &= cells['acc'] == term['acc']
+        if 'component' in term:
+            selected &= cells['component'] == term['component']
+        if 'step' in term:
+            selected &= cells['step'] == PROCESS_STEP_CODES[term['step']]
+        sums = cells[selected].groupby(['component', 'quarter'])['amount'].sum()
+        values = pd.Series(0.0, index=pd.MultiIndex.from_tuples(columns))
+        for (component, quarter), amount in sums.items():
+            i = position.get(quarter)
+            target = None if i is None else i - term.get('offset', 0)
+            if target is not None and 0 <= target < len(quarters):
+                values[(component, target)] += amount
+        return values
+
+    term_cache = {}
+    def terms_total(terms):
+        total = pd.Series(0.0, index=pd.MultiIndex.from_tuples(columns))
+        for term in terms:
+            key = tuple(sorted(term.items()))
+            if key not in term_cache:
+                term_cache[key] = term_values(term)
+            total += term_cache[key]
+        return total
+
+    values = {}
+    first_quarter = np.array([i == 0 for _, i in columns])
+    for spec in row_specs:
+        if 'sum_of' in spec or 'less_rows' in spec:
+            continue
+        row = terms_total(spec.get('terms', [])).where(~first_quarter, terms_total(spec.get('first', spec.get('terms', []))))
+        if 'components' in spec:
+            row[~row.index.get_level_values(0).isin(spec['components'])] = 0.0
+        values[spec['name']] = values[spec['name']] + row if spec['name'] in values else row
+    for spec in row_specs:
+        if 'sum_of' not in spec and 'less_rows' not in spec:
+            continue
+        row = sum((values[name] for name in spec.get('sum_of', [])), pd.Series(0.0, index=pd.MultiIndex.from_tuples(columns)))
+        row -= sum((values[name] for name in spec.get('less_rows', [])), pd.Series(0.0, index=row.index))
+        values[spec['name']] = row
+
+    names = [spec['name'] for spec in row_specs]
+    pivot_df = pd.DataFrame([values[name].to_numpy() for name in names], index=names,
+                            columns=pd.MultiIndex.from_tuples([(component, labels[i]) for component, i in columns], names=[None, 'Quarter']))
+    return pivot_df
+
+# Components, rows and displayed source of each cycle table type. The cycle's source frames (see
+# cycle_inputs) feed its components in order; the CSM cycle disregards the F.V frame.
+CYCLE_TABLE_LAYOUTS = {
+    'custom_lrc_cycle': {'components': ['PVBE', 'RA'], 'rows': LRC_CYCLE_ROWS, 'source': 'Based on Filtered & CRE 6000 tables'},
+    'custom_lic_cycle': {'components': ['PVBE', 'RA'], 'rows': LIC_CYCLE_ROWS, 'source': 'Based on Filtered Out & Filtered In tables'},
+    'custom_csm_cycle': {'components': ['CSM'], 'rows': CSM_CYCLE_ROWS, 'source': 'Based on מעגל CSM table'},
+}
+
+def create_cycle_table(cycle_type, frames, pivot_spec, all_cols, cycle_history_dir=None):
+    layout = CYCLE_TABLE_LAYOUTS[cycle_type]
+    pivot_df = build_cycle_table(dict(zip(layout['components'], frames)), layout['rows'], all_cols, cycle_history_dir, pivot_spec['title'])
+    return {'title': pivot_spec['title'], 'pivot_df': pivot_df, 'filters': {'Data Source': layout['source']}}
+
+def create_lrc_cycle_table(pvbe_df, ra_df, pivot_spec, all_cols, cycle_history_dir=None):
+    return create_cycle_table('custom_lrc_cycle', (pvbe_df, ra_df), pivot_spec, all_cols, cycle_history_dir)
+
+def create_lic_cycle_table(filtered_out_df, filtered_in_df, pivot_spec, all_cols, cycle_history_dir=None):
+    return create_cycle_table('custom_lic_cycle', (filtered_out_df, filtered_in_df), pivot_spec, all_cols, cycle_history_dir)
+
+def create_csm_cycle_table(csm_df, fv_df, pivot_spec, all_cols, cycle_history_dir=None):
+    return create_cycle_table('custom_csm_cycle', (csm_df, fv_df), pivot_spec, all_cols, cycle_history_dir)
 
-    pivot_df.index.name = None
-    table_positions[sheet_name].append((pivot_spec['title'], start_row))
-    display_filters = {'Data Source': 'Based on מעגל CSM table'}
-    return write_pivot_to_sheet(writer, sheet_name, pivot_df, start_row, pivot_spec['title'], display_filters) + 10
+def coverage_cycle_table(cells, components, row_specs, quarters=None):
+    """Computes each Coverage ID's cycle rows per component and quarter, with the closing balance in the data and the roll-forward gap."""
+    if quarters is None:
+        quarters = sorted(cells.loc[cells['at'] == 'end', 'quarter'].unique())
+    n_quarters, n_components = len(quarters), len(components)
+    coverages = cells['coverage'].astype('category')
+    position = pd.Index(quarters).get_indexer(cells['quarter'])
+    component = pd.Index(components).get_indexer(cells['component'])
+    base = (coverages.cat.codes.to_numpy().astype(np.int64) * n_components + component) * n_quarters
+    amounts = cells['amount'].to_numpy()
+    at, acc, step = cells['at'].to_numpy(), cells['acc'].to_numpy(), cells['step'].to_numpy()
+    empty = pd.Series(dtype=float)
+
+    term_cache = {}
+    def term_values(term):
+        key = tuple(sorted(term.items()))
+        if key not in term_cache:
+            target = position - term.get('offset', 0)
+            selected = (at == term['at']) & (position >= 0) & (component >= 0) & (target >= 0) & (target < n_quarters)
+            if 'acc' in term:
+                selected &= acc == term['acc']
+            if 'component' in term:
+                selected &= component == (components.index(term['component']) if term['component'] in components else -1)
+            if 'step' in term:
+                selected &= step == PROCESS_STEP_CODES[term['step']]
+            term_cache[key] = pd.Series(amounts[selected]).groupby(base[selected] + target[selected]).sum()
+        return term_cache[key]
+
+    def added(series_list):
+        series_list = [series for series in series_list if len(series)]
+        return pd.concat(series_list).groupby(level=0).sum() if series_list else empty
+
+    values = {}
+    for spec in row_specs:
+        if 'sum_of' in spec or 'less_rows' in spec:
+            continue
+        later = added([term_values(term) for term in spec.get('terms', [])])
+        first = added([term_values(term) for term in spec.get('first', spec.get('terms', []))])
+        row = added([later[later.index % n_quarters != 0], first[first.index % n_quarters == 0]])
+        if 'components' in spec:
+            allowed = [components.index(name) for name in spec['components'] if name in components]
+            row = row[np.isin(row.index // n_quarters % n_components, allowed)]
+        values[spec['name']] = added([values[spec['name']], row]) if spec['name'] in values else row
+    for spec in row_specs:
+        if 'sum_of' not in spec and 'less_rows' not in spec:
+            continue
+        less = [-values[name] for name in spec.get('less_rows', [])]
+        values[spec['name']] = added([values[name] for name in spec.get('sum_of', [])] + less)
+
+    values['Closing balance per data'] = term_values({'at': 'end'})
+    values['Roll-forward gap'] = added([values['יתרת סגירה ליום'], -values['Closing balance per data']])
+    table = pd.DataFrame(values).fillna(0.0)
+    keys = table.index.to_numpy()
+    labels = np.array([quarter.end_time.strftime('%d/%m/%Y') for quarter in quarters], dtype=object)
+    table.index = pd.MultiIndex.from_arrays([
+        coverages.cat.categories.take(keys // n_quarters // n_components),
+        np.array(components, dtype=object)[keys // n_quarters % n_components],
+        labels[keys % n_quarters],
+    ], names=['Coverage ID', 'Component', 'Quarter'])
+    return table
+
+def coverage_check_table(cycle_type, frames, pivot_spec, all_cols, tolerance=EXCEPTIONS_TOLERANCE, max_rows=COVERAGE_CHECK_MAX_ROWS):
+    """Returns the table dict of the Coverage IDs whose roll-forward gap is beyond tolerance, largest first (at most max_rows)."""
+    cells = cycle_cells(dict(zip(CYCLE_TABLE_LAYOUTS[cycle_type]['components'], frames)), all_cols, coverage_col=all_cols['coverage_id_col'])
+    return coverage_check_from_cells(cycle_type, cells, pivot_spec, tolerance, max_rows)
+
+def coverage_check_from_cells(cycle_type, cells, pivot_spec, tolerance=EXCEPTIONS_TOLERANCE, max_rows=COVERAGE_CHECK_MAX_ROWS):
+    """coverage_check_table from the cycle's cycle_cells(..., coverage_col=...) output, which may be merged partial cells."""
+    layout = CYCLE_TABLE_LAYOUTS[cycle_type]
+    table = coverage_cycle_table(cells, layout['components'], layout['rows'])
+    gap = table['Roll-forward gap'].abs()
+    failing = table[gap > tolerance].iloc[np.argsort(-gap[gap > tolerance].to_numpy(), kind='stable')]
+    n_coverages = failing.index.get_level_values('Coverage ID').nunique()
+    filters = {'Data Source': layout['source'],
+               'Rows shown': f"Coverage ID x component x quarter rows with a roll-forward gap beyond ±{tolerance:g}, largest first",
+               'Coverages failing': f"{n_coverages} of {table.index.get_level_values('Coverage ID').nunique()}"}
+    if len(failing) > max_rows:
+        filters['Rows shown'] += f" (first {max_rows} of {len(failing)})"
+    return {'title': f"{pivot_spec['title']} - Coverage ID check", 'pivot_df': failing.iloc[:max_rows], 'filters': filters}
+
+def distinct_value_mask(series, predicate):
+    """Evaluates predicate once per distinct value of series (missing values included) and maps the result back to its rows."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        uniques = series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=uniques.dtype)
+    lookup = pd.Series(predicate(uniques)).fillna(False).to_numpy(dtype=bool)
+    missing_result = False
+    if (codes < 0).any():
+        missing = pd.Series([np.nan], dtype=uniques.dtype)
+        missing_result = bool(pd.Series(predicate(missing)).fillna(False).iloc[0])
+    # code -1 (missing) picks the trailing NaN result
+    return np.append(lookup, missing_result)[codes]
+
+def _freeze(values):
+    """Turns a filter value into a hashable key component."""
+    if isinstance(values, (list, tuple, set)):
+        return tuple(values)
+    return values
+
+def compile_filter(col_name, values, spec):
+    """Compiles one 'filters' entry into (key, predicate, display_label, display_value); specs sharing a key share its mask."""
+    if col_name == 'gl_col' and spec.get('gl_col_filter') == 'regex':
+        return (col_name, 'match', values), lambda s: s.astype(str).str.match(values), f"{col_name} (Starts With)", "1 or 2"
+    if spec.get(f'{col_name}_filter') == 'startswith':
+        # Ensure the column is string type for .str accessor
+        prefixes = tuple(values)
+        return (col_name, 'startswith', prefixes), lambda s: s.astype(str).str.startswith(prefixes), f"{col_name} (Starts With)", values
+    if col_name == 'sub_acc_col':
+        return (col_name, 'startswith', _freeze(values)), lambda s: s.str.startswith(values), f"{col_name} (Starts With)", values
+    if col_name == 'proc_step_col' and spec.get('proc_step_filter') == 'not_contains':
+        pattern = '|'.join([re.escape(v) for v in values])
+        return (col_name, 'not_contains', pattern), lambda s: ~s.str.contains(pattern, case=False, na=False), f"{col_name} (Not Contains)", values
+    if col_name == 'cost_elem_col' and spec.get('cost_elem_filter') == 'not_contains':
+        return (col_name, 'not_in', _freeze(values)), lambda s: ~s.isin(values), f"{col_name} (Not In)", values
+    if col_name == 'coverage_id_col' and values == 'VFP_CONTAINS_FILTER':
+        return (col_name, 'contains', 'VFP'), lambda s: s.astype(str).str.contains('VFP', case=False, na=False), f"{col_name} (Contains)", 'VFP'
+    if col_name == 'desc_gl_col' and spec.get('desc_gl_filter') == 'regex':
+        pattern = values if isinstance(values, str) else '|'.join(values)
+        return (col_name, 'regex', pattern), lambda s: s.astype(str).str.contains(pattern, case=False, na=False, regex=True), f"{col_name} (Regex)", values
+    # plain membership, including cost_elem_filter == 'in'
+    return (col_name, 'in', _freeze(values)), lambda s: s.isin(values), col_name, values
+
+class FilterPlan:
+    """Evaluates the filters of many pivot specs against one frame, each distinct predicate and combination once.
+
+    Frames returned by filter() are shared between callers and must not be modified."""
+
+    def __init__(self, df, all_cols):
+        self.df = df
+        self.all_cols = all_cols
+        self._masks = {}
+        self._frames = {}
+
+    def mask(self, key, predicate):
+        if key not in self._masks:
+            self._masks[key] = distinct_value_mask(self.df[self.all_cols[key[0]]], predicate)
+        return self._masks[key]
+
+    def compile(self, spec):
+        """Returns (predicate keys, display_filters) for spec, evaluating predicates not seen before."""
+        display_filters = {}
+        keys = []
+        for col_name, values in spec.get('filters', {}).items():
+            key, predicate, label, display_value = compile_filter(col_name, values, spec)
+            self.mask(key, predicate)
+            keys.append(key)
+            display_filters[label] = display_value
+        return keys, display_filters
+
+    def combined_mask(self, keys):
+        mask = np.ones(len(self.df), dtype=bool)
+        for key in keys:
+            mask &= self._masks[key]
+        return mask
+
+    def filter(self, spec):
+        """Returns (filtered_df, display_filters) for spec."""
+        keys, display_filters = self.compile(spec)
+        frame_key = frozenset(keys)
+        if frame_key not in self._frames:
+            self._frames[frame_key] = self.df[self.combined_mask(keys)]
+        return self._frames[frame_key], display_filters
+
+    def pivot(self, spec):
+        """Returns spec's pivot table (see spec_pivot_table) over its filtered rows."""
+        return spec_pivot_table(self.filter(spec)[0], spec, self.all_cols)
 
 def get_filtered_df(df, spec, all_cols):
-    filtered_df = df.copy()
-    display_filters = {}
-    filters = spec.get('filters', {})
-    for col_name, values in filters.items():
-        col_prop = all_cols[col_name]
-        if col_name == 'gl_col' and spec.get('gl_col_filter') == 'regex':
-            filtered_df = filtered_df[filtered_df[col_prop].astype(str).str.match(values)]
-            display_filters[f"{col_name} (Starts With)"] = "1 or 2"
-        elif spec.get(f'{col_name}_filter') == 'startswith':
-            # Ensure the column is string type for .str accessor
-            filtered_df = filtered_df[filtered_df[col_prop].astype(str).str.startswith(tuple(values))]
-            display_filters[f"{col_name} (Starts With)"] = values
-        elif col_name == 'sub_acc_col':
-            filtered_df = filtered_df[filtered_df[col_prop].str.startswith(values)]
-            display_filters[f"{col_name} (Starts With)"] = values
-        elif col_name == 'proc_step_col' and spec.get('proc_step_filter') == 'not_contains':
-            filtered_df = filtered_df[~filtered_df[col_prop].str.contains('|'.join([re.escape(v) for v in values]), case=False, na=False)]
-            display_filters[f"{col_name} (Not Contains)"] = values
-        elif col_name == 'cost_elem_col' and spec.get('cost_elem_filter') == 'not_contains':
-             filtered_df = filtered_df[~filtered_df[col_prop].isin(values)]
-             display_filters[f"{col_name} (Not In)"] = values
-        elif col_name == 'cost_elem_col' and spec.get('cost_elem_filter') == 'in':
-             filtered_df = filtered_df[filtered_df[col_prop].isin(values)]
-             display_filters[col_name] = values
-        elif col_name == 'coverage_id_col' and values == 'VFP_CONTAINS_FILTER':
-            filtered_df = filtered_df[filtered_df[col_prop].astype(str).str.contains('VFP', case=False, na=False)]
-            display_filters[f"{col_name} (Contains)"] = 'VFP'
-        elif col_name == 'desc_gl_col' and spec.get('desc_gl_filter') == 'regex':
-            pattern = values if isinstance(values, str) else '|'.join(values)
-            filtered_df = filtered_df[filtered_df[col_prop].astype(str).str.contains(pattern, case=False, na=False, regex=True)]
-            display_filters[f"{col_name} (Regex)"] = values
-        else:
-            filtered_df = filtered_df[filtered_df[col_prop].isin(values)]
-            display_filters[col_name] = values
-    return filtered_df, display_filters
+    return FilterPlan(df, all_cols).filter(spec)
+
+def resolve_reader_engine(file_path, engine='auto'):
+    """Picks the Excel reader engine for file_path: 'auto' prefers calamine, then xlrd for .xls; a missing engine falls back to openpyxl."""
+    is_xls = os.path.splitext(file_path)[1].lower() == '.xls'
+    if engine == 'auto':
+        if importlib.util.find_spec('python_calamine'):
+            return 'calamine'
+        if is_xls and importlib.util.find_spec('xlrd'):
+            return 'xlrd'
+        return 'openpyxl'
 
-def get_slpd_sheet_name(file_path):
+    if engine not in READER_ENGINES:
+        raise ValueError(f"Unknown reader engine '{engine}'. Expected one of {READER_ENGINES}.")
+    module_name = {'calamine': 'python_calamine', 'xlrd': 'xlrd', 'openpyxl': 'openpyxl'}[engine]
+    if not importlib.util.find_spec(module_name):
+        print(f"Reader engine '{engine}' is not installed, falling back to openpyxl")
+        return 'openpyxl'
+    return engine
+
+def get_slpd_sheet_name(file_path, engine=None):
     """Get the sheet name containing 'SLPD' or return 'Sheet1' if not found"""
     try:
-        xl = pd.ExcelFile(file_path)
+        xl = pd.ExcelFile(file_path, engine=engine)
         sheet_names = xl.sheet_names
         
         # First try to find sheet with 'SLPD' in the name
@@ -490,462 +734,2097 @@ def get_slpd_sheet_name(file_path):
         print(f"Error reading Excel file: {e}")
         return 'Sheet1'
 
-def create_final_report(file_path, output_path):
-    try:
-        # Get the appropriate sheet name
-        sheet_name = get_slpd_sheet_name(file_path)
-        print(f"Using sheet: {sheet_name}")
-        
-        # Read the Excel file with the detected sheet name
-        df = pd.read_excel(file_path, sheet_name=sheet_name, header=0)
-        all_cols = {
-            'amount_col': 'Amount in Functional Currency', 'date_col': 'Posting Date',
-            'class_col': 'Classification', 'cost_elem_col': 'Cost or Revenue Element',
-            'gl_col': 'G/L Account', 'lifecycle_col': 'Subledger Account Lifecycle Stage',
-            'sub_acc_col': 'Subledger Account', 'proc_step_col': 'Description Process Step ID',
-            'loss_comp_col': 'Contributes to Loss Component', 'coverage_id_col': 'Coverage ID',
-            'desc_gl_col': 'Description G/L Account', 'occ_year_col': 'Description Occurrence Year',
-            'acc_change_col': 'Accounting Change'
-        }
+def parse_posting_dates(series):
+    """Parses posting dates into a categorical of day timestamps, reporting the values that cannot be parsed."""
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        parsed = pd.to_datetime(series, format='ISO8601', errors='coerce')
+        failed = series[parsed.isna() & series.notna()]
+        if len(failed):
+            examples = ', '.join(repr(value) for value in failed.drop_duplicates().head(3))
+            print(f"Warning: {len(failed)} posting date(s) could not be parsed and are treated as missing, e.g. {examples}")
+        series = parsed
+    # one unit for every input format, the coarsest Parquet stores, so cache hits keep the same dtype
+    return series.dt.normalize().dt.as_unit('ms').astype('category')
+
+@functools.lru_cache(maxsize=16)
+def period_calendar(dates_dtype):
+    """Builds the period attributes of every category of a posting date dtype, cached per dtype.
+
+    Row i describes category i and the last row missing dates, so a column's codes (-1 included) index it directly."""
+    dates = pd.DatetimeIndex(dates_dtype.categories)
+    at = np.select([dates.is_quarter_start, dates.is_quarter_end], ['start', 'end'], '')
+    return pd.DataFrame({
+        'quarter': dates.to_period('Q').append(pd.PeriodIndex([pd.NaT], freq='Q')),
+        'at': np.append(at, ''),
+        'label': np.append(dates.strftime(DATE_FORMAT).to_numpy(dtype=object), None),
+        'day': dates.append(pd.DatetimeIndex([pd.NaT])),
+    })
+
+def posting_calendar(dates):
+    """Returns (codes, calendar) for a posting date column; see period_calendar."""
+    if not isinstance(dates.dtype, pd.CategoricalDtype):
+        dates = parse_posting_dates(dates)
+    return dates.cat.codes.to_numpy(), period_calendar(dates.dtype)
+
+def with_date_labels(df, all_cols):
+    """Returns df with the posting dates shown as DATE_FORMAT text, as the Source_Data sheet has them."""
+    dates = df[all_cols['date_col']]
+    labels = period_calendar(dates.dtype)['label'].iloc[:-1]
+    return df.assign(**{all_cols['date_col']: dates.cat.rename_categories(labels.tolist())})
+
+def undated_totals(df, all_cols):
+    """Returns (rows, amount) of the rows without a posting date, which the date tables and cycles leave out."""
+    undated = df[all_cols['date_col']].isna().to_numpy()
+    return int(undated.sum()), float(df[all_cols['amount_col']].to_numpy()[undated].sum())
+
+def pivot_column_label(value):
+    """Returns the header a pivot column gets in the report (posting dates as DATE_FORMAT text)."""
+    return value.strftime(DATE_FORMAT) if isinstance(value, pd.Timestamp) else value
+
+def label_date_columns(pivot_df):
+    """Replaces posting date column labels of a pivot with their DATE_FORMAT text."""
+    return pivot_df.rename(columns=pivot_column_label)
+
+def prepare_slpd_frame(df, all_cols):
+    """Validates the required columns and coerces them to the types the report relies on."""
+    for col in all_cols.values():
+        if col not in df.columns:
+            raise ValueError(f"Required column '{col}' not found.")
+    df[all_cols['amount_col']] = pd.to_numeric(df[all_cols['amount_col']], errors='coerce').fillna(0)
+    df[all_cols['sub_acc_col']] = df[all_cols['sub_acc_col']].astype(str)
+    df[all_cols['date_col']] = parse_posting_dates(df[all_cols['date_col']])
+    df[all_cols['acc_change_col']] = pd.to_numeric(df[all_cols['acc_change_col']], errors='coerce').fillna(0).astype(int)
+    for col_name in CATEGORICAL_COLS:
+        df[all_cols[col_name]] = df[all_cols[col_name]].astype('category')
+    return df
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def evict_slpd_cache(cache_dir, max_bytes, keep=None):
+    """Deletes least recently used cache entries until the cache fits in max_bytes."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.parquet'):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def slpd_input_format(file_path):
+    """Returns 'csv', 'parquet' or 'excel' for an SLPD export, by file extension."""
+    name = file_path.lower()
+    if name.endswith(SLPD_CSV_EXTENSIONS):
+        return 'csv'
+    if name.endswith(SLPD_PARQUET_EXTENSIONS):
+        return 'parquet'
+    return 'excel'
+
+def read_slpd_csv(file_path, all_cols, block_size=SLPD_CSV_BLOCK_BYTES):
+    """Reads the all_cols columns of a CSV export with the Arrow CSV reader, text columns as categoricals."""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    read_options = pa_csv.ReadOptions(block_size=block_size)
+    header = pa_csv.open_csv(file_path, read_options=read_options).schema.names
+    for col in all_cols.values():
+        if col not in header:
+            raise ValueError(f"Required column '{col}' not found.")
+    text_cols = [all_cols[name] for name in CATEGORICAL_COLS]
+    convert_options = pa_csv.ConvertOptions(include_columns=list(all_cols.values()),
+                                            column_types={col: pa.string() for col in text_cols})
+    batches = []
+    with pa_csv.open_csv(file_path, read_options=read_options, convert_options=convert_options) as reader:
+        for batch in reader:
+            columns = [batch.column(name).dictionary_encode() if name in text_cols else batch.column(name) for name in batch.schema.names]
+            batches.append(pa.RecordBatch.from_arrays(columns, names=batch.schema.names))
+    if not batches:
+        return pd.DataFrame(columns=list(all_cols.values()))
+    df = pa.Table.from_batches(batches).unify_dictionaries().to_pandas()
+    # Dictionaries are in first-seen order; sort them as astype('category') would for the other formats
+    for col in text_cols:
+        df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return df
+
+def read_slpd_file(file_path, all_cols, reader_engine='auto'):
+    """Reads an SLPD export (.xlsx/.xls, CSV or Parquet) into an untyped frame for prepare_slpd_frame."""
+    input_format = slpd_input_format(file_path)
+    if input_format == 'csv':
+        print(f"Reading CSV: {file_path}")
+        return read_slpd_csv(file_path, all_cols)
+    if input_format == 'parquet':
+        print(f"Reading Parquet: {file_path}")
+        import pyarrow.parquet as pq
+        available = set(pq.read_schema(file_path).names)
         for col in all_cols.values():
-            if col not in df.columns:
+            if col not in available:
                 raise ValueError(f"Required column '{col}' not found.")
-        df[all_cols['amount_col']] = pd.to_numeric(df[all_cols['amount_col']], errors='coerce').fillna(0)
-        df[all_cols['sub_acc_col']] = df[all_cols['sub_acc_col']].astype(str)
-        df[all_cols['date_col']] = df[all_cols['date_col']].astype(str)
-        df[all_cols['acc_change_col']] = pd.to_numeric(df[all_cols['acc_change_col']], errors='coerce').fillna(0).astype(int)
-
-        pivot_groups = {
-            'LRC_VFA_Report': [
-                {
-                    'title': 'בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים', 
-                    'filters': {
-                        'class_col': ['VFP'], 
-                        'loss_comp_col': [0], 
-                        'lifecycle_col': [0, 10], 
-                        'sub_acc_col': '1', 
-                        'proc_step_col': ['carry forward', 'Release Margin (PE/DE Before Change)', 'Value TC (Ins. Contracts) (Period Start)']
-                    }, 
-                    'proc_step_filter': 'not_contains', 
-                    'index': ['coverage_id_col'], 
-                    'columns': 'cost_elem_col', 
-                    'column_filter': ['6000', 'Z2002', 'Z4000', 'Z3100', 'Z1013', 'Z2004', 'Z1017', 'Z2005', 'Z2007', 'Z2012', 'Z2017', 'Z2008', 'Z5040', 'Z5050', 'Z6001']
-                },
-                {
-                    'title': 'G/L Account Analysis', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'proc_step_col': ['carry forward', 'Release Margin (PE/DE Before Change)', 'Value TC (Ins. Contracts) (Period Start)'], 'gl_col': '^[12]'}, 'proc_step_filter': 'not_contains', 'gl_col_filter': 'regex', 'index': ['gl_col', 'desc_gl_col', 'cost_elem_col'], 'columns': 'date_col'
-                },
-                {
-                    'title': 'בדיקת סבירות היוונים', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'proc_step_col': ['Capture (Central GAAP) (PE/DE Bef. Chg.)', 'Capture (Central GAAP) (PS - Bef. Chge)', 'Unwind & Release (PS - Before Change)', 'Unwind and Release (PE/DE Before Change)']}, 'proc_step_filter': 'isin', 'index': ['cost_elem_col', 'proc_step_col'], 'columns': 'date_col'
-                },
-                {
-                    'title': 'בדיקת סבירות RA', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'proc_step_col': ['carry forward', 'release margin', 'value TC'], 'cost_elem_col': ['6000', 'Z2002']}, 'proc_step_filter': 'not_contains', 'index': 'coverage_id_col', 'columns': 'date_col', 'title_color': '90EE90'
-                },
-                {
-                    'layout': 'side_by_side',
-                    'table1': {'id': 'pvbe_source_data', 'title': 'בדיקת סיווג רכיבי LRC - Filtered Cost Elements', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'cost_elem_col': ['6000', 'Z6001'], 'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)']}, 'cost_elem_filter': 'not_contains', 'proc_step_filter': 'not_contains', 'index': ['proc_step_col', 'acc_change_col'], 'columns': 'date_col', 'title_color': '90EE90'},
-                    'table2': {'id': 'ra_source_data', 'title': 'בדיקת סיווג רכיבי LRC - CRE 6000 Only', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'cost_elem_col': ['6000'], 'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)']}, 'cost_elem_filter': 'in', 'proc_step_filter': 'not_contains', 'index': ['proc_step_col', 'acc_change_col'], 'columns': 'date_col', 'title_color': '90EE90'}
-                },
-                {
-                    'title': 'מעגל LRC', 'type': 'custom_lrc_cycle'
-                }
-            ],
-            'LIC_VFA': [
-                {
-                    'title': 'בדיקת סיווג רכיבי LIC לחשבונות GL הנכונים',
-                    'filters': {
-                        'lifecycle_col': [20, 50],
-                        'sub_acc_col': '1',
-                        'proc_step_col': ['carry forward'],
-                        'coverage_id_col': 'VFP_CONTAINS_FILTER',
-                        'cost_elem_col': ['ZR', 'CRES']
-                    },
-                    'proc_step_filter': 'not_contains',
-                    'cost_elem_filter': 'not_contains',
-                    'index': 'coverage_id_col',
-                    'columns': 'cost_elem_col'
-                },
-                {
-                    'title': 'G/L Account Analysis - Carry Forward VFP',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'proc_step_col': ['carry forward'],
-                        'desc_gl_col': ['LIC PVFCF RA - BS VFA', 'LIC PVFCF Claims - BS VFA', 'LIC ULAE- VFA', 'LIC Change Claims- Past Service - P&L VFA', 'LIC -InsFinExp Change in Inflation BE- P&L VFA', 'LIC -InsFinExp Change in Inflation BE - P&L PAA', 'LIC Change RA-Current Service - P&L VFA', 'LIC Change RA- Past Service - P&L VFA', 'LIC Change Claims- Current Service - P&L VFA', 'LIC Change ULAE Current Service - P&L VFA', 'LIC Change ULAE Past Service- P&L VFA']
-                    },
-                    'proc_step_filter': 'not_contains',
-                    'index': ['gl_col', 'desc_gl_col'],
-                    'columns': 'date_col'
-                },
-                {
-                    'title': 'בדיקת סבירות היוונים',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'lifecycle_col': [20, 50],
-                        'sub_acc_col': '1',
-                        'proc_step_col': ['Value TC (Ins. Contr.) (PE/DE Bef.Chg.)', 'Unwind and Release (PE/DE Before Change)', 'Capture (Central GAAP) (PE/DE Bef. Chg.)', 'Unwind & Release (PS - Before Change)', 'Capture (Central GAAP) (PS - Bef.Chge)']
-                    },
-                    'proc_step_filter': 'isin',
-                    'index': ['proc_step_col', 'cost_elem_col'],
-                    'columns': 'date_col'
-                },
-                {
-                    'title': 'בדיקת סבירות RA',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'lifecycle_col': [20, 50],
-                        'sub_acc_col': '1',
-                        'proc_step_col': ['Unwind and Release (PE/DE Before Change)', 'Capture (Central GAAP) (PE/DE Bef. Chg.)', 'Unwind & Release (PS - Before Change)', 'Capture (Central GAAP) (PS - Bef.Chge)']
-                    },
-                    'proc_step_filter': 'isin',
-                    'index': 'coverage_id_col',
-                    'columns': 'cost_elem_col',
-                    'column_filter': ['6000', 'Z2002']
-                },
-                {
-                    'layout': 'side_by_side',
-                    'table1': {
-                        'title': 'Filtered Out Cost Elements',
-                        'filters': {
-                            'class_col': ['VFP'],
-                            'lifecycle_col': [20, 50],
-                            'sub_acc_col': '1',
-                            'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
-                            'cost_elem_col': ['6000', '3103', '7000', '7010', '7005', 'Z6001']
-                        },
-                        'proc_step_filter': 'not_contains',
-                        'cost_elem_filter': 'not_contains',
-                        'index': ['occ_year_col', 'proc_step_col', 'acc_change_col'],
-                        'columns': 'date_col'
-                    },
-                    'table2': {
-                        'title': 'Filtered In Cost Elements',
-                        'filters': {
-                            'class_col': ['VFP'],
-                            'lifecycle_col': [20, 50],
-                            'sub_acc_col': '1',
-                            'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
-                            'cost_elem_col': ['6000']
-                        },
-                        'proc_step_filter': 'not_contains',
-                        'cost_elem_filter': 'in',
-                        'index': ['occ_year_col', 'proc_step_col', 'acc_change_col'],
-                        'columns': 'date_col'
-                    }
+        return pd.read_parquet(file_path, columns=list(all_cols.values()))
+
+    engine = resolve_reader_engine(file_path, reader_engine)
+
+    # Get the appropriate sheet name
+    sheet_name = get_slpd_sheet_name(file_path, engine=engine)
+    print(f"Using sheet: {sheet_name} (reader: {engine})")
+
+    # Read the Excel file with the detected sheet name
+    return pd.read_excel(file_path, sheet_name=sheet_name, header=0, engine=engine)
+
+def iter_slpd_chunks(file_path, all_cols, chunk_rows=SLPD_STREAM_CHUNK_ROWS, reader_engine='auto'):
+    """Yields an SLPD export as untyped frames of about chunk_rows rows; only legacy .xls workbooks are read whole."""
+    input_format = slpd_input_format(file_path)
+    columns = list(all_cols.values())
+    if input_format == 'csv':
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        print(f"Streaming CSV: {file_path}")
+        text_cols = [all_cols[name] for name in CATEGORICAL_COLS]
+        convert_options = pa_csv.ConvertOptions(include_columns=columns, column_types={col: pa.string() for col in text_cols})
+        with pa_csv.open_csv(file_path, read_options=pa_csv.ReadOptions(block_size=SLPD_CSV_BLOCK_BYTES), convert_options=convert_options) as reader:
+            for col in columns:
+                if col not in reader.schema.names:
+                    raise ValueError(f"Required column '{col}' not found.")
+            for batch in reader:
+                yield batch.to_pandas()
+        return
+    if input_format == 'parquet':
+        import pyarrow.parquet as pq
+        print(f"Streaming Parquet: {file_path}")
+        parquet_file = pq.ParquetFile(file_path)
+        for col in columns:
+            if col not in parquet_file.schema_arrow.names:
+                raise ValueError(f"Required column '{col}' not found.")
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    if os.path.splitext(file_path)[1].lower() == '.xls':
+        df = read_slpd_file(file_path, all_cols, reader_engine)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+
+    sheet_name = get_slpd_sheet_name(file_path, engine='openpyxl')
+    print(f"Streaming sheet: {sheet_name} (reader: openpyxl read-only)")
+    book = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = book[sheet_name].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        for col in columns:
+            if col not in header:
+                raise ValueError(f"Required column '{col}' not found.")
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if not chunk:
+                break
+            # TextParser infers the column types the way pd.read_excel does for a whole sheet
+            yield TextParser(chunk, names=header).read()[columns]
+    finally:
+        book.close()
+
+def stream_slpd_batches(file_path, all_cols, memory_budget_mb, reader_engine='auto'):
+    """Yields an SLPD export as typed frames, sized from the first chunk to aggregate within memory_budget_mb."""
+    budget = memory_budget_mb * 1024 ** 2
+    batch_rows, pending, pending_rows = None, [], 0
+    for chunk in iter_slpd_chunks(file_path, all_cols, reader_engine=reader_engine):
+        if batch_rows is None and len(chunk):
+            typed_bytes = prepare_slpd_frame(chunk.copy(), all_cols).memory_usage(deep=True).sum()
+            bytes_per_row = (chunk.memory_usage(deep=True).sum() + typed_bytes * SLPD_STREAM_WORKING_COPIES) / len(chunk)
+            batch_rows = max(1, int(budget // bytes_per_row))
+            print(f"Aggregating in batches of {batch_rows} rows ({memory_budget_mb:g} MB budget)")
+        pending.append(chunk)
+        pending_rows += len(chunk)
+        if batch_rows and pending_rows >= batch_rows:
+            rows = pd.concat(pending, ignore_index=True)
+            full = len(rows) - len(rows) % batch_rows
+            for start in range(0, full, batch_rows):
+                yield prepare_slpd_frame(rows.iloc[start:start + batch_rows].copy(), all_cols)
+            pending, pending_rows = [rows.iloc[full:]], len(rows) - full
+            del rows
+    if pending_rows:
+        yield prepare_slpd_frame(pd.concat(pending, ignore_index=True), all_cols)
+
+def load_slpd_data(file_path, all_cols, use_cache=True, cache_dir=None, cache_max_bytes=SLPD_CACHE_MAX_BYTES, reader_engine='auto'):
+    """Loads the typed SLPD frame, from the Parquet cache keyed on the file's content hash when it has the file.
+
+    reader_engine selects the Excel reader on a cache miss (see resolve_reader_engine)."""
+    cache_path = None
+    if use_cache:
+        cache_dir = cache_dir or SLPD_CACHE_DIR
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            key = file_content_hash(file_path)
+            cache_path = os.path.join(cache_dir, f"{key}_v{SLPD_CACHE_VERSION}.parquet")
+            if os.path.exists(cache_path):
+                df = pd.read_parquet(cache_path)
+                # Parquet keeps string dictionaries but not datetime ones
+                df[all_cols['date_col']] = df[all_cols['date_col']].astype('category')
+                os.utime(cache_path)
+                print(f"Loaded cached SLPD data: {cache_path}")
+                return df
+        except Exception as e:
+            print(f"SLPD cache unavailable, reading the source file: {e}")
+            cache_path = None
+
+    df = prepare_slpd_frame(read_slpd_file(file_path, all_cols, reader_engine), all_cols)
+
+    if cache_path:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_path)
+            os.replace(tmp_path, cache_path)
+            evict_slpd_cache(cache_dir, cache_max_bytes, keep=cache_path)
+        except Exception as e:
+            print(f"Could not write SLPD cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return df
+
+def source_data_sheet_names(n_rows):
+    """Names the Source_Data sheet(s), splitting into Source_Data_1..N past Excel's row limit."""
+    rows_per_sheet = EXCEL_MAX_ROWS - 1
+    n_sheets = max(1, -(-n_rows // rows_per_sheet))
+    if n_sheets == 1:
+        return ['Source_Data']
+    return [f'Source_Data_{i}' for i in range(1, n_sheets + 1)]
+
+def source_data_sidecar_path(output_path):
+    return os.path.splitext(output_path)[0] + '_source_data.parquet'
+
+def _xml_cell(ref, value, date_style):
+    if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        if np.isinf(value):
+            return f'<c r="{ref}" t="inlineStr"><is><t>{"inf" if value > 0 else "-inf"}</t></is></c>'
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        serial = (pd.Timestamp(value).tz_localize(None) - EXCEL_EPOCH) / pd.Timedelta(days=1)
+        return f'<c r="{ref}" s="{date_style}"><v>{serial}</v></c>'
+    text = ILLEGAL_CHARACTERS_RE.sub('', str(value))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+def _xml_column_cells(series, col_letter, row_numbers, date_style):
+    """Renders one column of a chunk as a Series of <c> elements ('' where the cell is empty)."""
+    refs = col_letter + row_numbers
+    if pd.api.types.is_bool_dtype(series.dtype) or not (
+            pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_dtype(series.dtype)):
+        values = series.astype(object).to_numpy()
+        return pd.Series([_xml_cell(ref, value, date_style) for ref, value in zip(refs, values)], index=refs.index)
+
+    if pd.api.types.is_datetime64_dtype(series.dtype):
+        valid = series.notna().to_numpy()
+        text = ((series - EXCEL_EPOCH) / pd.Timedelta(days=1)).astype(str)
+        cells = '<c r="' + refs + f'" s="{date_style}"><v>' + text + '</v></c>'
+    else:
+        numbers = series.to_numpy(dtype=float, na_value=np.nan)
+        valid = np.isfinite(numbers)
+        cells = '<c r="' + refs + '"><v>' + series.astype(str) + '</v></c>'
+        for i in np.flatnonzero(np.isinf(numbers)):
+            cells.iloc[i] = _xml_cell(refs.iloc[i], numbers[i], date_style)
+            valid[i] = True
+    cells[~valid] = ''
+    return cells
+
+def _sheet_parts_by_title(package):
+    """Maps sheet titles to their worksheet part names inside an xlsx package."""
+    ns = {'m': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+          'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+          'rel': 'http://schemas.openxmlformats.org/package/2006/relationships'}
+    rels = ET.fromstring(package.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.findall('rel:Relationship', ns)}
+    workbook = ET.fromstring(package.read('xl/workbook.xml'))
+    parts = {}
+    for sheet in workbook.find('m:sheets', ns):
+        target = targets[sheet.get(f"{{{ns['r']}}}id")]
+        parts[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    return parts
+
+def _stream_sheet_rows(out, placeholder_xml, df):
+    """Writes a worksheet part: the placeholder's XML with df's rows streamed into its sheetData."""
+    head, rest = placeholder_xml.split('<sheetData>', 1)
+    rows_xml, tail = rest.split('</sheetData>', 1)
+    header_row = re.search(r'<row r="1".*?</row>', rows_xml, re.S).group(0)
+    date_style = re.search(r'<c r="A2" s="(\d+)"', rows_xml).group(1)
+
+    last_col = get_column_letter(max(len(df.columns), 1))
+    head = re.sub(r'<dimension ref="[^"]*"/>', f'<dimension ref="A1:{last_col}{len(df) + 1}"/>', head)
+    out.write((head + '<sheetData>' + header_row).encode('utf-8'))
+
+    col_letters = [get_column_letter(i + 1) for i in range(len(df.columns))]
+    for start in range(0, len(df), SOURCE_DATA_CHUNK_ROWS):
+        chunk = df.iloc[start:start + SOURCE_DATA_CHUNK_ROWS]
+        row_numbers = pd.Series(np.arange(start + 2, start + 2 + len(chunk)).astype(str))
+        rows = '<row r="' + row_numbers + '">'
+        for letter, (_, series) in zip(col_letters, chunk.items()):
+            rows = rows + _xml_column_cells(series.reset_index(drop=True), letter, row_numbers, date_style)
+        out.write(('</row>'.join(rows) + '</row>').encode('utf-8'))
+
+    out.write(('</sheetData>' + tail).encode('utf-8'))
+
+def rewrite_sheet_parts(output_path, part_writers):
+    """Rewrites a saved workbook with the parts of the sheets in part_writers ({title: function(out, placeholder_xml)}) replaced."""
+    if not part_writers:
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(output_path)))
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(output_path) as src, zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as dst:
+            parts = _sheet_parts_by_title(src)
+            replacements = {parts[sheet_name]: part_writer for sheet_name, part_writer in part_writers.items()}
+            for item in src.infolist():
+                if item.filename in replacements:
+                    placeholder_xml = src.read(item).decode('utf-8')
+                    with dst.open(item.filename, 'w', force_zip64=True) as out:
+                        replacements[item.filename](out, placeholder_xml)
+                else:
+                    with src.open(item) as part, dst.open(item, 'w') as out:
+                        shutil.copyfileobj(part, out)
+        shutil.copymode(output_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def stream_source_data_sheets(output_path, pending):
+    """Streams the Source_Data rows into the saved workbook's placeholder sheets, bypassing openpyxl's cell model."""
+    rewrite_sheet_parts(output_path, {sheet_name: functools.partial(_stream_sheet_rows, df=chunk) for sheet_name, chunk in pending})
+
+class OpenpyxlReportWriter:
+    """Writes the report through pandas' openpyxl ExcelWriter and styles cells after they are written."""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.writer = pd.ExcelWriter(output_path, engine='openpyxl')
+        self.book = self.writer.book
+        self.pending_source_data = []
+        register_report_styles(self.book)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.writer.close()
+        if exc_type is None:
+            stream_source_data_sheets(self.output_path, self.pending_source_data)
+        return False
+
+    def _sheet(self, sheet_name):
+        if sheet_name not in self.book.sheetnames:
+            ws = self.book.create_sheet(sheet_name)
+            self.writer.sheets[sheet_name] = ws
+            return ws
+        return self.writer.sheets[sheet_name]
+
+    def write_source_data(self, df, mode='full'):
+        """Dumps the SLPD rows according to mode; 'stream' leaves header-only placeholders for stream_source_data_sheets."""
+        if mode not in SOURCE_DATA_MODES:
+            raise ValueError(f"Unknown source data mode '{mode}'. Expected one of {SOURCE_DATA_MODES}.")
+
+        if mode == 'parquet':
+            sidecar_path = source_data_sidecar_path(self.output_path)
+            df.to_parquet(sidecar_path, index=False)
+            ws = self._sheet('Source_Data')
+            ws.cell(row=1, column=1, value="Source data was written to a Parquet sidecar:").style = 'Filter Label'
+            link_cell = ws.cell(row=2, column=1, value=os.path.basename(sidecar_path))
+            link_cell.hyperlink = os.path.basename(sidecar_path)
+            link_cell.font = Font(color="0000FF", underline="single")
+            ws.cell(row=3, column=1, value=f"{len(df)} rows, {len(df.columns)} columns")
+            print(f"Source data written to: {sidecar_path}")
+            return
+
+        rows_per_sheet = EXCEL_MAX_ROWS - 1
+        for i, sheet_name in enumerate(source_data_sheet_names(len(df))):
+            chunk = df.iloc[i * rows_per_sheet:(i + 1) * rows_per_sheet]
+            if mode == 'full':
+                chunk.to_excel(self.writer, sheet_name=sheet_name, index=False)
+            else:
+                chunk.iloc[:0].to_excel(self.writer, sheet_name=sheet_name, index=False)
+                # Never saved as data: it only makes openpyxl emit a datetime cell style we can reuse.
+                self.writer.sheets[sheet_name].cell(row=2, column=1, value=datetime(2000, 1, 1))
+                self.pending_source_data.append((sheet_name, chunk))
+
+    def write_title(self, sheet_name, row, col, title, fill_color=None):
+        cell = self._sheet(sheet_name).cell(row=row, column=col, value=title)
+        cell.style = 'Report Title'
+        if fill_color:
+            cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+
+    def write_filters(self, sheet_name, row, col, filters):
+        ws = self._sheet(sheet_name)
+        rows, height = filter_block_rows(filters)
+        for offset, label, value in rows:
+            if label is not None:
+                ws.cell(row=row + offset, column=col, value=label).style = 'Filter Label'
+            if value is not None:
+                ws.cell(row=row + offset, column=col + 1, value=value)
+        return row + height
+
+    def write_pivot(self, sheet_name, pivot_df, row, col):
+        ws = self._sheet(sheet_name)
+        pivot_df.to_excel(self.writer, sheet_name=sheet_name, startrow=row - 1, startcol=col - 1)
+
+        header_rows, index_cols, num_cols, grand_total_offset = pivot_block_geometry(pivot_df)
+        body_start_row = row + header_rows
+        grand_total_row = row + grand_total_offset if grand_total_offset is not None else None
+        for cells in ws.iter_rows(min_row=row, max_row=body_start_row + len(pivot_df) - 1,
+                                  min_col=col, max_col=col + num_cols - 1):
+            row_num = cells[0].row
+            if row_num < body_start_row or row_num == grand_total_row:
+                for cell in cells:
+                    cell.style = 'Pivot Header'
+            else:
+                for offset, cell in enumerate(cells):
+                    cell.style = 'Pivot Index' if offset < index_cols else 'Pivot Cell'
+
+        for i, width in enumerate(pivot_column_widths(pivot_df)):
+            ws.column_dimensions[get_column_letter(col + i)].width = width
+        return ws.max_row
+
+    def write_sheet_group(self, sheet_name, placements, profiler=None):
+        write_sheet_placements(self, sheet_name, placements, profiler)
+
+    def write_toc(self, sheet_name, headers, rows):
+        """Writes the right-to-left table of contents from row dicts with 'check', 'link', 'explanation' and 'kind'."""
+        ws = self._sheet(sheet_name)
+        ws.sheet_view.rightToLeft = True
+        green_fill = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
+        header_font = Font(bold=True, color="000000")
+
+        for col, header in enumerate(headers, start=1):
+            ws.cell(row=1, column=col, value=header).style = 'Pivot Header'
+
+        for idx, toc_row in enumerate(rows, start=2):
+            highlighted = toc_row['kind'] in ('section', 'final')
+            cell_a = ws.cell(row=idx, column=1, value=toc_row['check'])
+            if highlighted:
+                cell_a.fill = green_fill
+                cell_a.font = header_font
+
+            if toc_row['link']:
+                link_sheet, link_row = toc_row['link']
+                cell_b = ws.cell(row=idx, column=2, value=toc_row['check'])
+                cell_b.hyperlink = f"#'{link_sheet}'!A{link_row}"
+                cell_b.font = Font(color="0000FF", underline="single")
+                if toc_row['kind'] == 'final':
+                    cell_b.fill = green_fill
+                    cell_b.font = Font(bold=True, color="000000", underline="single")
+
+            cell_c = ws.cell(row=idx, column=3, value=toc_row['explanation'] or None)
+            if toc_row['kind'] == 'final':
+                cell_c.fill = green_fill
+
+        for col in ['A', 'B', 'C']:
+            ws.column_dimensions[col].width = 50
+
+class XlsxWriterReportWriter:
+    """Writes the report with XlsxWriter in constant_memory mode, buffering report sheets to write them in row order."""
+
+    def __init__(self, output_path):
+        import xlsxwriter
+
+        self.output_path = output_path
+        self.book = xlsxwriter.Workbook(output_path, {'constant_memory': True})
+        self.sheets = {}
+        self.buffers = {}
+        self.widths = {}
+        self.max_rows = {}
+        self._fill_formats = {}
+        border = {'border': 1}
+        self.formats = {
+            'title': self.book.add_format({'bold': True, 'font_size': 14}),
+            'label': self.book.add_format({'bold': True}),
+            'header': self.book.add_format({'bold': True, 'font_color': '#000000', 'bg_color': '#DDEBF7',
+                                            'align': 'center', 'valign': 'top', **border}),
+            'index': self.book.add_format({'bold': True, 'align': 'center', 'valign': 'top', **border}),
+            'cell': self.book.add_format(border),
+            'datetime': self.book.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'}),
+            'link': self.book.add_format({'font_color': '#0000FF', 'underline': 1}),
+            'toc_highlight': self.book.add_format({'bold': True, 'font_color': '#000000', 'bg_color': '#90EE90'}),
+            'toc_link_highlight': self.book.add_format({'bold': True, 'font_color': '#000000', 'underline': 1,
+                                                        'bg_color': '#90EE90'}),
+            'toc_fill': self.book.add_format({'bg_color': '#90EE90'}),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _sheet(self, sheet_name):
+        if sheet_name not in self.sheets:
+            self.sheets[sheet_name] = self.book.add_worksheet(sheet_name)
+            self.buffers[sheet_name] = {}
+            self.widths[sheet_name] = {}
+            self.max_rows[sheet_name] = 0
+        return self.sheets[sheet_name]
+
+    def _put(self, sheet_name, row, col, value, fmt=None, url=None):
+        """Buffers a cell; rows and columns are 1-based like openpyxl's."""
+        self._sheet(sheet_name)
+        self.buffers[sheet_name].setdefault(row, {})[col] = (value, fmt, url)
+        self.max_rows[sheet_name] = max(self.max_rows[sheet_name], row)
+
+    def _title_format(self, fill_color):
+        if fill_color not in self._fill_formats:
+            self._fill_formats[fill_color] = self.book.add_format({'bold': True, 'font_size': 14, 'bg_color': f'#{fill_color}'})
+        return self._fill_formats[fill_color]
+
+    def _write_value(self, ws, row, col, value, fmt):
+        if value is None or value is pd.NaT or value == '' or (isinstance(value, float) and np.isnan(value)):
+            if fmt is not None:
+                ws.write_blank(row, col, None, fmt)
+        elif isinstance(value, (datetime, np.datetime64)):
+            ws.write_datetime(row, col, pd.Timestamp(value).tz_localize(None).to_pydatetime(), fmt or self.formats['datetime'])
+        elif isinstance(value, (bool, np.bool_)):
+            ws.write_boolean(row, col, bool(value), fmt)
+        elif isinstance(value, (int, float, np.integer, np.floating)):
+            if np.isinf(value):
+                ws.write_string(row, col, 'inf' if value > 0 else '-inf', fmt)
+            else:
+                ws.write_number(row, col, value, fmt)
+        else:
+            ws.write_string(row, col, str(value), fmt)
+
+    def write_source_data(self, df, mode='full'):
+        """Streams the SLPD rows; 'full' and 'stream' are the same thing in constant_memory mode."""
+        if mode not in SOURCE_DATA_MODES:
+            raise ValueError(f"Unknown source data mode '{mode}'. Expected one of {SOURCE_DATA_MODES}.")
+
+        if mode == 'parquet':
+            sidecar_path = source_data_sidecar_path(self.output_path)
+            df.to_parquet(sidecar_path, index=False)
+            self._put('Source_Data', 1, 1, "Source data was written to a Parquet sidecar:", self.formats['label'])
+            self._put('Source_Data', 2, 1, os.path.basename(sidecar_path), self.formats['link'],
+                      url=f"external:{os.path.basename(sidecar_path)}")
+            self._put('Source_Data', 3, 1, f"{len(df)} rows, {len(df.columns)} columns")
+            print(f"Source data written to: {sidecar_path}")
+            return
+
+        rows_per_sheet = EXCEL_MAX_ROWS - 1
+        for i, sheet_name in enumerate(source_data_sheet_names(len(df))):
+            ws = self._sheet(sheet_name)
+            chunk = df.iloc[i * rows_per_sheet:(i + 1) * rows_per_sheet]
+            for col, name in enumerate(chunk.columns):
+                self._write_value(ws, 0, col, name, self.formats['label'])
+            for row, values in enumerate(chunk.itertuples(index=False, name=None), start=1):
+                for col, value in enumerate(values):
+                    self._write_value(ws, row, col, value, None)
+            self.max_rows[sheet_name] = len(chunk) + 1
+
+    def write_title(self, sheet_name, row, col, title, fill_color=None):
+        fmt = self._title_format(fill_color) if fill_color else self.formats['title']
+        self._put(sheet_name, row, col, title, fmt)
+
+    def write_filters(self, sheet_name, row, col, filters):
+        rows, height = filter_block_rows(filters)
+        for offset, label, value in rows:
+            if label is not None:
+                self._put(sheet_name, row + offset, col, label, self.formats['label'])
+            if value is not None:
+                self._put(sheet_name, row + offset, col + 1, value)
+        return row + height
+
+    def write_pivot(self, sheet_name, pivot_df, row, col):
+        header_rows, index_cols, num_cols, grand_total_offset = pivot_block_geometry(pivot_df)
+        n_rows = header_rows + len(pivot_df)
+        values = pivot_excel_cells(pivot_df)
+        for r in range(n_rows):
+            if r < header_rows or r == grand_total_offset:
+                fmt = self.formats['header']
+            else:
+                fmt = None
+            for c in range(num_cols):
+                cell_fmt = fmt or (self.formats['index'] if c < index_cols else self.formats['cell'])
+                self._put(sheet_name, row + r, col + c, values.pop((r, c), None), cell_fmt)
+        for (r, c), value in values.items():
+            # the few cells to_excel puts outside the styled block (see pivot_excel_cells)
+            if value is not None:
+                self._put(sheet_name, row + r, col + c, value)
+
+        for i, width in enumerate(pivot_column_widths(pivot_df)):
+            self.widths[sheet_name][col + i - 1] = width
+        return self.max_rows[sheet_name]
+
+    def write_sheet_group(self, sheet_name, placements, profiler=None):
+        write_sheet_placements(self, sheet_name, placements, profiler)
+
+    def write_toc(self, sheet_name, headers, rows):
+        self._sheet(sheet_name).right_to_left()
+        for col, header in enumerate(headers, start=1):
+            self._put(sheet_name, 1, col, header, self.formats['header'])
+
+        for idx, toc_row in enumerate(rows, start=2):
+            highlighted = toc_row['kind'] in ('section', 'final')
+            self._put(sheet_name, idx, 1, toc_row['check'], self.formats['toc_highlight'] if highlighted else None)
+            if toc_row['link']:
+                link_sheet, link_row = toc_row['link']
+                fmt = self.formats['toc_link_highlight'] if toc_row['kind'] == 'final' else self.formats['link']
+                self._put(sheet_name, idx, 2, toc_row['check'], fmt, url=f"internal:'{link_sheet}'!A{link_row}")
+            fmt = self.formats['toc_fill'] if toc_row['kind'] == 'final' else None
+            self._put(sheet_name, idx, 3, toc_row['explanation'] or None, fmt)
+
+        for col in range(3):
+            self.widths[sheet_name][col] = 50
+
+    def close(self):
+        for sheet_name, ws in self.sheets.items():
+            for col, width in self.widths[sheet_name].items():
+                ws.set_column(col, col, width)
+            for row in sorted(self.buffers[sheet_name]):
+                for col, (value, fmt, url) in sorted(self.buffers[sheet_name][row].items()):
+                    if url:
+                        ws.write_url(row - 1, col - 1, url, fmt, string=str(value))
+                    else:
+                        self._write_value(ws, row - 1, col - 1, value, fmt)
+            self.buffers[sheet_name] = {}
+        self.book.close()
+
+def render_sheet_xml(sheet_name, placements):
+    """Renders planned tables into a scratch workbook in a worker; returns the sheet XML and what each of its style ids stands for."""
+    writer = OpenpyxlReportWriter(io.BytesIO())
+    write_sheet_placements(writer, sheet_name, placements)
+    ws = writer.writer.sheets[sheet_name]
+    book = writer.book
+    ws._drawing = SpreadsheetDrawing()
+    ws_writer = WorksheetWriter(ws)
+    try:
+        ws_writer.write()
+        if ws_writer._rels:
+            raise ValueError(f"Sheet '{sheet_name}' has relationships and cannot be rendered on its own.")
+        with open(ws_writer.out, 'rb') as part:
+            xml = part.read()
+    finally:
+        ws_writer.cleanup()
+
+    styles = []
+    for style in book._cell_styles:
+        if style.numFmtId < BUILTIN_FORMATS_MAX_SIZE:
+            number_format = BUILTIN_FORMATS.get(style.numFmtId, 'General')
+        else:
+            number_format = book._number_formats[style.numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+        styles.append((book._named_styles[style.xfId].name, book._fonts[style.fontId], book._fills[style.fillId],
+                       book._borders[style.borderId], book._alignments[style.alignmentId],
+                       book._protections[style.protectionId], number_format, bool(style.quotePrefix), bool(style.pivotButton)))
+    return xml, styles
+
+class ParallelOpenpyxlReportWriter(OpenpyxlReportWriter):
+    """Writes the same workbook as OpenpyxlReportWriter, rendering the report sheets in worker processes.
+
+    Each sheet keeps a placeholder that fixes its order and registers its styles; on exit the rendered parts replace them.
+    The pool starts with the second report sheet; a single one is rendered in this process."""
+
+    def __init__(self, output_path, workers=None):
+        super().__init__(output_path)
+        self.workers = workers
+        self.pool = None
+        self.pending = {}
+        self.rendered = {}
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                results = {sheet_name: future.result() for sheet_name, future in self.rendered.items()}
+                results.update({sheet_name: render_sheet_xml(sheet_name, tables) for sheet_name, tables in self.pending.items()})
+                rendered = {sheet_name: self._stamp_styles(sheet_name, *result) for sheet_name, result in results.items()}
+        finally:
+            if self.pool:
+                self.pool.shutdown(cancel_futures=exc_type is not None)
+        self.writer.close()
+        if exc_type is None:
+            rewrite_sheet_parts(self.output_path, {sheet_name: self._sheet_part(xml, cells) for sheet_name, (xml, cells) in rendered.items()})
+            stream_source_data_sheets(self.output_path, self.pending_source_data)
+        return False
+
+    def write_sheet_group(self, sheet_name, placements, profiler=None):
+        self._sheet(sheet_name)
+        tables = [({key: table[key] for key in ('title', 'pivot_df', 'filters', 'title_color') if key in table}, row, col)
+                  for table, row, col in placements]
+        if self.pool is None:
+            self.pending[sheet_name] = tables
+            if len(self.pending) < 2:
+                return
+            self.pool = ProcessPoolExecutor(max_workers=self.workers or os.cpu_count() or 1)
+            tables_by_sheet, self.pending = self.pending, {}
+        else:
+            tables_by_sheet = {sheet_name: tables}
+        for name, sheet_tables in tables_by_sheet.items():
+            self.rendered[name] = self.pool.submit(render_sheet_xml, name, sheet_tables)
+
+    def _stamp_styles(self, sheet_name, xml, styles):
+        """Puts a cell per rendered style, in local style id order, on the sheet's placeholder."""
+        ws = self._sheet(sheet_name)
+        cells = []
+        for row, (name, font, fill, border, alignment, protection, number_format, quote_prefix, pivot_button) in enumerate(styles, start=1):
+            cell = ws.cell(row=row, column=1)
+            cell.style = name
+            cell.font, cell.fill, cell.border = font, fill, border
+            cell.alignment, cell.protection, cell.number_format = alignment, protection, number_format
+            cell.quotePrefix, cell.pivotButton = quote_prefix, pivot_button
+            cells.append(cell)
+        return xml, cells
+
+    @staticmethod
+    def _sheet_part(xml, cells):
+        """Returns a part writer for rendered sheet XML, its style ids remapped onto the saved workbook's."""
+        style_ids = [str(cell.style_id).encode() for cell in cells]
+        xml = re.sub(rb'(<c r="[A-Z]+[0-9]+") s="(\d+)"', lambda m: m.group(1) + b' s="' + style_ids[int(m.group(2))] + b'"', xml)
+        return lambda out, placeholder_xml: out.write(xml)
+
+REPORT_WRITERS = {'openpyxl': OpenpyxlReportWriter, 'openpyxl-parallel': ParallelOpenpyxlReportWriter,
+                  'xlsxwriter': XlsxWriterReportWriter}
+
+# render_sheet_xml reads openpyxl internals (WorksheetWriter, the workbook's style lists), checked
+# against this release series only; tests/test_writers.py compares its output with the plain writer's.
+# The parallel writer needs openpyxl>=3.1,<3.2 (other versions fall back to the plain writer).
+PARALLEL_OPENPYXL_SERIES = '3.1.'
+
+def open_report_writer(output_path, backend='openpyxl'):
+    """Creates the workbook writer for backend ('openpyxl', 'openpyxl-parallel' or 'xlsxwriter'); see PARALLEL_OPENPYXL_SERIES."""
+    if backend not in REPORT_WRITERS:
+        raise ValueError(f"Unknown writer backend '{backend}'. Expected one of {tuple(REPORT_WRITERS)}.")
+    if backend == 'openpyxl-parallel' and not openpyxl.__version__.startswith(PARALLEL_OPENPYXL_SERIES):
+        print(f"The parallel writer is not checked against openpyxl {openpyxl.__version__}, falling back to openpyxl")
+        backend = 'openpyxl'
+    return REPORT_WRITERS[backend](output_path)
+
+def _peak_rss_mb():
+    """Returns the process's peak resident set size in MB, or None where the platform does not report it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def cprofile_hook(output_dir):
+    """Returns a profiler hook that runs a stage under cProfile and dumps <stage>.prof into output_dir."""
+    import cProfile
+
+    @contextlib.contextmanager
+    def hook(stage_name):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            os.makedirs(output_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(output_dir, f"{_profile_file_stem(stage_name)}.prof"))
+    return hook
+
+def pyinstrument_hook(output_dir):
+    """Returns a profiler hook that samples a stage with pyinstrument and saves <stage>.html into output_dir."""
+    if importlib.util.find_spec('pyinstrument') is None:
+        raise ImportError("pyinstrument is not installed")
+    from pyinstrument import Profiler
+
+    @contextlib.contextmanager
+    def hook(stage_name):
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            os.makedirs(output_dir, exist_ok=True)
+            with open(os.path.join(output_dir, f"{_profile_file_stem(stage_name)}.html"), 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+    return hook
+
+def _profile_file_stem(stage_name):
+    return re.sub(r'[^\w.-]+', '_', stage_name).strip('_')
+
+class StageProfiler:
+    """Records wall time, CPU time, peak memory and row counts of nested report stages.
+
+    trace_memory slows the run down; the profiler stops the tracemalloc it started when its outermost stage
+    ends or on close(). add_hook(prefix, hook) runs matching stages inside hook(stage_name), e.g. cprofile_hook()."""
+
+    def __init__(self, trace_memory=True):
+        self.records = []
+        self.hooks = []
+        self.trace_memory = trace_memory
+        self._peaks = []
+        self._started_tracing = False
+
+    def add_hook(self, prefix, hook):
+        self.hooks.append((prefix, hook))
+
+    def start(self, name, rows_in=None):
+        """Opens a stage and returns its record; pass it to finish()."""
+        if self.trace_memory:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            elif not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+        hooks = [hook(name) for prefix, hook in self.hooks if name.startswith(prefix)]
+        for hook in hooks:
+            hook.__enter__()
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None, '_hooks': hooks,
+                  '_wall': time.perf_counter(), '_cpu': time.process_time()}
+        self.records.append(record)
+        return record
+
+    def finish(self, record, rows_out=None):
+        record['wall_s'] = round(time.perf_counter() - record.pop('_wall'), 4)
+        record['cpu_s'] = round(time.process_time() - record.pop('_cpu'), 4)
+        for hook in reversed(record.pop('_hooks')):
+            hook.__exit__(None, None, None)
+        if rows_out is not None:
+            record['rows_out'] = rows_out
+        if self.trace_memory and self._peaks:
+            peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            record['peak_traced_mb'] = round(peak / 1024 ** 2, 1)
+            if not self._peaks:
+                self.close()
+        record['peak_rss_mb'] = _peak_rss_mb()
+
+    def close(self):
+        """Stops tracemalloc if this profiler started it; stages still open get no traced peak."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._peaks = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """Times the with-block as stage name; set record['rows_out'] inside the block."""
+        record = self.start(name, rows_in)
+        try:
+            yield record
+        finally:
+            self.finish(record)
+
+    def frame(self):
+        """Returns the finished stages as a frame indexed by stage name."""
+        columns = ['stage', 'wall_s', 'cpu_s', 'peak_traced_mb', 'peak_rss_mb', 'rows_in', 'rows_out']
+        finished = [r for r in self.records if 'wall_s' in r]
+        return pd.DataFrame(finished, columns=columns).set_index('stage')
+
+    def write_sheet(self, writer, sheet_name='_Profile'):
+        """Writes the stages finished so far to a sheet of the report."""
+        writer.write_title(sheet_name, 1, 1, 'Stage profile')
+        writer.write_pivot(sheet_name, self.frame().fillna(''), 3, 1)
+
+    def write_json(self, path):
+        finished = [r for r in self.records if 'wall_s' in r]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'stages': finished}, f, ensure_ascii=False, indent=1)
+
+class NullProfiler:
+    """Stands in for StageProfiler when profiling is off."""
+
+    def start(self, name, rows_in=None):
+        return {}
+
+    def finish(self, record, rows_out=None):
+        pass
+
+    def stage(self, name, rows_in=None):
+        return contextlib.nullcontext({})
+
+def profile_json_path(output_path):
+    return f"{os.path.splitext(output_path)[0]}.profile.json"
+
+def full_pivot_groups(pivot_groups):
+    """Returns a copy of pivot_groups without 'exceptions_only', so every table writes all its rows."""
+    def full(spec):
+        spec = {key: value for key, value in spec.items() if key != 'exceptions_only'}
+        for key in ('table1', 'table2'):
+            if key in spec:
+                spec[key] = full(spec[key])
+        return spec
+    return {sheet_name: [full(spec) for spec in pivots] for sheet_name, pivots in pivot_groups.items()}
+
+# The report's sheets, in order, with the pivot specs each one holds
+PIVOT_GROUPS = {
+    'LRC_VFA_Report': [
+        {
+            'title': 'בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים', 
+            'filters': {
+                'class_col': ['VFP'], 
+                'loss_comp_col': [0], 
+                'lifecycle_col': [0, 10], 
+                'sub_acc_col': '1', 
+                'proc_step_col': ['carry forward', 'Release Margin (PE/DE Before Change)', 'Value TC (Ins. Contracts) (Period Start)']
+            }, 
+            'proc_step_filter': 'not_contains', 
+            'index': ['coverage_id_col'], 
+            'columns': 'cost_elem_col', 
+            'column_filter': ['6000', 'Z2002', 'Z4000', 'Z3100', 'Z1013', 'Z2004', 'Z1017', 'Z2005', 'Z2007', 'Z2012', 'Z2017', 'Z2008', 'Z5040', 'Z5050', 'Z6001'],
+            'exceptions_only': True
+        },
+        {
+            'title': 'G/L Account Analysis', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'proc_step_col': ['carry forward', 'Release Margin (PE/DE Before Change)', 'Value TC (Ins. Contracts) (Period Start)'], 'gl_col': '^[12]'}, 'proc_step_filter': 'not_contains', 'gl_col_filter': 'regex', 'index': ['gl_col', 'desc_gl_col', 'cost_elem_col'], 'columns': 'date_col'
+        },
+        {
+            'title': 'בדיקת סבירות היוונים', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'proc_step_col': ['Capture (Central GAAP) (PE/DE Bef. Chg.)', 'Capture (Central GAAP) (PS - Bef. Chge)', 'Unwind & Release (PS - Before Change)', 'Unwind and Release (PE/DE Before Change)']}, 'proc_step_filter': 'isin', 'index': ['cost_elem_col', 'proc_step_col'], 'columns': 'date_col'
+        },
+        {
+            'title': 'בדיקת סבירות RA', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'proc_step_col': ['carry forward', 'release margin', 'value TC'], 'cost_elem_col': ['6000', 'Z2002']}, 'proc_step_filter': 'not_contains', 'index': 'coverage_id_col', 'columns': 'date_col', 'title_color': '90EE90'
+        },
+        {
+            'layout': 'side_by_side',
+            'table1': {'id': 'pvbe_source_data', 'title': 'בדיקת סיווג רכיבי LRC - Filtered Cost Elements', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'cost_elem_col': ['6000', 'Z6001'], 'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)']}, 'cost_elem_filter': 'not_contains', 'proc_step_filter': 'not_contains', 'index': ['proc_step_col', 'acc_change_col'], 'columns': 'date_col', 'title_color': '90EE90'},
+            'table2': {'id': 'ra_source_data', 'title': 'בדיקת סיווג רכיבי LRC - CRE 6000 Only', 'filters': {'class_col': ['VFP'], 'loss_comp_col': [0], 'lifecycle_col': [0, 10], 'sub_acc_col': '1', 'cost_elem_col': ['6000'], 'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)']}, 'cost_elem_filter': 'in', 'proc_step_filter': 'not_contains', 'index': ['proc_step_col', 'acc_change_col'], 'columns': 'date_col', 'title_color': '90EE90'}
+        },
+        {
+            'title': 'מעגל LRC', 'type': 'custom_lrc_cycle'
+        }
+    ],
+    'LIC_VFA': [
+        {
+            'title': 'בדיקת סיווג רכיבי LIC לחשבונות GL הנכונים',
+            'filters': {
+                'lifecycle_col': [20, 50],
+                'sub_acc_col': '1',
+                'proc_step_col': ['carry forward'],
+                'coverage_id_col': 'VFP_CONTAINS_FILTER',
+                'cost_elem_col': ['ZR', 'CRES']
+            },
+            'proc_step_filter': 'not_contains',
+            'cost_elem_filter': 'not_contains',
+            'index': 'coverage_id_col',
+            'columns': 'cost_elem_col',
+            'exceptions_only': True
+        },
+        {
+            'title': 'G/L Account Analysis - Carry Forward VFP',
+            'filters': {
+                'class_col': ['VFP'],
+                'proc_step_col': ['carry forward'],
+                'desc_gl_col': ['LIC PVFCF RA - BS VFA', 'LIC PVFCF Claims - BS VFA', 'LIC ULAE- VFA', 'LIC Change Claims- Past Service - P&L VFA', 'LIC -InsFinExp Change in Inflation BE- P&L VFA', 'LIC -InsFinExp Change in Inflation BE - P&L PAA', 'LIC Change RA-Current Service - P&L VFA', 'LIC Change RA- Past Service - P&L VFA', 'LIC Change Claims- Current Service - P&L VFA', 'LIC Change ULAE Current Service - P&L VFA', 'LIC Change ULAE Past Service- P&L VFA']
+            },
+            'proc_step_filter': 'not_contains',
+            'index': ['gl_col', 'desc_gl_col'],
+            'columns': 'date_col'
+        },
+        {
+            'title': 'בדיקת סבירות היוונים',
+            'filters': {
+                'class_col': ['VFP'],
+                'lifecycle_col': [20, 50],
+                'sub_acc_col': '1',
+                'proc_step_col': ['Value TC (Ins. Contr.) (PE/DE Bef.Chg.)', 'Unwind and Release (PE/DE Before Change)', 'Capture (Central GAAP) (PE/DE Bef. Chg.)', 'Unwind & Release (PS - Before Change)', 'Capture (Central GAAP) (PS - Bef.Chge)']
+            },
+            'proc_step_filter': 'isin',
+            'index': ['proc_step_col', 'cost_elem_col'],
+            'columns': 'date_col'
+        },
+        {
+            'title': 'בדיקת סבירות RA',
+            'filters': {
+                'class_col': ['VFP'],
+                'lifecycle_col': [20, 50],
+                'sub_acc_col': '1',
+                'proc_step_col': ['Unwind and Release (PE/DE Before Change)', 'Capture (Central GAAP) (PE/DE Bef. Chg.)', 'Unwind & Release (PS - Before Change)', 'Capture (Central GAAP) (PS - Bef.Chge)']
+            },
+            'proc_step_filter': 'isin',
+            'index': 'coverage_id_col',
+            'columns': 'cost_elem_col',
+            'column_filter': ['6000', 'Z2002'],
+            'exceptions_only': True
+        },
+        {
+            'layout': 'side_by_side',
+            'table1': {
+                'title': 'Filtered Out Cost Elements',
+                'filters': {
+                    'class_col': ['VFP'],
+                    'lifecycle_col': [20, 50],
+                    'sub_acc_col': '1',
+                    'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
+                    'cost_elem_col': ['6000', '3103', '7000', '7010', '7005', 'Z6001']
                 },
-                {
-                    'title': 'מעגל LIC', 'type': 'custom_lic_cycle'
-                }
-            ],'LC_VFA': [
-                {
-                    'layout': 'side_by_side',
-                    'table1': {
-                        'title': 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים',
-                        'filters': {
-                            'class_col': ['VFP'],
-                            'lifecycle_col': [10],
-                            'sub_acc_col': '1',
-                            'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
-                            'loss_comp_col': [1],
-                            'cost_elem_col': ['6000', '3103', 'Z1012', 'Z4000', 'Z3100', 'Z1013', 'Z1017', 'ZR200', 'ZR100', 'ZR102', 'ZR202']
-                        },
-                        'proc_step_filter': 'not_contains',
-                        'index': ['coverage_id_col'],
-                        'columns': 'cost_elem_col',
-                        'title_color': '90EE90'
-                    },
-                    'table2': {
-                        'title': 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים',
-                        'filters': {
-                            'class_col': ['VFP'],
-                            'lifecycle_col': [10],
-                            'sub_acc_col': '1',
-                            'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
-                            'loss_comp_col': [1],
-                            'cost_elem_col': ['Z2002', 'Z2004', 'Z2005', 'Z2007', 'Z2012', 'Z2017']
-                        },
-                        'proc_step_filter': 'not_contains',
-                        'index': ['coverage_id_col'],
-                        'columns': 'cost_elem_col'
-                    }
+                'proc_step_filter': 'not_contains',
+                'cost_elem_filter': 'not_contains',
+                'index': ['occ_year_col', 'proc_step_col', 'acc_change_col'],
+                'columns': 'date_col'
+            },
+            'table2': {
+                'title': 'Filtered In Cost Elements',
+                'filters': {
+                    'class_col': ['VFP'],
+                    'lifecycle_col': [20, 50],
+                    'sub_acc_col': '1',
+                    'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
+                    'cost_elem_col': ['6000']
                 },
-                {
-                    'title': 'G/L Account Analysis - LC',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'loss_comp_col': [1],
-                        'proc_step_col': ['Carry Forward', 'Release Margin', 'Value TC'],
-                        'desc_gl_col': '^(LRC|LIC).*VFA'
-                    },
-                    'proc_step_filter': 'not_contains',
-                    'desc_gl_filter': 'regex',
-                    'index': ['gl_col', 'desc_gl_col'],
-                    'columns': 'date_col'
-                }
-            ],
-            'CSM_VFA': [
-                {
-                    'title': 'בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'sub_acc_col': '1',
-                        'cost_elem_col': ['7010'],
-                        'proc_step_col': ['Carry Forward']
-                    },
-                    'proc_step_filter': 'not_contains',
-                    'index': 'coverage_id_col',
-                    'columns': None
+                'proc_step_filter': 'not_contains',
+                'cost_elem_filter': 'in',
+                'index': ['occ_year_col', 'proc_step_col', 'acc_change_col'],
+                'columns': 'date_col'
+            }
+        },
+        {
+            'title': 'מעגל LIC', 'type': 'custom_lic_cycle'
+        }
+    ],'LC_VFA': [
+        {
+            'layout': 'side_by_side',
+            'table1': {
+                'title': 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים',
+                'filters': {
+                    'class_col': ['VFP'],
+                    'lifecycle_col': [10],
+                    'sub_acc_col': '1',
+                    'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
+                    'loss_comp_col': [1],
+                    'cost_elem_col': ['6000', '3103', 'Z1012', 'Z4000', 'Z3100', 'Z1013', 'Z1017', 'ZR200', 'ZR100', 'ZR102', 'ZR202']
                 },
-                {
-                    'layout': 'side_by_side',
-                    'table1': {
-                        'title': 'מעגל CSM',
-                        'filters': {
-                            'cost_elem_col': ['7010'],
-                            'sub_acc_col': '1',
-                            'class_col': ['VFP'],
-                            'loss_comp_col': [0],
-                            'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)']
-                        },
-                        'proc_step_filter': 'not_contains',
-                        'index': ['proc_step_col', 'acc_change_col'],
-                        'columns': 'date_col'
-                    },
-                    'table2': {
-                        'title': 'מעגל F.V',
-                        'filters': {
-                            'cost_elem_col': ['Z6001'],
-                            'sub_acc_col': '1',
-                            'class_col': ['VFP'],
-                            'proc_step_col': ['Carry Forward']
-                        },
-                        'proc_step_filter': 'not_contains',
-                        'index': ['loss_comp_col', 'proc_step_col', 'acc_change_col', 'lifecycle_col'],
-                        'columns': 'date_col'
-                    }
+                'proc_step_filter': 'not_contains',
+                'index': ['coverage_id_col'],
+                'columns': 'cost_elem_col',
+                'exceptions_only': True,
+                'title_color': '90EE90'
+            },
+            'table2': {
+                'title': 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים',
+                'filters': {
+                    'class_col': ['VFP'],
+                    'lifecycle_col': [10],
+                    'sub_acc_col': '1',
+                    'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)'],
+                    'loss_comp_col': [1],
+                    'cost_elem_col': ['Z2002', 'Z2004', 'Z2005', 'Z2007', 'Z2012', 'Z2017']
                 },
-                {
-                    'title': 'מעגל CSM', 'type': 'custom_csm_cycle'
-                }
-            ],
-            'DAC': [
-                {
-                    'title': 'בדיקת מעגל DAC מתוך הריצות',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'cost_elem_col': ['3103']
-                    },
-                    'index': ['cost_elem_col', 'acc_change_col'],
-                    'columns': 'date_col'
+                'proc_step_filter': 'not_contains',
+                'index': ['coverage_id_col'],
+                'columns': 'cost_elem_col',
+                'exceptions_only': True
+            }
+        },
+        {
+            'title': 'G/L Account Analysis - LC',
+            'filters': {
+                'class_col': ['VFP'],
+                'loss_comp_col': [1],
+                'proc_step_col': ['Carry Forward', 'Release Margin', 'Value TC'],
+                'desc_gl_col': '^(LRC|LIC).*VFA'
+            },
+            'proc_step_filter': 'not_contains',
+            'desc_gl_filter': 'regex',
+            'index': ['gl_col', 'desc_gl_col'],
+            'columns': 'date_col'
+        }
+    ],
+    'CSM_VFA': [
+        {
+            'title': 'בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים',
+            'filters': {
+                'class_col': ['VFP'],
+                'sub_acc_col': '1',
+                'cost_elem_col': ['7010'],
+                'proc_step_col': ['Carry Forward']
+            },
+            'proc_step_filter': 'not_contains',
+            'index': 'coverage_id_col',
+            'columns': None
+        },
+        {
+            'layout': 'side_by_side',
+            'table1': {
+                'title': 'מעגל CSM',
+                'filters': {
+                    'cost_elem_col': ['7010'],
+                    'sub_acc_col': '1',
+                    'class_col': ['VFP'],
+                    'loss_comp_col': [0],
+                    'proc_step_col': ['Carry Forward', 'Release Margin(PE/DE Before Change)', 'Value TC(Ins. Contracts)(Period Start)']
                 },
-                {
-                    'title': 'בדיקות מעגל DAC מתוך crez3100',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'cost_elem_col': ['Z3100']
-                    },
-                    'index': ['cost_elem_col', 'acc_change_col'],
-                    'columns': 'date_col'
+                'proc_step_filter': 'not_contains',
+                'index': ['proc_step_col', 'acc_change_col'],
+                'columns': 'date_col'
+            },
+            'table2': {
+                'title': 'מעגל F.V',
+                'filters': {
+                    'cost_elem_col': ['Z6001'],
+                    'sub_acc_col': '1',
+                    'class_col': ['VFP'],
+                    'proc_step_col': ['Carry Forward']
                 },
-                {
-                    'title': 'בדיקת מעגל DAC מתוך ה G/L',
-                    'filters': {
-                        'class_col': ['VFP'],
-                        'desc_gl_col': ['Actual Acquisition Cost - P&L VFA', 'LRC Acq.Cost amortization Expenses P&L   VFA']
-                    },
-                    'index': ['gl_col', 'desc_gl_col'],
-                    'columns': 'date_col'
-                }
-            ]
-
+                'proc_step_filter': 'not_contains',
+                'index': ['loss_comp_col', 'proc_step_col', 'acc_change_col', 'lifecycle_col'],
+                'columns': 'date_col'
+            }
+        },
+        {
+            'title': 'מעגל CSM', 'type': 'custom_csm_cycle'
         }
+    ],
+    'DAC': [
+        {
+            'title': 'בדיקת מעגל DAC מתוך הריצות',
+            'filters': {
+                'class_col': ['VFP'],
+                'cost_elem_col': ['3103']
+            },
+            'index': ['cost_elem_col', 'acc_change_col'],
+            'columns': 'date_col'
+        },
+        {
+            'title': 'בדיקות מעגל DAC מתוך crez3100',
+            'filters': {
+                'class_col': ['VFP'],
+                'cost_elem_col': ['Z3100']
+            },
+            'index': ['cost_elem_col', 'acc_change_col'],
+            'columns': 'date_col'
+        },
+        {
+            'title': 'בדיקת מעגל DAC מתוך ה G/L',
+            'filters': {
+                'class_col': ['VFP'],
+                'desc_gl_col': ['Actual Acquisition Cost - P&L VFA', 'LRC Acq.Cost amortization Expenses P&L   VFA']
+            },
+            'index': ['gl_col', 'desc_gl_col'],
+            'columns': 'date_col'
+        }
+    ]
+
+}
+
+def sum_pivot(df, values, index, columns=None, column_filter=None, exceptions_tolerance=None, margins_name='Grand Total'):
+    """Sums values into an index x columns pivot with margins, equal to pd.pivot_table(..., aggfunc='sum', fill_value=0, margins=True, observed=True).
+
+    column_filter keeps the listed headers that occur (all of them when none does); exceptions_tolerance keeps only rows beyond it."""
+    cell_sums, row_totals, column_totals, total, kept = pivot_partial_sums(df, values, index, columns, column_filter)
+    return shape_sum_pivot(cell_sums, row_totals, column_totals, total, columns, kept, exceptions_tolerance, margins_name)
+
+def pivot_partial_sums(df, values, index, columns=None, column_filter=None):
+    """Returns the additive (cell_sums, row_totals, column_totals, total, kept) a sum pivot is laid out from (see shape_sum_pivot)."""
+    index = index if isinstance(index, list) else [index]
+    keys = index + ([columns] if columns else [])
+    cells = df[keys + [values]]
+    # Rows with a missing key drop out of the groupbys by themselves, but must also be left out of
+    # the margins. The cells are still grouped from all rows: pandas' unstack does not always keep
+    # the rows sorted when some keys are missing, and pivot_table shows that same order.
+    data = cells[cells.notna().all(axis=1)]
+    row_totals = data.groupby(index, observed=True)[values].sum()
+    total = data[values].sum()
+    if not columns:
+        return None, row_totals, None, total, []
+
+    column_totals = data.groupby(columns, observed=True)[values].sum()
+    kept = kept_pivot_columns(column_totals, column_filter)
+    if kept:
+        cells = cells[cells[columns].isin(column_totals.index[column_totals.index.map(pivot_column_label).isin(kept)])]
+    return cells.groupby(keys, observed=True)[values].sum(), row_totals, column_totals, total, kept
+
+def kept_pivot_columns(column_totals, column_filter):
+    """Returns the column_filter headers that occur among column_totals' columns, in filter order."""
+    labels = column_totals.index.map(pivot_column_label)
+    return [label for label in column_filter or [] if label in labels]
+
+def shape_sum_pivot(cell_sums, row_totals, column_totals, total, columns=None, kept=None, exceptions_tolerance=None, margins_name='Grand Total'):
+    """Lays the sums of pivot_partial_sums out as a pivot with Grand Total margins (see sum_pivot)."""
+    index = list(row_totals.index.names)
+    margin_key = (margins_name,) + ('',) * (len(index) - 1) if len(index) > 1 else margins_name
+    if not columns:
+        table = row_totals.to_frame()
+        if exceptions_tolerance is not None:
+            table = table[row_totals.abs() > exceptions_tolerance]
+        margin = pd.DataFrame({row_totals.name: [total]}, index=pd.Index([margin_key]))
+        table = pd.concat([table, margin])
+        table.index.names = index
+        return table
+
+    if column_totals.empty:
+        # No cells means no margins either; keep the empty pivot's axes
+        return label_date_columns(cell_sums.unstack(columns))
+    if kept:
+        column_totals = column_totals[column_totals.index.map(pivot_column_label).isin(kept)]
+        cell_sums = cell_sums[cell_sums.index.get_level_values(columns).isin(column_totals.index)]
+    if exceptions_tolerance is not None:
+        beyond = (cell_sums.abs() > exceptions_tolerance).groupby(level=index, observed=True).any()
+        beyond = beyond.reindex(row_totals.index, fill_value=False) | (row_totals.abs() > exceptions_tolerance)
+        row_totals = row_totals[beyond]
+        cell_sums = cell_sums[cell_sums.index.droplevel(columns).isin(row_totals.index)]
+    table = cell_sums.unstack(columns, fill_value=0).sort_index(axis=1)
+    if kept or exceptions_tolerance is not None:
+        # Rows with amounts only in the dropped columns still get a line, as in the full pivot, and
+        # columns stay even when no exception row has an amount in them
+        table = table.reindex(index=row_totals.index, columns=column_totals.index, fill_value=0)
+    table.columns = pd.Index([pivot_column_label(value) for value in table.columns], name=columns)
+    table[margins_name] = row_totals
+    margin = column_totals.set_axis(table.columns[:-1].tolist()).reindex(table.columns)
+    margin[margins_name] = total
+    table = pd.concat([table, margin.to_frame(margin_key).T])
+    table.index.names = index
+    return table[kept + [margins_name]] if kept else table
+
+def pivot_spec_args(spec, all_cols):
+    """Returns a pivot spec's (index columns, column or None, column_filter, exceptions tolerance or None)."""
+    index_cols = [all_cols[i] for i in spec['index']] if isinstance(spec['index'], list) else [all_cols[spec['index']]]
+    column_col = all_cols[spec['columns']] if spec.get('columns') else None
+    tolerance = spec.get('exceptions_tolerance', EXCEPTIONS_TOLERANCE) if spec.get('exceptions_only') else None
+    return index_cols, column_col, spec.get('column_filter'), tolerance
+
+def spec_pivot_table(filtered_df, spec, all_cols):
+    """Sums a filtered frame's amounts into the spec's pivot, applying its column_filter and exceptions_only."""
+    return sum_pivot(filtered_df, all_cols['amount_col'], *pivot_spec_args(spec, all_cols))
+
+def table_filters(spec, d_filters):
+    """Returns the filters shown above a spec's table, noting when only exception rows are written."""
+    if not spec.get('exceptions_only'):
+        return d_filters
+    tolerance = spec.get('exceptions_tolerance', EXCEPTIONS_TOLERANCE)
+    return {**d_filters, 'Rows shown': f"Only rows with an amount beyond ±{tolerance:g} (Grand Total covers all rows)"}
+
+def _sql_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _sql_literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+def duckdb_filter_sql(key, all_cols):
+    """Translates a compile_filter key into a DuckDB predicate that treats missing values like pandas."""
+    col_name, op, arg = key
+    column = _sql_ident(all_cols[col_name])
+    text = f"CAST({column} AS VARCHAR)"
+    if op in ('not_contains', 'not_in'):
+        # pandas keeps the rows with a missing value when the test is negated
+        if op == 'not_contains':
+            return f"coalesce(NOT regexp_matches({text}, {_sql_literal(arg)}, 'i'), true)"
+        return f"coalesce({column} NOT IN ({', '.join(map(_sql_literal, arg))}), true)" if arg else 'true'
+    if op == 'match':
+        sql = f"regexp_matches({text}, {_sql_literal('^(?:' + arg + ')')})"
+    elif op == 'startswith':
+        prefixes = (arg,) if isinstance(arg, str) else arg
+        sql = ' OR '.join(f"starts_with({text}, {_sql_literal(prefix)})" for prefix in prefixes) or 'false'
+    elif op in ('contains', 'regex'):
+        sql = f"regexp_matches({text}, {_sql_literal(arg)}, 'i')"
+    else:
+        sql = f"{column} IN ({', '.join(map(_sql_literal, arg))})" if arg else 'false'
+    return f"coalesce({sql}, false)"
+
+def arrow_filter_mask(column, key):
+    """Evaluates a compile_filter key on an Arrow column with pyarrow.compute; returns a numpy bool mask."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    _, op, arg = key
+    column = column.combine_chunks()
+    values = column.dictionary if pa.types.is_dictionary(column.type) else column
+    text = values if pa.types.is_string(values.type) or pa.types.is_large_string(values.type) else pc.cast(values, pa.string())
+    if op == 'match':
+        result = pc.match_substring_regex(text, '^(?:' + arg + ')')
+    elif op == 'startswith':
+        result = pa.array(np.zeros(len(values), dtype=bool))
+        for prefix in (arg,) if isinstance(arg, str) else arg:
+            result = pc.or_(result, pc.starts_with(text, prefix))
+    elif op in ('contains', 'regex', 'not_contains'):
+        result = pc.match_substring_regex(text, arg, ignore_case=True)
+    else:
+        result = pc.is_in(values, value_set=pa.array(list(arg), type=values.type))
+    if op in ('not_contains', 'not_in'):
+        result = pc.invert(result)
+    if values is not column:
+        result = pc.take(result, column.indices)
+    # pandas keeps the rows with a missing value when the test is negated, and drops them otherwise
+    return pc.fill_null(result, op in ('not_contains', 'not_in')).to_numpy(zero_copy_only=False)
+
+def engine_group_sums(result, keys, values, dtypes):
+    """Turns an engine's long result (keys + summed values) into a Series indexed like a pandas groupby sum."""
+    result = result.astype({key: dtypes[key] for key in keys})
+    # unstack lays a pivot's rows out by level codes, so the levels must be those of an observed
+    # groupby: only the categories that occur, in category order
+    for key in keys:
+        if isinstance(result[key].dtype, pd.CategoricalDtype):
+            result[key] = result[key].cat.remove_unused_categories()
+    return result.set_index(keys)[values].sort_index()
+
+class DuckDBFilterPlan(FilterPlan):
+    """FilterPlan that runs the filters, and each sum pivot as one GROUPING SETS query, in an in-process DuckDB database."""
+
+    def __init__(self, df, all_cols):
+        import duckdb
+        import pyarrow as pa
+
+        super().__init__(df, all_cols)
+        self.con = duckdb.connect()
+        self.con.register('slpd', pa.Table.from_pandas(df[list(all_cols.values())], preserve_index=False))
+
+    def mask(self, key, predicate):
+        if key not in self._masks:
+            result = self.con.execute(f"SELECT {duckdb_filter_sql(key, self.all_cols)} AS mask FROM slpd").fetchnumpy()
+            self._masks[key] = np.asarray(result['mask'], dtype=bool)
+        return self._masks[key]
+
+    def pivot(self, spec):
+        keys, _ = self.compile(spec)
+        index, columns, column_filter, tolerance = pivot_spec_args(spec, self.all_cols)
+        values = self.all_cols['amount_col']
+        group_cols = index + ([columns] if columns else [])
+        quoted = [_sql_ident(col) for col in group_cols]
+        where = [duckdb_filter_sql(key, self.all_cols) for key in keys] + [f"{col} IS NOT NULL" for col in quoted]
+        index_set = ', '.join(quoted[:len(index)])
+        sets = [f"({', '.join(quoted)})", f"({index_set})", f"({quoted[-1]})", "()"] if columns else [f"({index_set})", "()"]
+        result = self.con.execute(
+            f"SELECT {', '.join(quoted)}, SUM({_sql_ident(values)}) AS {_sql_ident(values)}, GROUPING({', '.join(quoted)}) AS grouping_id "
+            f"FROM slpd WHERE {' AND '.join(where)} GROUP BY GROUPING SETS ({', '.join(sets)})").df()
+
+        def rolled_up(*cols):
+            # GROUPING() sets one bit per rolled-up column, the last column in the lowest bit
+            return result[result['grouping_id'] == sum(1 << (len(group_cols) - 1 - group_cols.index(col)) for col in cols)]
 
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Source_Data', index=False)
-            table_positions = {}
+        total = rolled_up(*group_cols)[values].fillna(0).sum()
+        row_totals = engine_group_sums(rolled_up(*group_cols[len(index):]), index, values, self.df.dtypes)
+        if not columns:
+            return shape_sum_pivot(None, row_totals, None, total, exceptions_tolerance=tolerance)
+        column_totals = engine_group_sums(rolled_up(*index), [columns], values, self.df.dtypes)
+        cell_sums = engine_group_sums(rolled_up(), group_cols, values, self.df.dtypes)
+        return shape_sum_pivot(cell_sums, row_totals, column_totals, total, columns, kept_pivot_columns(column_totals, column_filter), tolerance)
 
+class ArrowFilterPlan(FilterPlan):
+    """FilterPlan that runs the filters and sum pivots with pyarrow.compute on an Arrow copy of the frame."""
+
+    def __init__(self, df, all_cols):
+        import pyarrow as pa
+
+        super().__init__(df, all_cols)
+        self.table = pa.Table.from_pandas(df[list(all_cols.values())], preserve_index=False)
+
+    def mask(self, key, predicate):
+        if key not in self._masks:
+            self._masks[key] = arrow_filter_mask(self.table.column(self.all_cols[key[0]]), key)
+        return self._masks[key]
+
+    def pivot(self, spec):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        keys, _ = self.compile(spec)
+        index, columns, column_filter, tolerance = pivot_spec_args(spec, self.all_cols)
+        values = self.all_cols['amount_col']
+        group_cols = index + ([columns] if columns else [])
+        rows = self.table.select(group_cols + [values]).filter(pa.array(self.combined_mask(keys))).drop_null()
+
+        def group_sums(by):
+            result = rows.group_by(by).aggregate([(values, 'sum')]).to_pandas()
+            return engine_group_sums(result.rename(columns={f"{values}_sum": values}), by, values, self.df.dtypes)
+
+        total = pc.sum(rows.column(values)).as_py() or 0.0
+        row_totals = group_sums(index)
+        if not columns:
+            return shape_sum_pivot(None, row_totals, None, total, exceptions_tolerance=tolerance)
+        column_totals = group_sums([columns])
+        return shape_sum_pivot(group_sums(group_cols), row_totals, column_totals, total, columns, kept_pivot_columns(column_totals, column_filter), tolerance)
+
+EXECUTION_BACKENDS = {'pandas': FilterPlan, 'duckdb': DuckDBFilterPlan, 'arrow': ArrowFilterPlan}
+
+def open_filter_plan(df, all_cols, backend='pandas'):
+    """Creates the FilterPlan that filters and pivots df on backend ('pandas', 'duckdb' or 'arrow')."""
+    if backend not in EXECUTION_BACKENDS:
+        raise ValueError(f"Unknown execution backend '{backend}'. Expected one of {tuple(EXECUTION_BACKENDS)}.")
+    return EXECUTION_BACKENDS[backend](df, all_cols)
+
+def cycle_inputs(filter_plan, sheet_name, pivots):
+    """Returns the two source frames of the sheet group's cycle table, taken from its side_by_side tables."""
+    for pivot_spec in pivots:
+        if pivot_spec.get('layout') != 'side_by_side':
+            continue
+        # Extract PVBE and RA data for LRC cycle if this is LRC_VFA_Report
+        if sheet_name == 'LRC_VFA_Report':
+            cycle_type = 'custom_lrc_cycle'
+        # Extract Filtered Out and Filtered In data for LIC cycle if this is LIC_VFA
+        elif sheet_name == 'LIC_VFA' and pivot_spec['table1']['title'] == 'Filtered Out Cost Elements':
+            cycle_type = 'custom_lic_cycle'
+        # Extract CSM and F.V data for CSM cycle if this is CSM_VFA
+        elif sheet_name == 'CSM_VFA' and pivot_spec['table1']['title'] == 'מעגל CSM':
+            cycle_type = 'custom_csm_cycle'
+        else:
+            continue
+        return {cycle_type: (filter_plan.filter(pivot_spec['table1'])[0], filter_plan.filter(pivot_spec['table2'])[0])}
+    return {}
+
+CYCLE_TABLE_BUILDERS = {
+    'custom_lrc_cycle': create_lrc_cycle_table,
+    'custom_lic_cycle': create_lic_cycle_table,
+    'custom_csm_cycle': create_csm_cycle_table,
+}
+
+def compute_sheet_group(filter_plan, sheet_name, pivots, all_cols, cycle_history_dir=None, profiler=None, coverage_checks=False):
+    """Filters and aggregates one sheet group; returns its blocks (lists of side-by-side table dicts) in layout order."""
+    profiler = profiler or NullProfiler()
+    rows = len(filter_plan.df)
+    inputs = cycle_inputs(filter_plan, sheet_name, pivots)
+    blocks = []
+    for pivot_spec in pivots:
+        if pivot_spec.get('type') in CYCLE_TABLE_BUILDERS:
+            df1, df2 = inputs.get(pivot_spec['type'], (pd.DataFrame(), pd.DataFrame()))
+            with profiler.stage(f"cycle/{sheet_name}/{pivot_spec['title']}", rows_in=len(df1) + len(df2)) as record:
+                table = CYCLE_TABLE_BUILDERS[pivot_spec['type']](df1, df2, pivot_spec, all_cols, cycle_history_dir)
+                record['rows_out'] = len(table['pivot_df'])
+            if coverage_checks:
+                with profiler.stage(f"coverage/{sheet_name}/{pivot_spec['title']}", rows_in=len(df1) + len(df2)) as record:
+                    table['coverage_check'] = coverage_check_table(pivot_spec['type'], (df1, df2), pivot_spec, all_cols)
+                    record['rows_out'] = len(table['coverage_check']['pivot_df'])
+            blocks.append([table])
+        elif pivot_spec.get('layout') == 'side_by_side':
+            tables = []
+            for spec in (pivot_spec['table1'], pivot_spec['table2']):
+                with profiler.stage(f"filter/{sheet_name}/{spec['title']}", rows_in=rows) as record:
+                    filtered_df, d_filters = filter_plan.filter(spec)
+                    record['rows_out'] = len(filtered_df)
+                with profiler.stage(f"pivot/{sheet_name}/{spec['title']}", rows_in=len(filtered_df)) as record:
+                    pivot_df = filter_plan.pivot(spec)
+                    record['rows_out'] = len(pivot_df)
+                tables.append({'title': spec['title'], 'pivot_df': pivot_df, 'filters': table_filters(spec, d_filters)})
+            blocks.append(tables)
+        else:
+            with profiler.stage(f"filter/{sheet_name}/{pivot_spec['title']}", rows_in=rows) as record:
+                df_filtered, d_filters = filter_plan.filter(pivot_spec)
+                record['rows_out'] = len(df_filtered)
+            with profiler.stage(f"pivot/{sheet_name}/{pivot_spec['title']}", rows_in=len(df_filtered)) as record:
+                pivot_df = filter_plan.pivot(pivot_spec)
+                record['rows_out'] = len(pivot_df)
+
+            blocks.append([{'title': pivot_spec['title'], 'pivot_df': pivot_df, 'filters': table_filters(pivot_spec, d_filters), 'title_color': pivot_spec.get('title_color')}])
+    return blocks
+
+def plan_sheet_group(sheet_name, blocks, table_positions):
+    """Places a sheet group's blocks as (table, start_row, start_col) placements, recording each title row for the TOC."""
+    placements = []
+    current_row = 1
+    table_positions[sheet_name] = []
+    for tables in blocks:
+        start_col = 1
+        row_after = current_row
+        for table in tables:
+            table_positions[sheet_name].append((table['title'], current_row))
+            placements.append((table, current_row, start_col))
+            row_after = max(row_after, pivot_block_end_row(table['pivot_df'], current_row, table['title'], table['filters']))
+            start_col += table['pivot_df'].shape[1] + 4
+        current_row = row_after + 10
+    return placements
+
+def write_sheet_placements(writer, sheet_name, placements, profiler=None):
+    """Writes planned tables (see plan_sheet_group) with write_pivot_to_sheet."""
+    profiler = profiler or NullProfiler()
+    for table, start_row, start_col in placements:
+        with profiler.stage(f"layout/{sheet_name}/{table['title']}", rows_in=len(table['pivot_df'])):
+            write_pivot_to_sheet(writer, sheet_name, table['pivot_df'], start_row=start_row, title=table['title'],
+                                 filters=table['filters'], title_color=table.get('title_color'), start_col=start_col)
+
+def layout_sheet_group(writer, sheet_name, blocks, table_positions, profiler=None):
+    """Plans a sheet group's blocks (see plan_sheet_group) and hands them to the writer."""
+    writer.write_sheet_group(sheet_name, plan_sheet_group(sheet_name, blocks, table_positions), profiler)
+
+# Source frame of the sheet-group worker processes, set once per process by the pool initializer
+_worker_state = {}
+
+def _init_sheet_group_worker(df, all_cols, cycle_history_dir, backend, coverage_checks):
+    _worker_state['filter_plan'] = open_filter_plan(df, all_cols, backend)
+    _worker_state['all_cols'] = all_cols
+    _worker_state['cycle_history_dir'] = cycle_history_dir
+    _worker_state['coverage_checks'] = coverage_checks
+
+def _compute_sheet_group_task(sheet_name, pivots):
+    return compute_sheet_group(_worker_state['filter_plan'], sheet_name, pivots, _worker_state['all_cols'], _worker_state['cycle_history_dir'],
+                               coverage_checks=_worker_state['coverage_checks'])
+
+@contextlib.contextmanager
+def sheet_group_runner(df, pivot_groups, all_cols, workers=None, cycle_history_dir=None, profiler=None, backend='pandas', coverage_checks=False):
+    """Starts computing the sheet groups and yields a function returning a group's blocks by sheet name.
+
+    Groups run in a process pool with several workers (by default from PARALLEL_SHEET_GROUPS_MIN_ROWS rows), else in-process."""
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(df) >= PARALLEL_SHEET_GROUPS_MIN_ROWS else 1
+    workers = min(workers, len(pivot_groups))
+    if workers <= 1 or profiler:
+        filter_plan = open_filter_plan(df, all_cols, backend)
+        yield lambda sheet_name: compute_sheet_group(filter_plan, sheet_name, pivot_groups[sheet_name], all_cols, cycle_history_dir, profiler, coverage_checks)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_sheet_group_worker,
+                             initargs=(df, all_cols, cycle_history_dir, backend, coverage_checks)) as executor:
+        futures = {sheet_name: executor.submit(_compute_sheet_group_task, sheet_name, pivots) for sheet_name, pivots in pivot_groups.items()}
+        yield lambda sheet_name: futures[sheet_name].result()
+
+def write_report_toc(writer, table_positions, undated=(0, 0.0)):
+    """Writes the table of contents sheet, linking each check to its table's title row."""
+    toc_data = [
+        ('VFP Checks', '', '', 'sheet_header'),
+        ('בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים - VFP', 'LRC_VFA_Report', 'המטרה לבדוק את כללי הגזירה של החשבונות המאזניים בlrc', 'table'),
+        ('G/L Account Analysis - VFP', 'LRC_VFA_Report', 'המטרה לבדוק סבירות ההיוונים על capture עבור כל CRE בנפרד', 'table'),
+        ('בדיקת סבירות היוונים - VFP', 'LRC_VFA_Report', 'בסיקת סבירות של רכיב הסיכון מתוך תביעות', 'table'),
+        ('בדיקת סבירות RA - VFP', 'LRC_VFA_Report', 'הבדיקה עבור מעגל LRC', 'table'),
+        ('מעגל LRC', 'LRC_VFA_Report', 'הבדיקה עבור מעגל LRC', 'table'),
+        ('LC VFA Checks', '', '', 'sheet_header'),
+        ('בדיקת סיווג רכיבי LC לחשבונות GL הנכונים', 'LC_VFA', 'המטרה לבדוק את כללי הגזירה של החשבונות המאזניים בlic', 'table'),
+        ('CSM Checks', '', '', 'sheet_header'),
+        ('בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים', 'CSM_VFA', 'המטרה לבדוק את כללי הגזירה של החשבונות', 'table'),
+        ('DAC Checks', '', '', 'sheet_header'),
+        ('בדיקת מעגל DAC מתוך הריצות', 'DAC', 'המטרה לבדוק כי מעגל DAC מחושב מריצות נכונות', 'table'),
+        ('בדיקות מעגל DAC מתוך crez3100', 'DAC', 'המטרה לבדוק כי כל הCRE שאמורים להיות נכללו במעגל', 'table'),
+        ('בדיקת מעגל DAC מתוך ה G/L', 'DAC', 'המטרה לבדוק את כללי הגזירה של החשבונות במעגל', 'table'),
+    ]
+
+    # Create a mapping of TOC names to actual table titles
+    title_mapping = {
+        'בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים - VFP': 'בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים',
+        'G/L Account Analysis - VFP': 'G/L Account Analysis',
+        'בדיקת סבירות היוונים - VFP': 'בדיקת סבירות היוונים',
+        'בדיקת סבירות RA - VFP': 'בדיקת סבירות RA',
+        'בדיקת סיווג רכיבי LRC - Filtered Cost Elements': 'בדיקת סיווג רכיבי LRC - Filtered Cost Elements',
+        'בדיקת סיווג רכיבי LRC - CRE 6000 Only': 'בדיקת סיווג רכיבי LRC - CRE 6000 Only',
+        'מעגל LRC': 'מעגל LRC',
+        'בדיקת סיווג רכיבי LIC לחשבונות GL הנכונים': 'בדיקת סיווג רכיבי LIC לחשבונות GL הנכונים',
+        'G/L Account Analysis - Carry Forward VFP': 'G/L Account Analysis - Carry Forward VFP',
+        'בדיקת היוונים עבור כל CRE': 'בדיקת סבירות היוונים',
+        'בדיקת סבירות RA': 'בדיקת סבירות RA',
+        'Filtered Out Cost Elements': 'Filtered Out Cost Elements',
+        'Filtered In Cost Elements': 'Filtered In Cost Elements',
+        'מעגל LIC': 'מעגל LIC',
+        'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים': 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים',
+        'G/L Account Analysis - LC': 'G/L Account Analysis - LC',
+        'בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים': 'בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים',
+        'מעגל CSM': 'מעגל CSM',
+        'מעגל F.V': 'מעגל F.V',
+        'בדיקת מעגל DAC מתוך הריצות': 'בדיקת מעגל DAC מתוך הריצות',
+        'בדיקות מעגל DAC מתוך crez3100': 'בדיקות מעגל DAC מתוך crez3100',
+        'בדיקת מעגל DAC מתוך ה G/L': 'בדיקת מעגל DAC מתוך ה G/L'
+    }
+
+    toc_rows = []
+    for idx, (check_name, sheet_link, explanation, row_type) in enumerate(toc_data, start=2):
+        link = None
+        if row_type == 'table' and sheet_link:
+            # Find the specific table position with exact title matching
+            table_row = 1  # Default to A1
+            target_title = title_mapping.get(check_name, check_name)
+            for title, row_pos in table_positions.get(sheet_link, []):
+                if title == target_title:
+                    table_row = row_pos
+                    break
+            link = (sheet_link, table_row)
+
+        kind = 'section' if row_type == 'sheet_header' else 'table'
+        if idx == len(toc_data) + 1:  # Last row gets same color as headers
+            kind = 'final'
+        toc_rows.append({'check': check_name, 'link': link, 'explanation': explanation, 'kind': kind})
+
+    undated_rows, undated_amount = undated
+    if undated_rows:
+        toc_rows.append({'check': 'Rows without a posting date', 'link': None, 'kind': 'section',
+                         'explanation': f"{undated_rows} row(s) amounting to {undated_amount:,.2f} have no posting date that could be parsed and are left out of the date tables and cycles"})
+
+    writer.write_toc('ריכוז בדיקות', ['הבדיקה', 'לינק לבדיקה', 'הסבר'], toc_rows)
+
+def create_final_report(file_path, output_path, use_cache=True, cache_dir=None, reader_engine='auto', source_data_mode='full', writer_backend='openpyxl', workers=None, cycle_history_dir=None, profiler=None, execution_backend='pandas', memory_budget_mb=None, save_results=False, results_format='parquet', excel=True, coverage_checks=False, exceptions_only=False, raise_errors=False):
+    """Builds the check report for one SLPD export.
+
+    save_results keeps the tables' cells for diff_report_results (excel=False skips the workbook), and
+    memory_budget_mb streams the export in batches as create_consolidated_report does."""
+    if memory_budget_mb:
+        return create_consolidated_report([file_path], output_path, use_cache=use_cache, cache_dir=cache_dir, reader_engine=reader_engine,
+                                          writer_backend=writer_backend, profiler=profiler, memory_budget_mb=memory_budget_mb,
+                                          save_results=save_results, results_format=results_format, excel=excel,
+                                          coverage_checks=coverage_checks, exceptions_only=exceptions_only, raise_errors=raise_errors)
+    save_results = save_results or not excel
+    if cycle_history_dir:
+        cycle_history_dir = cycle_history_input_dir(cycle_history_dir, file_path)
+    try:
+        all_cols = ALL_COLS
+        stages = profiler or NullProfiler()
+        total = stages.start('total')
+        with stages.stage('read') as record:
+            df = load_slpd_data(file_path, all_cols, use_cache=use_cache, cache_dir=cache_dir, reader_engine=reader_engine)
+            record['rows_out'] = len(df)
+        undated = undated_totals(df, all_cols)
+
+        pivot_groups = PIVOT_GROUPS if exceptions_only else full_pivot_groups(PIVOT_GROUPS)
+
+        report_writer = open_report_writer(output_path, writer_backend) if excel else contextlib.nullcontext()
+        with sheet_group_runner(df, pivot_groups, all_cols, workers, cycle_history_dir, profiler, execution_backend, coverage_checks) as compute_group, report_writer as writer:
+            if writer:
+                with stages.stage('source_data', rows_in=len(df)):
+                    writer.write_source_data(with_date_labels(df, all_cols), mode=source_data_mode)
+            table_positions, report_tables, coverage_blocks = {}, [], []
+            for sheet_name in pivot_groups:
+                with stages.stage(f"sheet/{sheet_name}"):
+                    blocks = compute_group(sheet_name)
+                    if writer:
+                        layout_sheet_group(writer, sheet_name, blocks, table_positions, profiler)
+                report_tables.extend(sheet_report_tables(sheet_name, blocks))
+                coverage_blocks.extend([table['coverage_check']] for tables in blocks for table in tables if 'coverage_check' in table)
+            report_tables.extend(sheet_report_tables('Coverage_Checks', coverage_blocks))
+
+            if writer:
+                if coverage_blocks:
+                    with stages.stage('sheet/Coverage_Checks'):
+                        layout_sheet_group(writer, 'Coverage_Checks', coverage_blocks, table_positions, profiler)
+                write_report_toc(writer, table_positions, undated)
+                if profiler:
+                    # saving happens after the sheet is written, so 'save' and 'total' are in the JSON only
+                    profiler.write_sheet(writer)
+            save = stages.start('save')
+        stages.finish(save)
+        if save_results:
+            with stages.stage('results'):
+                results_path = report_results_path(output_path, results_format)
+                save_report_results(results_path, report_tables, [file_path], results_format, undated)
+        stages.finish(total)
+        if profiler:
+            profiler.write_json(profile_json_path(output_path))
+
+        print(f"\nSuccessfully created the report:\n{output_path if excel else results_path}")
+        return True
+
+    except Exception as e:
+        if profiler:
+            profiler.close()
+        if raise_errors:
+            raise
+        print(f"\nAn error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def _with_entity_level(sums, entity):
+    return None if sums is None else pd.concat({entity: sums}, names=['Entity'])
+
+def aggregate_entity(df, pivot_groups, all_cols, entity=None, coverage_checks=False):
+    """Reduces one entity's rows to the additive partial sums of its tables: {sheet_name: blocks} in compute_sheet_group's order."""
+    filter_plan = FilterPlan(df, all_cols)
+    partials, coverage_cells = {}, []
+    for sheet_name, pivots in pivot_groups.items():
+        inputs = cycle_inputs(filter_plan, sheet_name, pivots)
+        blocks = []
+        for pivot_spec in pivots:
+            if pivot_spec.get('type') in CYCLE_TABLE_LAYOUTS:
+                components = CYCLE_TABLE_LAYOUTS[pivot_spec['type']]['components']
+                cells = cycle_cells(dict(zip(components, inputs[pivot_spec['type']])), all_cols)
+                if entity is not None:
+                    cells['entity'] = entity
+                blocks.append(cells)
+                if coverage_checks:
+                    coverage_cells.append(cycle_cells(dict(zip(components, inputs[pivot_spec['type']])), all_cols,
+                                                      coverage_col=all_cols['coverage_id_col']))
+                continue
+            specs = (pivot_spec['table1'], pivot_spec['table2']) if pivot_spec.get('layout') == 'side_by_side' else (pivot_spec,)
+            tables = []
+            for spec in specs:
+                filtered_df, d_filters = filter_plan.filter(spec)
+                index_cols, column_col, column_filter, _ = pivot_spec_args(spec, all_cols)
+                cell_sums, row_totals, column_totals, total, _ = pivot_partial_sums(filtered_df, all_cols['amount_col'], index_cols, column_col, column_filter)
+                if entity is not None:
+                    cell_sums, row_totals = _with_entity_level(cell_sums, entity), _with_entity_level(row_totals, entity)
+                tables.append(((cell_sums, row_totals, column_totals, total), d_filters))
+            blocks.append(tables)
+        partials[sheet_name] = blocks
+    if coverage_checks:
+        partials['Coverage_Checks'] = coverage_cells
+    return partials
+
+def _non_empty(parts):
+    # An entity or batch without rows for a table has empty index levels of another dtype (object
+    # instead of datetime categories, say), which pd.concat cannot combine with the others
+    return [part for part in parts if len(part)] or parts[:1]
+
+def _merge_sums(parts):
+    if parts[0] is None:
+        return None
+    merged = pd.concat(_non_empty(parts))
+    return merged.groupby(level=list(range(merged.index.nlevels)), sort=True, observed=True).sum()
+
+def _merge_cycle_cells(parts):
+    cells = pd.concat(_non_empty(parts), ignore_index=True)
+    keys = [col for col in cells.columns if col != 'amount']
+    return cells.groupby(keys, sort=False, observed=True, as_index=False)['amount'].sum()
+
+def merge_entity_partials(entity_partials):
+    """Adds up several aggregate_entity results (entities, or batches of one export), cell by cell."""
+    merged = {}
+    for sheet_name, blocks in entity_partials[0].items():
+        merged[sheet_name] = []
+        for i, block in enumerate(blocks):
+            parts = [partials[sheet_name][i] for partials in entity_partials]
+            if isinstance(block, pd.DataFrame):
+                merged[sheet_name].append(_merge_cycle_cells(parts))
+                continue
+            tables = []
+            for j, (_, d_filters) in enumerate(block):
+                sums = [part[j][0] for part in parts]
+                tables.append(((_merge_sums([s[0] for s in sums]), _merge_sums([s[1] for s in sums]),
+                                _merge_sums([s[2] for s in sums]), sum(s[3] for s in sums)), d_filters))
+            merged[sheet_name].append(tables)
+    return merged
+
+def aggregate_slpd_file(file_path, pivot_groups, all_cols, entity=None, memory_budget_mb=None, use_cache=True, cache_dir=None, reader_engine='auto', coverage_checks=False):
+    """Reduces one SLPD export, streamed with memory_budget_mb, to its aggregate_entity partial sums.
+
+    Returns (partials, rows, amount, undated), undated being the undated_totals of the export."""
+    amount_col = all_cols['amount_col']
+    if not memory_budget_mb:
+        df = load_slpd_data(file_path, all_cols, use_cache=use_cache, cache_dir=cache_dir, reader_engine=reader_engine)
+        return aggregate_entity(df, pivot_groups, all_cols, entity, coverage_checks), len(df), df[amount_col].sum(), undated_totals(df, all_cols)
+    partials, rows, amount, undated = None, 0, 0.0, (0, 0.0)
+    for batch in stream_slpd_batches(file_path, all_cols, memory_budget_mb, reader_engine):
+        batch_partials = aggregate_entity(batch, pivot_groups, all_cols, entity, coverage_checks)
+        partials = batch_partials if partials is None else merge_entity_partials([partials, batch_partials])
+        rows += len(batch)
+        amount += batch[amount_col].sum()
+        undated = tuple(total + part for total, part in zip(undated, undated_totals(batch, all_cols)))
+    if partials is None:
+        empty = prepare_slpd_frame(pd.DataFrame({col: pd.Series(dtype=object) for col in all_cols.values()}), all_cols)
+        partials = aggregate_entity(empty, pivot_groups, all_cols, entity, coverage_checks)
+    return partials, rows, amount, undated
+
+def consolidated_cycle_table(cells, layout, by_entity=False):
+    """Lays a cycle table out from merged cycle cells; by_entity adds one table per entity above the consolidated one."""
+    quarters = sorted(cells.loc[cells['at'] == 'end', 'quarter'].unique())
+    consolidated = cycle_table_from_cells(cells, layout['components'], layout['rows'], quarters)
+    if not by_entity:
+        return consolidated
+    tables = {entity: cycle_table_from_cells(entity_cells, layout['components'], layout['rows'], quarters)
+              for entity, entity_cells in cells.groupby('entity', sort=True)}
+    tables['Consolidated'] = consolidated
+    return pd.concat(tables, names=['Entity', None])
+
+def consolidated_sheet_group(partials, sheet_name, pivots, all_cols, by_entity=False):
+    """Lays merged partial sums out as the sheet group's blocks (see compute_sheet_group)."""
+    blocks = []
+    for pivot_spec, block in zip(pivots, partials[sheet_name]):
+        if pivot_spec.get('type') in CYCLE_TABLE_LAYOUTS:
+            layout = CYCLE_TABLE_LAYOUTS[pivot_spec['type']]
+            blocks.append([{'title': pivot_spec['title'], 'pivot_df': consolidated_cycle_table(block, layout, by_entity),
+                            'filters': {'Data Source': layout['source']}}])
+            continue
+        side_by_side = pivot_spec.get('layout') == 'side_by_side'
+        specs = (pivot_spec['table1'], pivot_spec['table2']) if side_by_side else (pivot_spec,)
+        tables = []
+        for spec, ((cell_sums, row_totals, column_totals, total), d_filters) in zip(specs, block):
+            _, column_col, column_filter, tolerance = pivot_spec_args(spec, all_cols)
+            # the column_filter headers kept depend on what occurs across all entities
+            kept = kept_pivot_columns(column_totals, column_filter) if column_col else []
+            pivot_df = shape_sum_pivot(cell_sums, row_totals, column_totals, total, column_col, kept, tolerance)
+            table = {'title': spec['title'], 'pivot_df': pivot_df, 'filters': table_filters(spec, d_filters)}
+            if not side_by_side:
+                table['title_color'] = pivot_spec.get('title_color')
+            tables.append(table)
+        blocks.append(tables)
+    return blocks
+
+def entity_names_for(file_paths):
+    """Names each input's entity after its file name, suffixing a counter when two inputs share one."""
+    names, taken = [], set()
+    for file_path in file_paths:
+        stem = os.path.basename(file_path).split('.')[0]
+        name, counter = stem, 2
+        while name in taken:
+            name, counter = f"{stem}_{counter}", counter + 1
+        taken.add(name)
+        names.append(name)
+    return names
+
+def create_consolidated_report(file_paths, output_path, by_entity=False, entity_names=None, use_cache=True, cache_dir=None, reader_engine='auto', writer_backend='openpyxl', profiler=None, memory_budget_mb=None, save_results=False, results_format='parquet', excel=True, coverage_checks=False, exceptions_only=False, raise_errors=False):
+    """Builds one check report over several entities' exports, reducing one export at a time to partial sums.
+
+    by_entity adds an Entity level to the pivots and a cycle table per entity; other options work as in create_final_report."""
+    save_results = save_results or not excel
+    try:
+        all_cols = ALL_COLS
+        stages = profiler or NullProfiler()
+        total = stages.start('total')
+        pivot_groups = PIVOT_GROUPS if exceptions_only else full_pivot_groups(PIVOT_GROUPS)
+        entity_names = entity_names or entity_names_for(file_paths)
+        entity_partials, entity_rows = [], []
+        for entity, file_path in zip(entity_names, file_paths):
+            with stages.stage(f"entity/{entity}") as record:
+                partials, rows, amount, undated = aggregate_slpd_file(file_path, pivot_groups, all_cols, entity if by_entity else None, memory_budget_mb,
+                                                             use_cache=use_cache, cache_dir=cache_dir, reader_engine=reader_engine,
+                                                             coverage_checks=coverage_checks)
+                record['rows_in'] = rows
+                entity_partials.append(partials)
+                entity_rows.append({'Entity': entity, 'File': os.path.basename(file_path), 'Rows': rows, 'Amount': amount,
+                                    'Undated rows': undated[0], 'Undated amount': undated[1]})
+        with stages.stage('merge'):
+            partials = merge_entity_partials(entity_partials)
+            del entity_partials
+        undated = (sum(row['Undated rows'] for row in entity_rows), sum(row['Undated amount'] for row in entity_rows))
+
+        with open_report_writer(output_path, writer_backend) if excel else contextlib.nullcontext() as writer:
+            if writer:
+                entities = pd.DataFrame(entity_rows).set_index('Entity')
+                write_pivot_to_sheet(writer, 'Entities', entities, start_row=1, title='Consolidated entities',
+                                     filters={'By entity': 'Yes' if by_entity else 'No'})
+            table_positions, report_tables = {}, []
             for sheet_name, pivots in pivot_groups.items():
-                current_row = 1
-                table_positions[sheet_name] = []
-                
-                # Extract PVBE and RA data for LRC cycle if this is LRC_VFA_Report
-                pvbe_df, ra_df = pd.DataFrame(), pd.DataFrame()
-                if sheet_name == 'LRC_VFA_Report':
-                    # Find the side_by_side specification for source data
-                    for pivot_spec in pivots:
-                        if pivot_spec.get('layout') == 'side_by_side':
-                            pvbe_df, _ = get_filtered_df(df, pivot_spec['table1'], all_cols)
-                            ra_df, _ = get_filtered_df(df, pivot_spec['table2'], all_cols)
-                            break
-                
-                # Extract Filtered Out and Filtered In data for LIC cycle if this is LIC_VFA
-                filtered_out_df, filtered_in_df = pd.DataFrame(), pd.DataFrame()
-                if sheet_name == 'LIC_VFA':
-                    # Find the side_by_side specification for source data
-                    for pivot_spec in pivots:
-                        if pivot_spec.get('layout') == 'side_by_side' and pivot_spec['table1']['title'] == 'Filtered Out Cost Elements':
-                            filtered_out_df, _ = get_filtered_df(df, pivot_spec['table1'], all_cols)
-                            filtered_in_df, _ = get_filtered_df(df, pivot_spec['table2'], all_cols)
-                            break
-                
-                # Extract CSM and F.V data for CSM cycle if this is CSM_VFA
-                csm_df, fv_df = pd.DataFrame(), pd.DataFrame()
-                if sheet_name == 'CSM_VFA':
-                    # Find the side_by_side specification for source data
-                    for pivot_spec in pivots:
-                        if pivot_spec.get('layout') == 'side_by_side' and pivot_spec['table1']['title'] == 'מעגל CSM':
-                            csm_df, _ = get_filtered_df(df, pivot_spec['table1'], all_cols)
-                            fv_df, _ = get_filtered_df(df, pivot_spec['table2'], all_cols)
-                            break
-                
-                for pivot_spec in pivots:
-                    if pivot_spec.get('type') == 'custom_lrc_cycle':
-                        current_row = create_lrc_cycle_table(writer, sheet_name, pvbe_df, ra_df, pivot_spec, current_row, all_cols, table_positions)
-                    elif pivot_spec.get('type') == 'custom_lic_cycle':
-                        current_row = create_lic_cycle_table(writer, sheet_name, filtered_out_df, filtered_in_df, pivot_spec, current_row, all_cols, table_positions)
-                    elif pivot_spec.get('type') == 'custom_csm_cycle':
-                        current_row = create_csm_cycle_table(writer, sheet_name, csm_df, fv_df, pivot_spec, current_row, all_cols, table_positions)
-                    elif pivot_spec.get('layout') == 'side_by_side':
-                        spec1, spec2 = pivot_spec['table1'], pivot_spec['table2']
-                        df1, d_filters1 = get_filtered_df(df, spec1, all_cols)
-                        df2, d_filters2 = get_filtered_df(df, spec2, all_cols)
-                        
-                        pivot1_df = pd.pivot_table(df1, values=all_cols['amount_col'], index=[all_cols[i] for i in spec1['index']], columns=all_cols[spec1['columns']], aggfunc="sum", fill_value=0, margins=True, margins_name='Grand Total')
-                        pivot2_df = pd.pivot_table(df2, values=all_cols['amount_col'], index=[all_cols[i] for i in spec2['index']], columns=all_cols[spec2['columns']], aggfunc="sum", fill_value=0, margins=True, margins_name='Grand Total')
-                        
-                        table_positions[sheet_name].append((spec1['title'], current_row))
-                        row_after_1 = write_pivot_to_sheet(writer, sheet_name, pivot1_df, start_row=current_row, title=spec1['title'], filters=d_filters1)
-                        start_col_2 = pivot1_df.shape[1] + 5
-                        table_positions[sheet_name].append((spec2['title'], current_row))
-                        row_after_2 = write_pivot_to_sheet(writer, sheet_name, pivot2_df, start_row=current_row, title=spec2['title'], filters=d_filters2, start_col=start_col_2)
-                        current_row = max(row_after_1, row_after_2) + 10
-                    else:
-                        df_filtered, d_filters = get_filtered_df(df, pivot_spec, all_cols)
-                        
-                        index_cols = [all_cols[i] for i in pivot_spec['index']] if isinstance(pivot_spec['index'], list) else all_cols[pivot_spec['index']]
-                        column_col = all_cols[pivot_spec['columns']] if pivot_spec.get('columns') else None
-                        pivot_df = pd.pivot_table(df_filtered, values=all_cols['amount_col'], index=index_cols, columns=column_col, aggfunc="sum", fill_value=0, margins=True, margins_name='Grand Total')
-                        
-                        if 'column_filter' in pivot_spec:
-                            existing_columns = [col for col in pivot_spec['column_filter'] if col in pivot_df.columns]
-                            if existing_columns:
-                                if 'Grand Total' in pivot_df.columns: existing_columns.append('Grand Total')
-                                pivot_df = pivot_df[existing_columns]
-                        
-                        title_fill = PatternFill(start_color=pivot_spec['title_color'], end_color=pivot_spec['title_color'], fill_type="solid") if 'title_color' in pivot_spec else None
-                        table_positions[sheet_name].append((pivot_spec['title'], current_row))
-                        current_row = write_pivot_to_sheet(writer, sheet_name, pivot_df, start_row=current_row, title=pivot_spec['title'], filters=d_filters, title_fill=title_fill) + 10
-
-            # Create table of contents
-            toc_data = [
-                ('VFP Checks', '', '', 'sheet_header'),
-                ('בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים - VFP', 'LRC_VFA_Report', 'המטרה לבדוק את כללי הגזירה של החשבונות המאזניים בlrc', 'table'),
-                ('G/L Account Analysis - VFP', 'LRC_VFA_Report', 'המטרה לבדוק סבירות ההיוונים על capture עבור כל CRE בנפרד', 'table'),
-                ('בדיקת סבירות היוונים - VFP', 'LRC_VFA_Report', 'בסיקת סבירות של רכיב הסיכון מתוך תביעות', 'table'),
-                ('בדיקת סבירות RA - VFP', 'LRC_VFA_Report', 'הבדיקה עבור מעגל LRC', 'table'),
-                ('מעגל LRC', 'LRC_VFA_Report', 'הבדיקה עבור מעגל LRC', 'table'),
-                ('LC VFA Checks', '', '', 'sheet_header'),
-                ('בדיקת סיווג רכיבי LC לחשבונות GL הנכונים', 'LC_VFA', 'המטרה לבדוק את כללי הגזירה של החשבונות המאזניים בlic', 'table'),
-                ('CSM Checks', '', '', 'sheet_header'),
-                ('בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים', 'CSM_VFA', 'המטרה לבדוק את כללי הגזירה של החשבונות', 'table'),
-                ('DAC Checks', '', '', 'sheet_header'),
-                ('בדיקת מעגל DAC מתוך הריצות', 'DAC', 'המטרה לבדוק כי מעגל DAC מחושב מריצות נכונות', 'table'),
-                ('בדיקות מעגל DAC מתוך crez3100', 'DAC', 'המטרה לבדוק כי כל הCRE שאמורים להיות נכללו במעגל', 'table'),
-                ('בדיקת מעגל DAC מתוך ה G/L', 'DAC', 'המטרה לבדוק את כללי הגזירה של החשבונות במעגל', 'table'),
-            ]
-
-            # Create DataFrame
-            toc_df = pd.DataFrame(toc_data, columns=['הבדיקה', 'לינק לבדיקה', 'הסבר', 'type'])
-            toc_df_display = toc_df[['הבדיקה', 'לינק לבדיקה', 'הסבר']].copy()
-            toc_df_display.to_excel(writer, sheet_name='ריכוז בדיקות', index=False)
-
-            workbook = writer.book
-            toc_sheet = workbook['ריכוז בדיקות']
-            toc_sheet.sheet_view.rightToLeft = True
-
-            # Apply formatting
-            green_fill = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
-            header_font = Font(bold=True, color="000000")
-            link_font = Font(color="0000FF", underline="single")
-
-            # Format headers
-            for col in range(1, 4):
-                cell = toc_sheet.cell(row=1, column=col)
-                cell.fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-                cell.font = header_font
-
-            # Format data rows
-            for idx, (check_name, sheet_link, explanation, row_type) in enumerate(toc_data, start=2):
-                # Column A - Check name
-                cell_a = toc_sheet.cell(row=idx, column=1, value=check_name)
-                if row_type == 'sheet_header' or idx == len(toc_data) + 1:  # Last row gets same color as headers
-                    cell_a.fill = green_fill
-                    cell_a.font = header_font
-
-                # Column B - Link
-                cell_b = toc_sheet.cell(row=idx, column=2)
-                if row_type == 'table' and sheet_link:
-                    # Find the specific table position with exact title matching
-                    table_row = 1  # Default to A1
-                    if sheet_link in table_positions:
-                        # Create a mapping of TOC names to actual table titles
-                        title_mapping = {
-                            'בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים - VFP': 'בדיקת סיווג רכיבי LRC לחשבונות GL הנכונים',
-                            'G/L Account Analysis - VFP': 'G/L Account Analysis',
-                            'בדיקת סבירות היוונים - VFP': 'בדיקת סבירות היוונים',
-                            'בדיקת סבירות RA - VFP': 'בדיקת סבירות RA',
-                            'בדיקת סיווג רכיבי LRC - Filtered Cost Elements': 'בדיקת סיווג רכיבי LRC - Filtered Cost Elements',
-                            'בדיקת סיווג רכיבי LRC - CRE 6000 Only': 'בדיקת סיווג רכיבי LRC - CRE 6000 Only',
-                            'מעגל LRC': 'מעגל LRC',
-                            'בדיקת סיווג רכיבי LIC לחשבונות GL הנכונים': 'בדיקת סיווג רכיבי LIC לחשבונות GL הנכונים',
-                            'G/L Account Analysis - Carry Forward VFP': 'G/L Account Analysis - Carry Forward VFP',
-                            'בדיקת היוונים עבור כל CRE': 'בדיקת סבירות היוונים',
-                            'בדיקת סבירות RA': 'בדיקת סבירות RA',
-                            'Filtered Out Cost Elements': 'Filtered Out Cost Elements',
-                            'Filtered In Cost Elements': 'Filtered In Cost Elements',
-                            'מעגל LIC': 'מעגל LIC',
-                            'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים': 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים',
-                            'G/L Account Analysis - LC': 'G/L Account Analysis - LC',
-                            'בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים': 'בדיקת סיווג רכיבי CSM לחשבונות GL הנכונים',
-                            'מעגל CSM': 'מעגל CSM',
-                            'מעגל F.V': 'מעגל F.V',
-                            'בדיקת מעגל DAC מתוך הריצות': 'בדיקת מעגל DAC מתוך הריצות',
-                            'בדיקות מעגל DAC מתוך crez3100': 'בדיקות מעגל DAC מתוך crez3100',
-                            'בדיקת מעגל DAC מתוך ה G/L': 'בדיקת מעגל DAC מתוך ה G/L'
-                        }
-
-                        target_title = title_mapping.get(check_name, check_name)
-                        for title, row_pos in table_positions[sheet_link]:
-                            if title == target_title:
-                                table_row = row_pos
-                                break
-
-                    link = f"#'{sheet_link}'!A{table_row}"
-                    cell_b.value = check_name
-                    cell_b.hyperlink = link
-                    cell_b.font = link_font
-                    if idx == len(toc_data) + 1:  # Last row gets same color formatting
-                        cell_b.fill = green_fill
-                        cell_b.font = Font(bold=True, color="000000", underline="single")
-                
-                # Column C - Explanation
-                cell_c = toc_sheet.cell(row=idx, column=3, value=explanation)
-                if idx == len(toc_data) + 1:  # Last row gets same color as headers
-                    cell_c.fill = green_fill
-
-            # Auto-fit columns
-            for col in ['A', 'B', 'C']:
-                toc_sheet.column_dimensions[col].width = 50
-
-        print(f"\nSuccessfully created the report:\n{output_path}")
+                with stages.stage(f"sheet/{sheet_name}"):
+                    blocks = consolidated_sheet_group(partials, sheet_name, pivots, all_cols, by_entity)
+                    if writer:
+                        layout_sheet_group(writer, sheet_name, blocks, table_positions, profiler)
+                report_tables.extend(sheet_report_tables(sheet_name, blocks))
+            cycle_specs = [spec for pivots in pivot_groups.values() for spec in pivots if spec.get('type') in CYCLE_TABLE_LAYOUTS]
+            coverage_blocks = [[coverage_check_from_cells(spec['type'], cells, spec)]
+                               for spec, cells in zip(cycle_specs, partials.get('Coverage_Checks', []))]
+            report_tables.extend(sheet_report_tables('Coverage_Checks', coverage_blocks))
+
+            if writer:
+                if coverage_blocks:
+                    with stages.stage('sheet/Coverage_Checks'):
+                        layout_sheet_group(writer, 'Coverage_Checks', coverage_blocks, table_positions, profiler)
+                write_report_toc(writer, table_positions, undated)
+                if profiler:
+                    profiler.write_sheet(writer)
+            save = stages.start('save')
+        stages.finish(save)
+        if save_results:
+            with stages.stage('results'):
+                results_path = report_results_path(output_path, results_format)
+                save_report_results(results_path, report_tables, file_paths, results_format, undated)
+        stages.finish(total)
+        if profiler:
+            profiler.write_json(profile_json_path(output_path))
+
+        print(f"\nSuccessfully created the consolidated report:\n{output_path if excel else results_path}")
+        return True
 
     except Exception as e:
+        if profiler:
+            profiler.close()
+        if raise_errors:
+            raise
         print(f"\nAn error occurred: {e}")
         import traceback
         traceback.print_exc()
+        return False
+
+RESULTS_FORMATS = ('parquet', 'json')
+
+def report_results_path(output_path, results_format='parquet'):
+    return f"{os.path.splitext(output_path)[0]}.results.{results_format}"
+
+def report_table_id(sheet_name, block, position, title):
+    """Identifies a report table across runs by sheet, block, place in the block and title (titles alone repeat)."""
+    return f"{sheet_name}::{block}.{position}::{title}"
+
+def sheet_report_tables(sheet_name, blocks):
+    """Lists a sheet group's tables as (table_id, sheet_name, table), numbering blocks and tables from 1."""
+    return [(report_table_id(sheet_name, block, position, table['title']), sheet_name, table)
+            for block, tables in enumerate(blocks, start=1) for position, table in enumerate(tables, start=1)]
+
+def _cell_label(key):
+    parts = key if isinstance(key, tuple) else (key,)
+    return ' | '.join(str(part) for part in parts if part is not None and str(part) != '')
+
+def tidy_report_table(table_id, sheet_name, table):
+    """Returns a table as tidy cells (table_id, sheet, table, row, column, value), its labels joined with ' | '."""
+    pivot_df = table['pivot_df']
+    pivot_df = pivot_df[~pivot_df.index.duplicated()]
+    rows = [_cell_label(key) for key in pivot_df.index]
+    columns = [_cell_label(key) for key in pivot_df.columns]
+    values = pivot_df.to_numpy(dtype=float, na_value=np.nan)
+    return pd.DataFrame({
+        'table_id': table_id, 'sheet': sheet_name, 'table': table['title'],
+        'row': np.repeat(rows, len(columns)), 'column': np.tile(columns, len(rows)), 'value': values.ravel(),
+    })
+
+def save_report_results(path, report_tables, source_files, results_format='parquet', undated=(0, 0.0)):
+    """Writes a run's tables as tidy cells, with the run and each table's filters, to one Parquet or JSON file.
+
+    The run records the source files and the undated_totals the date tables leave out."""
+    cells = pd.concat([tidy_report_table(*entry) for entry in report_tables], ignore_index=True)
+    repeated = cells.duplicated(['table_id', 'row', 'column'])
+    if repeated.any():
+        first = cells[repeated].iloc[0]
+        raise ValueError(f"{repeated.sum()} cell(s) share a table id, row and column, e.g. {first['table_id']} / {first['row']} / {first['column']}")
+    run = {'created': datetime.now().isoformat(timespec='seconds'), 'source_files': [os.path.basename(p) for p in source_files],
+           'undated_rows': undated[0], 'undated_amount': undated[1]}
+    tables = [{'table_id': table_id, 'sheet': sheet_name, 'table': table['title'], 'filters': table['filters']}
+              for table_id, sheet_name, table in report_tables]
+    if results_format == 'json':
+        with open(path, 'w', encoding='utf-8') as f:
+            # missing values (NaN) are written as null
+            json.dump({'run': run, 'tables': tables, 'cells': cells.astype(object).where(cells.notna(), None).to_dict(orient='records')},
+                      f, ensure_ascii=False, default=str)
+        return
+    if results_format != 'parquet':
+        raise ValueError(f"Unknown results format '{results_format}'. Expected one of {RESULTS_FORMATS}.")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for col in ('table_id', 'sheet', 'table', 'row', 'column'):
+        cells[col] = cells[col].astype('category')
+    table = pa.Table.from_pandas(cells, preserve_index=False)
+    metadata = {b'slpd_run': json.dumps(run, ensure_ascii=False), b'slpd_tables': json.dumps(tables, ensure_ascii=False, default=str)}
+    table = table.replace_schema_metadata({**table.schema.metadata, **{key: value.encode('utf-8') for key, value in metadata.items()}})
+    pq.write_table(table, path)
+
+def load_report_results(path):
+    """Reads a run saved by save_report_results, or the one of a report path; returns (cells, run, tables)."""
+    if not path.lower().endswith(SLPD_PARQUET_EXTENSIONS + ('.json',)):
+        parquet_path = report_results_path(path)
+        path = parquet_path if os.path.exists(parquet_path) else report_results_path(path, 'json')
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        cells = pd.DataFrame.from_records(saved['cells'], columns=['table_id', 'sheet', 'table', 'row', 'column', 'value'])
+        cells['value'] = cells['value'].astype(float)
+        return cells, saved.get('run', {}), saved.get('tables', [])
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    cells = table.to_pandas()
+    for col in ('table_id', 'sheet', 'table', 'row', 'column'):
+        if col in cells:
+            cells[col] = cells[col].astype(str)
+    return cells, json.loads(metadata.get(b'slpd_run', b'{}')), json.loads(metadata.get(b'slpd_tables', b'[]'))
+
+def diff_report_results(previous_path, current_path, output_path, tolerance=DIFF_TOLERANCE, writer_backend='openpyxl'):
+    """Writes a workbook of the cells that changed by more than tolerance between two saved runs; returns their count.
+
+    A cell missing from one run counts as 0 there."""
+    keys = ['table_id', 'sheet', 'table', 'row', 'column']
+    previous, previous_run, _ = load_report_results(previous_path)
+    current, current_run, _ = load_report_results(current_path)
+    previous, current = previous[keys + ['value']], current[keys + ['value']]
+    previous['order'] = np.arange(len(previous)) + len(current)
+    current['order'] = np.arange(len(current))
+    cells = current.merge(previous, on=keys, how='outer', suffixes=('_current', '_previous'))
+    cells['order'] = cells['order_current'].fillna(cells['order_previous'])
+    change = cells['value_current'].fillna(0) - cells['value_previous'].fillna(0)
+    cells = cells.assign(change=change)[change.abs() > tolerance].sort_values('order')
+
+    def run_label(run, path):
+        return f"{', '.join(run.get('source_files', [])) or os.path.basename(path)} ({run.get('created', 'unknown time')})"
+    filters = {'Previous run': run_label(previous_run, previous_path), 'Current run': run_label(current_run, current_path),
+               'Tolerance': f"±{tolerance:g}"}
+    with open_report_writer(output_path, writer_backend) as writer:
+        summary = cells.groupby(['table_id', 'sheet', 'table'], sort=False).agg(**{'Changed cells': ('change', 'size'), 'Largest change': ('change', lambda c: c.abs().max())})
+        summary.index.names = ['Table ID', 'Sheet', 'Table']
+        write_pivot_to_sheet(writer, 'Diff_Summary', summary, start_row=1, title='Cells changed between runs', filters=filters)
+        table_positions = {}
+        for sheet_name, sheet_cells in cells.groupby('sheet', sort=False):
+            blocks = []
+            for (_, title), table_cells in sheet_cells.groupby(['table_id', 'table'], sort=False):
+                pivot_df = pd.DataFrame({'Previous': table_cells['value_previous'].to_numpy(), 'Current': table_cells['value_current'].to_numpy(),
+                                         'Change': table_cells['change'].to_numpy()},
+                                        index=pd.MultiIndex.from_arrays([table_cells['row'], table_cells['column']], names=['Row', 'Column']))
+                blocks.append([{'title': title, 'pivot_df': pivot_df, 'filters': {}}])
+            layout_sheet_group(writer, sheet_name, blocks, table_positions)
+
+    print(f"\n{len(cells)} cell(s) changed by more than {tolerance:g}; diff written to:\n{output_path}")
+    return len(cells)
+
+def expand_input_globs(patterns):
+    """Expands the input globs (recursive '**' allowed) into a sorted list of distinct files."""
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches:
+            print(f"No input matches '{pattern}'")
+        paths.update(path for path in matches if os.path.isfile(path))
+    return sorted(paths)
+
+def batch_output_path(input_path, output_dir, taken):
+    """Names the report of input_path inside output_dir, suffixing a counter when two inputs share a name."""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    name, counter = f"final_report_{stem}.xlsx", 2
+    while name in taken:
+        name, counter = f"final_report_{stem}_{counter}.xlsx", counter + 1
+    taken.add(name)
+    return os.path.join(output_dir, name)
+
+def _prefetch_task(file_path, cache_dir, reader_engine):
+    # Parses the file into the SLPD cache so its report starts from the Parquet copy
+    load_slpd_data(file_path, ALL_COLS, cache_dir=cache_dir, reader_engine=reader_engine)
+
+def _batch_report_task(file_path, output_path, report_options):
+    start = time.perf_counter()
+    try:
+        options = dict(report_options)
+        if options.pop('profile', False):
+            options['profiler'] = StageProfiler()
+        # files already run in parallel, so each report aggregates its sheet groups in-process
+        create_final_report(file_path, output_path, workers=1, raise_errors=True, **options)
+        return None, time.perf_counter() - start
+    except Exception as e:
+        return f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+def run_batch(input_paths, output_dir, workers=None, fail_fast=False, prefetch=True, **report_options):
+    """Runs create_final_report over many exports with at most `workers` in flight, prefetching the next into the cache.
+
+    fail_fast stops starting reports after a failure. Returns a dict per file with input, output, seconds and error."""
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(input_paths)))
+    prefetch = prefetch and report_options.get('use_cache', True)
+    queue, taken, results = list(input_paths), set(), []
+    batch_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as report_pool, ProcessPoolExecutor(max_workers=1) as prefetch_pool:
+        prefetched, running = {}, {}
+        while queue or running:
+            while queue and len(running) < workers:
+                file_path = queue.pop(0)
+                if file_path in prefetched:
+                    # Errors resurface in the report itself, which reads the file again
+                    wait([prefetched.pop(file_path)])
+                output_path = batch_output_path(file_path, output_dir, taken)
+                running[report_pool.submit(_batch_report_task, file_path, output_path, report_options)] = (file_path, output_path)
+                if prefetch and queue and queue[0] not in prefetched:
+                    prefetched[queue[0]] = prefetch_pool.submit(_prefetch_task, queue[0], report_options.get('cache_dir'), report_options.get('reader_engine', 'auto'))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, output_path = running.pop(future)
+                error, seconds = future.result()
+                results.append({'input': file_path, 'output': output_path, 'seconds': seconds, 'error': error})
+                if error and fail_fast and queue:
+                    print(f"\nStopping after failure of {file_path}; {len(queue)} file(s) not started")
+                    queue.clear()
+        for future in prefetched.values():
+            future.cancel()
+
+    print(f"\nBatch summary ({len(results)} file(s), {time.perf_counter() - batch_start:.1f}s wall time):")
+    for result in sorted(results, key=lambda r: r['input']):
+        status = f"FAILED  {result['error']}" if result['error'] else f"ok      {result['output']}"
+        print(f"  {result['seconds']:8.1f}s  {result['input']}  {status}")
+    failures = [r for r in results if r['error']]
+    print(f"{len(results) - len(failures)} succeeded, {len(failures)} failed, {len(input_paths) - len(results)} not started")
+    return results
+
+def run_gui():
+    """Asks for one source file and an output folder with tkinter dialogs, then writes a timestamped report."""
+    import tkinter as tk
+    from tkinter import filedialog
 
-if __name__ == "__main__":
     root = tk.Tk()
     root.withdraw()
-    input_file_path = filedialog.askopenfilename(title="Select the source Excel file", filetypes=(("Excel Files", "*.xlsx *.xls"), ("All files", "*.*")))
+    input_file_path = filedialog.askopenfilename(title="Select the SLPD export", filetypes=(("SLPD exports", "*.xlsx *.xls *.csv *.csv.gz *.parquet"), ("All files", "*.*")))
     if input_file_path:
         output_dir_path = filedialog.askdirectory(title="Select Output Folder")
         if output_dir_path:
@@ -956,3 +2835,61 @@ if __name__ == "__main__":
             print(f"Output will be saved as: {full_output_path}")
             create_final_report(input_file_path, full_output_path)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build SLPD check reports. Without inputs, file dialogs ask for a single file.")
+    parser.add_argument('inputs', nargs='*', help="input files or globs, .xlsx/.xls, .csv or .parquet, e.g. 'exports/**/*.xlsx'")
+    parser.add_argument('--out-dir', default='.', help="folder for the reports (default: current folder)")
+    parser.add_argument('--workers', type=int, default=None, help="reports built at the same time (default: one per CPU)")
+    policy = parser.add_mutually_exclusive_group()
+    policy.add_argument('--fail-fast', action='store_true', help="stop starting new reports after the first failure")
+    policy.add_argument('--continue', dest='fail_fast', action='store_false', help="attempt every file even after failures (default)")
+    parser.add_argument('--no-prefetch', dest='prefetch', action='store_false', help="do not parse the next input ahead of time")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help="always parse inputs from scratch")
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--reader-engine', choices=READER_ENGINES, default='auto')
+    parser.add_argument('--source-data', dest='source_data_mode', choices=SOURCE_DATA_MODES, default='full')
+    parser.add_argument('--writer', dest='writer_backend', choices=sorted(REPORT_WRITERS), default='openpyxl')
+    parser.add_argument('--backend', dest='execution_backend', choices=sorted(EXECUTION_BACKENDS), default='pandas', help="engine for the filters and pivots")
+    parser.add_argument('--cycle-history-dir', default=None, help="keep per-quarter cycle aggregates here, in a subfolder per input")
+    parser.add_argument('--profile', action='store_true', help="add a _Profile sheet and write <report>.profile.json")
+    parser.add_argument('--memory-budget', dest='memory_budget_mb', type=float, default=None,
+                        help="stream each input in batches sized for this many MB instead of loading it whole")
+    parser.add_argument('--coverage-checks', action='store_true', help="add a Coverage_Checks sheet ranking the Coverage IDs whose cycles do not roll forward")
+    parser.add_argument('--exceptions-only', action='store_true',
+                        help="list only the rows with an amount in the coverage tables marked 'exceptions_only'")
+    parser.add_argument('--save-results', action='store_true', help="also store every table's cells and filters as <report>.results.<format>")
+    parser.add_argument('--results-format', choices=RESULTS_FORMATS, default='parquet')
+    parser.add_argument('--no-excel', dest='excel', action='store_false', help="only store the results (implies --save-results), no workbook")
+    parser.add_argument('--diff', nargs=2, metavar=('PREVIOUS', 'CURRENT'), default=None,
+                        help="compare two saved runs (results files or their reports) into results_diff.xlsx in --out-dir")
+    parser.add_argument('--diff-tolerance', type=float, default=DIFF_TOLERANCE)
+    parser.add_argument('--consolidate', metavar='NAME.xlsx', default=None, help="write one consolidated report over all inputs into --out-dir")
+    parser.add_argument('--by-entity', action='store_true', help="with --consolidate, break the tables down by input file")
+    args = parser.parse_args()
+
+    if args.diff:
+        os.makedirs(args.out_dir, exist_ok=True)
+        diff_report_results(*args.diff, os.path.join(args.out_dir, 'results_diff.xlsx'), args.diff_tolerance, args.writer_backend)
+    elif not args.inputs:
+        run_gui()
+    else:
+        input_paths = expand_input_globs(args.inputs)
+        if not input_paths:
+            raise SystemExit("No input files found.")
+        if args.consolidate:
+            os.makedirs(args.out_dir, exist_ok=True)
+            ok = create_consolidated_report(input_paths, os.path.join(args.out_dir, args.consolidate), by_entity=args.by_entity,
+                                            use_cache=args.use_cache, cache_dir=args.cache_dir, reader_engine=args.reader_engine,
+                                            writer_backend=args.writer_backend, profiler=StageProfiler() if args.profile else None,
+                                            memory_budget_mb=args.memory_budget_mb, save_results=args.save_results,
+                                            results_format=args.results_format, excel=args.excel, coverage_checks=args.coverage_checks,
+                                            exceptions_only=args.exceptions_only)
+            raise SystemExit(0 if ok else 1)
+        results = run_batch(input_paths, args.out_dir, workers=args.workers, fail_fast=args.fail_fast, prefetch=args.prefetch,
+                            use_cache=args.use_cache, cache_dir=args.cache_dir, reader_engine=args.reader_engine,
+                            source_data_mode=args.source_data_mode, writer_backend=args.writer_backend, execution_backend=args.execution_backend,
+                            cycle_history_dir=args.cycle_history_dir, profile=args.profile, memory_budget_mb=args.memory_budget_mb,
+                            save_results=args.save_results, results_format=args.results_format, excel=args.excel,
+                            coverage_checks=args.coverage_checks, exceptions_only=args.exceptions_only)
+        if any(r['error'] for r in results) or len(results) < len(input_paths):
+            raise SystemExit(1)
@@ -0,0 +1,57 @@
+"""The original script's tables: the golden output the report's tables are compared against."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from slpd_benchmark import _all_specs
+from styled_pivot_automation_good_version_fix import ALL_COLS, load_report_results, tidy_report_table
+
+baseline = pytest.importorskip('styled_pivot_automation_good_version')
+
+# gl_col_filter did not exist in the original script
+SPECS = [(sheet, spec) for sheet, spec in _all_specs() if 'gl_col_filter' not in spec]
+
+def baseline_frame(raw_slpd):
+    """The source frame as the original script typed it: text sub accounts and posting dates."""
+    df = raw_slpd.copy()
+    df[ALL_COLS['amount_col']] = pd.to_numeric(df[ALL_COLS['amount_col']], errors='coerce').fillna(0)
+    df[ALL_COLS['sub_acc_col']] = df[ALL_COLS['sub_acc_col']].astype(str)
+    df[ALL_COLS['date_col']] = df[ALL_COLS['date_col']].astype(str)
+    df[ALL_COLS['acc_change_col']] = pd.to_numeric(df[ALL_COLS['acc_change_col']], errors='coerce').fillna(0).astype(int)
+    return df
+
+def baseline_pivot(df, spec):
+    """The table the original script built for spec from a baseline_frame: its filters, pd.pivot_table, then column_filter."""
+    df, _ = baseline.get_filtered_df(df, spec, ALL_COLS)
+    index_cols = [ALL_COLS[i] for i in spec['index']] if isinstance(spec['index'], list) else ALL_COLS[spec['index']]
+    column_col = ALL_COLS[spec['columns']] if spec.get('columns') else None
+    pivot_df = pd.pivot_table(df, values=ALL_COLS['amount_col'], index=index_cols, columns=column_col,
+                              aggfunc="sum", fill_value=0, margins=True, margins_name='Grand Total')
+    if 'column_filter' in spec:
+        existing_columns = [col for col in spec['column_filter'] if col in pivot_df.columns]
+        if existing_columns:
+            if 'Grand Total' in pivot_df.columns:
+                existing_columns.append('Grand Total')
+            pivot_df = pivot_df[existing_columns]
+    return pivot_df
+
+def baseline_tables(raw_slpd):
+    """Every spec's baseline table as tidy cells (see tidy_report_table), in SPECS order."""
+    df = baseline_frame(raw_slpd)
+    return [tidy_report_table(None, sheet_name, {'title': spec['title'], 'pivot_df': baseline_pivot(df, spec)})
+            for sheet_name, spec in SPECS]
+
+def _same_cells(cells, expected):
+    keys = ['row', 'column']
+    cells, expected = cells.sort_values(keys, ignore_index=True), expected.sort_values(keys, ignore_index=True)
+    return (cells[keys].equals(expected[keys])
+            and np.allclose(cells['value'].to_numpy(), expected['value'].to_numpy(), rtol=1e-9, atol=1e-6))
+
+def assert_report_matches_baseline(report_path, expected_tables):
+    """Checks each baseline table against the saved report's tables of its sheet and title (a full-table run, the default)."""
+    cells = load_report_results(report_path)[0]
+    tables = {key: group for key, group in cells.groupby(['sheet', 'table', 'table_id'], sort=False)}
+    for expected in expected_tables:
+        sheet_name, title = expected['sheet'].iat[0], expected['table'].iat[0]
+        candidates = [group for (sheet, table, _), group in tables.items() if (sheet, table) == (sheet_name, title)]
+        assert any(_same_cells(group, expected) for group in candidates), f"{sheet_name} / {title} differs from the baseline"
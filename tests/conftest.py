@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slpd_benchmark import make_synthetic_slpd
+from styled_pivot_automation_good_version_fix import ALL_COLS, prepare_slpd_frame
+
+SYNTHETIC_ROWS = 3000
+
+@pytest.fixture(scope='session')
+def raw_slpd():
+    """A small synthetic SLPD export, as read from a file (before prepare_slpd_frame)."""
+    return make_synthetic_slpd(SYNTHETIC_ROWS, seed=7)
+
+@pytest.fixture
+def slpd_df(raw_slpd):
+    return prepare_slpd_frame(raw_slpd.copy(), ALL_COLS)
+
+@pytest.fixture(scope='session')
+def slpd_files(raw_slpd, tmp_path_factory):
+    """The synthetic export written as .xlsx, .csv and .parquet; maps the format to the path."""
+    folder = tmp_path_factory.mktemp('inputs')
+    paths = {'xlsx': str(folder / 'slpd.xlsx'), 'csv': str(folder / 'slpd.csv'), 'parquet': str(folder / 'slpd.parquet')}
+    raw_slpd.to_excel(paths['xlsx'], sheet_name='SLPD', index=False)
+    raw_slpd.to_csv(paths['csv'], index=False)
+    raw_slpd.to_parquet(paths['parquet'], index=False)
+    return paths
+
+@pytest.fixture(scope='session')
+def baseline_slpd_tables(raw_slpd):
+    """The original script's tables for raw_slpd (see tests/baseline.py)."""
+    from baseline import baseline_tables
+    return baseline_tables(raw_slpd)
@@ -0,0 +1,15 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+from styled_pivot_automation_good_version_fix import ALL_COLS, load_slpd_data
+
+@pytest.mark.parametrize('input_format', ['xlsx', 'csv', 'parquet'])
+def test_cached_frame_matches_parsed_frame(slpd_files, tmp_path, capsys, input_format):
+    # test_pivots checks the parsed frame's tables against the original script
+    parsed = load_slpd_data(slpd_files[input_format], ALL_COLS, use_cache=False)
+    cache_dir = str(tmp_path / 'cache')
+    missed = load_slpd_data(slpd_files[input_format], ALL_COLS, cache_dir=cache_dir)
+    cached = load_slpd_data(slpd_files[input_format], ALL_COLS, cache_dir=cache_dir)
+    assert capsys.readouterr().out.count('Loaded cached SLPD data') == 1
+    assert_frame_equal(missed, parsed)
+    assert_frame_equal(cached, parsed)
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from baseline import assert_report_matches_baseline
+from styled_pivot_automation_good_version_fix import create_consolidated_report, create_final_report, diff_report_results
+
+def test_entity_missing_tables(raw_slpd, slpd_files, tmp_path):
+    # three rows leave most tables of the second entity empty
+    tiny_path, combined_path = str(tmp_path / 'tiny.csv'), str(tmp_path / 'combined.csv')
+    raw_slpd.head(3).to_csv(tiny_path, index=False)
+    pd.concat([raw_slpd, raw_slpd.head(3)]).to_csv(combined_path, index=False)
+    consolidated, combined = str(tmp_path / 'consolidated.xlsx'), str(tmp_path / 'combined.xlsx')
+
+    assert create_consolidated_report([slpd_files['csv'], tiny_path], consolidated, use_cache=False, excel=False, raise_errors=True)
+    assert create_final_report(combined_path, combined, use_cache=False, workers=1, excel=False, raise_errors=True)
+    assert diff_report_results(combined, consolidated, str(tmp_path / 'diff.xlsx')) == 0
+
+def test_by_entity_missing_tables(raw_slpd, slpd_files, tmp_path):
+    tiny_path, output_path = str(tmp_path / 'tiny.csv'), str(tmp_path / 'by_entity.xlsx')
+    raw_slpd.head(3).to_csv(tiny_path, index=False)
+    assert create_consolidated_report([slpd_files['csv'], tiny_path], output_path, by_entity=True, use_cache=False, raise_errors=True)
+
+def test_consolidated_report_matches_baseline(raw_slpd, baseline_slpd_tables, tmp_path):
+    # the export split in two entities, one Parquet and one CSV file
+    first_path, second_path = str(tmp_path / 'first.parquet'), str(tmp_path / 'second.csv')
+    raw_slpd.iloc[::2].to_parquet(first_path, index=False)
+    raw_slpd.iloc[1::2].to_csv(second_path, index=False)
+    output_path = str(tmp_path / 'consolidated.xlsx')
+    assert create_consolidated_report([first_path, second_path], output_path, use_cache=False, excel=False,
+                                      raise_errors=True)
+    assert_report_matches_baseline(output_path, baseline_slpd_tables)
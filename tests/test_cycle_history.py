@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from styled_pivot_automation_good_version_fix import (ALL_COLS, CYCLE_TABLE_LAYOUTS, PIVOT_GROUPS, FilterPlan, create_final_report, cycle_cells,
+                                                      cycle_inputs, diff_report_results)
+
+def test_rerun_with_history_matches_run_without(slpd_files, tmp_path):
+    history_dir = str(tmp_path / 'history')
+    fresh, first, second = (str(tmp_path / f"{name}.xlsx") for name in ('fresh', 'first', 'second'))
+    assert create_final_report(slpd_files['csv'], fresh, use_cache=False, workers=1, excel=False, raise_errors=True)
+    for output_path in (first, second):
+        assert create_final_report(slpd_files['csv'], output_path, use_cache=False, workers=1, cycle_history_dir=history_dir, excel=False, raise_errors=True)
+        assert diff_report_results(fresh, output_path, str(tmp_path / 'diff.xlsx')) == 0
+
+def test_inputs_sharing_history_dir_keep_their_own_quarters(raw_slpd, slpd_files, tmp_path):
+    # an entity whose export covers only the last year of the other one
+    recent_path = str(tmp_path / 'recent.csv')
+    raw_slpd[pd.to_datetime(raw_slpd[ALL_COLS['date_col']]).dt.year == 2024].to_csv(recent_path, index=False)
+    history_dir = str(tmp_path / 'history')
+    fresh, shared = str(tmp_path / 'fresh.xlsx'), str(tmp_path / 'shared.xlsx')
+
+    assert create_final_report(slpd_files['csv'], str(tmp_path / 'other.xlsx'), use_cache=False, workers=1, cycle_history_dir=history_dir, excel=False, raise_errors=True)
+    assert create_final_report(recent_path, shared, use_cache=False, workers=1, cycle_history_dir=history_dir, excel=False, raise_errors=True)
+    assert create_final_report(recent_path, fresh, use_cache=False, workers=1, excel=False, raise_errors=True)
+    assert diff_report_results(fresh, shared, str(tmp_path / 'diff.xlsx')) == 0
+    assert len(os.listdir(history_dir)) == 2
+
+def _sorted_cells(cells):
+    keys = [col for col in cells.columns if col != 'amount']
+    return cells.astype({'coverage': str} if 'coverage' in cells else {}).sort_values(keys, ignore_index=True)
+
+def test_coverage_history_follows_rows_moving_coverage(slpd_df, tmp_path):
+    history_dir, coverage_col = str(tmp_path / 'history'), ALL_COLS['coverage_id_col']
+    pivots = PIVOT_GROUPS['LRC_VFA_Report']
+    frames = dict(zip(CYCLE_TABLE_LAYOUTS['custom_lrc_cycle']['components'],
+                      cycle_inputs(FilterPlan(slpd_df, ALL_COLS), 'LRC_VFA_Report', pivots)['custom_lrc_cycle']))
+    cycle_cells(frames, ALL_COLS, history_dir, 'LRC', coverage_col=coverage_col)
+    # the same rows, every third of them booked to another coverage
+    moved = {}
+    for component, frame in frames.items():
+        frame = frame.copy()
+        coverages = frame[coverage_col].astype(str).to_numpy(copy=True)
+        coverages[::3] = np.roll(coverages, 1)[::3]
+        moved[component] = frame.assign(**{coverage_col: coverages})
+    expected = _sorted_cells(cycle_cells(moved, ALL_COLS, coverage_col=coverage_col))
+    assert_frame_equal(_sorted_cells(cycle_cells(moved, ALL_COLS, history_dir, 'LRC', coverage_col=coverage_col)), expected)
+    # the unsplit cells of the same table keep a history of their own
+    assert_frame_equal(_sorted_cells(cycle_cells(moved, ALL_COLS, history_dir, 'LRC')), _sorted_cells(cycle_cells(moved, ALL_COLS)))
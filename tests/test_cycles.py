@@ -0,0 +1,44 @@
+import collections
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from baseline import baseline, baseline_frame
+from slpd_benchmark import make_synthetic_slpd
+from styled_pivot_automation_good_version_fix import ALL_COLS, PIVOT_GROUPS, FilterPlan, compute_sheet_group, cycle_inputs, prepare_slpd_frame
+
+CYCLES = [('LRC_VFA_Report', 'custom_lrc_cycle', 'create_lrc_cycle_table'),
+          ('LIC_VFA', 'custom_lic_cycle', 'create_lic_cycle_table'),
+          ('CSM_VFA', 'custom_csm_cycle', 'create_csm_cycle_table')]
+# seed 3 also posts to the LRC's זקיפה לCSM row; the original escapes the parentheses of those step
+# patterns, so its regexes match the same steps as PROCESS_STEP_CLASSES' literal ones
+SEEDS = [0, 1, 2, 3]
+
+class BaselineFilters:
+    """Cuts the cycle source frames with the original script's get_filtered_df, as cycle_inputs expects of a FilterPlan."""
+    def __init__(self, df):
+        self.df = df
+
+    def filter(self, spec):
+        return baseline.get_filtered_df(self.df, spec, ALL_COLS)
+
+def baseline_cycle_table(monkeypatch, raw_slpd, sheet_name, cycle_type, builder):
+    """The cycle table the original script wrote for the sheet's cycle spec."""
+    written = []
+    monkeypatch.setattr(baseline, 'write_pivot_to_sheet', lambda writer, sheet_name, pivot_df, start_row, *args, **kwargs: written.append(pivot_df) or start_row)
+    pivots = PIVOT_GROUPS[sheet_name]
+    spec = next(pivot_spec for pivot_spec in pivots if pivot_spec.get('type') == cycle_type)
+    df1, df2 = cycle_inputs(BaselineFilters(baseline_frame(raw_slpd)), sheet_name, pivots)[cycle_type]
+    getattr(baseline, builder)(None, sheet_name, df1.copy(), df2.copy(), spec, 1, ALL_COLS, collections.defaultdict(list))
+    return written[0]
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('sheet_name, cycle_type, builder', CYCLES, ids=[cycle_type for _, cycle_type, _ in CYCLES])
+def test_cycle_table_matches_baseline(monkeypatch, seed, sheet_name, cycle_type, builder):
+    raw_slpd = make_synthetic_slpd(3000, seed=seed)
+    pivots = PIVOT_GROUPS[sheet_name]
+    position = next(i for i, pivot_spec in enumerate(pivots) if pivot_spec.get('type') == cycle_type)
+    # blocks follow the specs; a side-by-side table can share the cycle's title
+    blocks = compute_sheet_group(FilterPlan(prepare_slpd_frame(raw_slpd.copy(), ALL_COLS), ALL_COLS), sheet_name, pivots, ALL_COLS)
+    assert_frame_equal(blocks[position][0]['pivot_df'], baseline_cycle_table(monkeypatch, raw_slpd, sheet_name, cycle_type, builder),
+                       check_dtype=False, check_names=False, check_exact=False, rtol=1e-9, atol=1e-6)
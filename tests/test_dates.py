@@ -0,0 +1,48 @@
+import openpyxl
+import pandas as pd
+import pytest
+
+from styled_pivot_automation_good_version_fix import ALL_COLS, create_final_report, load_report_results, parse_posting_dates
+
+def test_unparseable_posting_dates_are_reported(capsys):
+    dates = parse_posting_dates(pd.Series(['2024-03-31', '31.03.2024', None, 'n/a', '31.03.2024']))
+    assert dates.isna().tolist() == [False, True, True, True, True]
+    out = capsys.readouterr().out
+    assert "3 posting date(s) could not be parsed" in out
+    assert "'31.03.2024', 'n/a'" in out
+
+def test_parseable_posting_dates_are_not_reported(capsys):
+    dates = parse_posting_dates(pd.Series(['2024-03-31', '2024-06-30 00:00:00', None]))
+    assert list(dates.cat.categories) == [pd.Timestamp('2024-03-31'), pd.Timestamp('2024-06-30')]
+    assert capsys.readouterr().out == ''
+
+@pytest.fixture
+def day_first_csv(raw_slpd, tmp_path):
+    """The export as a CSV whose every fifth posting date is written day first (31/03/2024), which ISO 8601 parsing rejects."""
+    raw = raw_slpd.copy()
+    dates = pd.to_datetime(raw[ALL_COLS['date_col']])
+    day_first = raw.index % 5 == 0
+    raw[ALL_COLS['date_col']] = dates.dt.strftime('%Y-%m-%d').where(~day_first, dates.dt.strftime('%d/%m/%Y'))
+    path = str(tmp_path / 'day_first.csv')
+    raw.to_csv(path, index=False)
+    return path, int(day_first.sum()), float(raw.loc[day_first, ALL_COLS['amount_col']].sum())
+
+@pytest.mark.parametrize('memory_budget_mb', [None, 0.5], ids=['loaded', 'streamed'])
+def test_unparseable_posting_dates_are_totalled_in_the_report(day_first_csv, tmp_path, memory_budget_mb):
+    path, rows, amount = day_first_csv
+    output_path = str(tmp_path / 'report.xlsx')
+    assert create_final_report(path, output_path, use_cache=False, workers=1, memory_budget_mb=memory_budget_mb,
+                               save_results=True, raise_errors=True)
+    run = load_report_results(output_path)[1]
+    assert run['undated_rows'] == rows
+    assert run['undated_amount'] == pytest.approx(amount)
+    toc = openpyxl.load_workbook(output_path, read_only=True)['ריכוז בדיקות']
+    explanation = next(row[2] for row in toc.iter_rows(values_only=True) if row[0] == 'Rows without a posting date')
+    assert explanation.startswith(f"{rows} row(s) amounting to {amount:,.2f} ")
+
+def test_dated_report_has_no_undated_row(slpd_files, tmp_path):
+    output_path = str(tmp_path / 'report.xlsx')
+    assert create_final_report(slpd_files['csv'], output_path, use_cache=False, workers=1, save_results=True, raise_errors=True)
+    assert load_report_results(output_path)[1]['undated_rows'] == 0
+    toc = openpyxl.load_workbook(output_path, read_only=True)['ריכוז בדיקות']
+    assert 'Rows without a posting date' not in [row[0] for row in toc.iter_rows(values_only=True)]
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from baseline import assert_report_matches_baseline, baseline_tables
+from slpd_benchmark import _all_specs
+from styled_pivot_automation_good_version_fix import ALL_COLS, FilterPlan, create_final_report, prepare_slpd_frame, report_results_path
+
+COVERAGE_TABLES = [(sheet, spec) for sheet, spec in _all_specs() if spec['index'] in ('coverage_id_col', ['coverage_id_col']) and spec.get('columns') == 'cost_elem_col']
+
+@pytest.fixture(scope='module')
+def netted_slpd(raw_slpd):
+    """The synthetic export plus reversals of every posting of half the coverages, which then net to zero."""
+    coverages = raw_slpd[ALL_COLS['coverage_id_col']].dropna().unique()[::2]
+    reversals = raw_slpd[raw_slpd[ALL_COLS['coverage_id_col']].isin(coverages)].copy()
+    reversals[ALL_COLS['amount_col']] = -pd.to_numeric(reversals[ALL_COLS['amount_col']])
+    return pd.concat([raw_slpd, reversals], ignore_index=True)
+
+@pytest.fixture(scope='module')
+def reports(netted_slpd, tmp_path_factory):
+    """The netted export's report run by default and with exceptions_only; maps the flag to the report path."""
+    folder = tmp_path_factory.mktemp('exceptions')
+    input_path = str(folder / 'netted.csv')
+    netted_slpd.to_csv(input_path, index=False)
+    paths = {}
+    for exceptions_only in (True, False):
+        paths[exceptions_only] = str(folder / f"report_{exceptions_only}.xlsx")
+        options = {'exceptions_only': True} if exceptions_only else {}
+        assert create_final_report(input_path, paths[exceptions_only], use_cache=False, workers=1, excel=False,
+                                   raise_errors=True, **options)
+    return paths
+
+@pytest.fixture(scope='module')
+def report_cells(reports):
+    return {exceptions_only: pd.read_parquet(report_results_path(path)) for exceptions_only, path in reports.items()}
+
+def test_default_report_matches_baseline(reports, netted_slpd):
+    assert_report_matches_baseline(reports[False], baseline_tables(netted_slpd))
+
+def test_exceptions_only_report_matches_baseline_but_for_the_coverage_tables(reports, netted_slpd):
+    coverage_tables = {(sheet_name, spec['title']) for sheet_name, spec in COVERAGE_TABLES}
+    other_tables = [table for table in baseline_tables(netted_slpd) if (table['sheet'].iat[0], table['table'].iat[0]) not in coverage_tables]
+    assert_report_matches_baseline(reports[True], other_tables)
+
+def table_rows(cells, sheet_name, title):
+    table = cells[(cells['sheet'] == sheet_name) & (cells['table'] == title)]
+    return table.groupby('table_id', observed=True)['row'].nunique().tolist()
+
+@pytest.mark.parametrize('sheet_name, spec', COVERAGE_TABLES, ids=[f"{sheet}/{spec['title']}" for sheet, spec in COVERAGE_TABLES])
+def test_exceptions_only_drops_netted_rows(report_cells, netted_slpd, sheet_name, spec):
+    plan = FilterPlan(prepare_slpd_frame(netted_slpd.copy(), ALL_COLS), ALL_COLS)
+    exceptions, full = plan.pivot(spec), plan.pivot({**spec, 'exceptions_only': False})
+    assert len(exceptions) < len(full)
+    assert len(exceptions) in table_rows(report_cells[True], sheet_name, spec['title'])
+    assert len(full) in table_rows(report_cells[False], sheet_name, spec['title'])
+
+def test_exceptions_only_leaves_other_tables_alone(report_cells):
+    titles = [spec['title'] for _, spec in COVERAGE_TABLES]
+    exceptions, full = (cells[~cells['table'].isin(titles)].reset_index(drop=True) for cells in (report_cells[True], report_cells[False]))
+    assert_frame_equal(exceptions, full, check_categorical=False)
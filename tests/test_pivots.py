@@ -0,0 +1,13 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+from baseline import SPECS, baseline_frame, baseline_pivot
+from styled_pivot_automation_good_version_fix import ALL_COLS, FilterPlan, spec_pivot_table
+
+@pytest.mark.parametrize('sheet_name, spec', SPECS, ids=[f"{sheet}/{spec['title']}" for sheet, spec in SPECS])
+def test_pivot_matches_baseline(raw_slpd, slpd_df, sheet_name, spec):
+    filtered_df, _ = FilterPlan(slpd_df, ALL_COLS).filter(spec)
+    table = spec_pivot_table(filtered_df, {**spec, 'exceptions_only': False}, ALL_COLS)
+    expected = baseline_pivot(baseline_frame(raw_slpd), spec)
+    assert_frame_equal(table, expected, check_dtype=False, check_index_type=False, check_column_type=False,
+                       check_names=False, check_exact=False, rtol=1e-9, atol=1e-6)
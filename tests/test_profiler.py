@@ -0,0 +1,37 @@
+import tracemalloc
+
+from styled_pivot_automation_good_version_fix import StageProfiler, create_final_report
+
+def test_profiler_stops_the_tracing_it_started():
+    assert not tracemalloc.is_tracing()
+    profiler = StageProfiler()
+    with profiler.stage('outer'):
+        with profiler.stage('inner'):
+            assert tracemalloc.is_tracing()
+            data = [0] * 100000
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    assert len(data) and profiler.frame()['peak_traced_mb'].notna().all()
+
+def test_profiler_leaves_tracing_it_did_not_start():
+    tracemalloc.start()
+    try:
+        with StageProfiler().stage('outer'):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+def test_close_stops_tracing_of_unfinished_stages():
+    profiler = StageProfiler()
+    record = profiler.start('total')
+    profiler.close()
+    assert not tracemalloc.is_tracing()
+    profiler.finish(record)
+    assert 'peak_traced_mb' not in record
+
+def test_profiled_report_stops_tracing(slpd_files, tmp_path):
+    profiler = StageProfiler()
+    assert create_final_report(slpd_files['csv'], str(tmp_path / 'report.xlsx'), use_cache=False, excel=False, profiler=profiler, raise_errors=True)
+    assert not tracemalloc.is_tracing()
+    assert profiler.frame().loc['total', 'peak_traced_mb'] > 0
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from styled_pivot_automation_good_version_fix import ALL_COLS, get_slpd_sheet_name, prepare_slpd_frame, read_slpd_file
+
+pytest.importorskip('python_calamine')
+
+@pytest.fixture(scope='module')
+def mixed_workbook(raw_slpd, tmp_path_factory):
+    """The export with text in its number and date columns, blanks and a mixed column, behind a Summary sheet."""
+    mixed = raw_slpd.head(600).astype(object)
+    mixed.loc[::7, ALL_COLS['sub_acc_col']] = 'X-' + mixed.loc[::7, ALL_COLS['sub_acc_col']].astype(str)
+    mixed.loc[::11, ALL_COLS['date_col']] = 'not a date'
+    mixed.loc[::13, ALL_COLS['amount_col']] = None
+    mixed.loc[::17, ALL_COLS['acc_change_col']] = 'n/a'
+    mixed['Note'] = [pd.Timestamp('2024-01-31') if i % 3 == 0 else (i if i % 3 == 1 else f"text {i}") for i in range(len(mixed))]
+    path = str(tmp_path_factory.mktemp('readers') / 'mixed.xlsx')
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({'Total': [1]}).to_excel(writer, sheet_name='Summary', index=False)
+        mixed.to_excel(writer, sheet_name='SLPD data', index=False)
+    return path
+
+@pytest.mark.parametrize('workbook', ['xlsx', 'mixed'])
+def test_calamine_reads_what_openpyxl_reads(slpd_files, mixed_workbook, workbook):
+    path = slpd_files['xlsx'] if workbook == 'xlsx' else mixed_workbook
+    assert get_slpd_sheet_name(path, engine='calamine') == get_slpd_sheet_name(path, engine='openpyxl')
+    calamine, openpyxl = read_slpd_file(path, ALL_COLS, 'calamine'), read_slpd_file(path, ALL_COLS, 'openpyxl')
+    assert_frame_equal(calamine, openpyxl)
+    assert_frame_equal(prepare_slpd_frame(calamine, ALL_COLS), prepare_slpd_frame(openpyxl, ALL_COLS))
+
+@pytest.mark.parametrize('sheet_names, expected', [(['Summary', 'SLPD data'], 'SLPD data'), (['Export'], 'Export'),
+                                                   (['Summary', 'Export'], 'Sheet1')])
+def test_calamine_picks_the_sheet_openpyxl_picks(tmp_path, sheet_names, expected):
+    path = str(tmp_path / 'sheets.xlsx')
+    with pd.ExcelWriter(path) as writer:
+        for sheet_name in sheet_names:
+            pd.DataFrame({'Total': [1]}).to_excel(writer, sheet_name=sheet_name, index=False)
+    assert get_slpd_sheet_name(path, engine='calamine') == get_slpd_sheet_name(path, engine='openpyxl') == expected
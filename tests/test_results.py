@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+from baseline import SPECS, assert_report_matches_baseline, baseline_frame, baseline_pivot
+from styled_pivot_automation_good_version_fix import (ALL_COLS, DIFF_TOLERANCE, create_final_report, diff_report_results,
+                                                       load_report_results, report_table_id, save_report_results,
+                                                       tidy_report_table)
+
+@pytest.fixture(scope='module')
+def previous_run(slpd_files, tmp_path_factory):
+    output_path = str(tmp_path_factory.mktemp('previous') / 'report.xlsx')
+    assert create_final_report(slpd_files['parquet'], output_path, use_cache=False, workers=1, excel=False, raise_errors=True)
+    return output_path
+
+@pytest.mark.parametrize('results_format', ['parquet', 'json'])
+def test_diff_of_identical_runs_is_empty(slpd_files, previous_run, tmp_path, results_format):
+    output_path = str(tmp_path / 'report.xlsx')
+    assert create_final_report(slpd_files['xlsx'], output_path, use_cache=False, workers=1, excel=False,
+                               results_format=results_format, raise_errors=True)
+    assert diff_report_results(previous_run, output_path, str(tmp_path / 'diff.xlsx')) == 0
+
+def test_diff_counts_each_changed_cell_once(raw_slpd, previous_run, tmp_path):
+    changed = raw_slpd.copy()
+    changed[ALL_COLS['amount_col']] += 1
+    input_path, output_path = str(tmp_path / 'changed.parquet'), str(tmp_path / 'report.xlsx')
+    changed.to_parquet(input_path, index=False)
+    assert create_final_report(input_path, output_path, use_cache=False, workers=1, excel=False, raise_errors=True)
+
+    keys = ['table_id', 'row', 'column']
+    previous, current = load_report_results(previous_run)[0], load_report_results(output_path)[0]
+    cells = current.merge(previous, on=keys, how='outer', suffixes=('', '_previous')).fillna({'value': 0, 'value_previous': 0})
+    expected = int(((cells['value'] - cells['value_previous']).abs() > 0.005).sum())
+    assert expected > 0
+    assert diff_report_results(previous_run, output_path, str(tmp_path / 'diff.xlsx')) == expected
+
+def test_tables_sharing_a_title_keep_their_own_cells(previous_run):
+    cells, _, tables = load_report_results(previous_run)
+    ids = [table['table_id'] for table in tables]
+    assert len(ids) == len(set(ids))
+    assert not cells.duplicated(['table_id', 'row', 'column']).any()
+    for sheet_name, title in [('LC_VFA', 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים'), ('CSM_VFA', 'מעגל CSM')]:
+        same_title = [table['table_id'] for table in tables if table['sheet'] == sheet_name and table['table'] == title]
+        assert len(same_title) == 2
+        for table_id in same_title:
+            assert len(cells[cells['table_id'] == table_id]) > 0
+    lc_tables = cells[cells['table'] == 'בדיקת סיווג רכיבי LC לחשבונות GL הנכונים']
+    assert (lc_tables['row'] == 'Grand Total').groupby(lc_tables['table_id']).any().sum() == 2
+
+@pytest.mark.parametrize('results_format', ['parquet', 'json'])
+def test_saved_results_match_baseline(slpd_files, baseline_slpd_tables, tmp_path, results_format):
+    output_path = str(tmp_path / 'report.xlsx')
+    assert create_final_report(slpd_files['xlsx'], output_path, use_cache=False, workers=1, excel=False,
+                               results_format=results_format, raise_errors=True)
+    assert_report_matches_baseline(output_path, baseline_slpd_tables)
+
+def test_diff_of_baseline_tables(raw_slpd, tmp_path):
+    # amounts change on some rows and other rows go, so cells change, and rows and columns come and go
+    changed = raw_slpd.drop(raw_slpd.index[::7])
+    changed.loc[changed.index[::5], ALL_COLS['amount_col']] += 1
+    paths, cells = {}, {}
+    for name, raw in [('previous', raw_slpd), ('current', changed)]:
+        df = baseline_frame(raw)
+        report_tables = [(report_table_id(sheet_name, block, 1, spec['title']), sheet_name,
+                          {'title': spec['title'], 'pivot_df': baseline_pivot(df, spec), 'filters': {}})
+                         for block, (sheet_name, spec) in enumerate(SPECS, start=1)]
+        paths[name] = str(tmp_path / f"{name}.results.parquet")
+        save_report_results(paths[name], report_tables, [name])
+        cells[name] = pd.concat([tidy_report_table(*entry) for entry in report_tables], ignore_index=True)
+
+    both = cells['current'].merge(cells['previous'], on=['table_id', 'row', 'column'], how='outer', suffixes=('', '_previous'))
+    expected = int(((both['value'].fillna(0) - both['value_previous'].fillna(0)).abs() > DIFF_TOLERANCE).sum())
+    assert expected > 0
+    assert diff_report_results(paths['previous'], paths['current'], str(tmp_path / 'diff.xlsx')) == expected
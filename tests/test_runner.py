@@ -0,0 +1,29 @@
+import pytest
+
+import styled_pivot_automation_good_version_fix as report
+from styled_pivot_automation_good_version_fix import ALL_COLS, PIVOT_GROUPS, sheet_group_runner
+
+class PoolUsed(Exception):
+    pass
+
+@pytest.fixture
+def no_pool(monkeypatch):
+    def pool(*args, **kwargs):
+        raise PoolUsed()
+    monkeypatch.setattr(report, 'ProcessPoolExecutor', pool)
+    monkeypatch.setattr(report.os, 'cpu_count', lambda: 4)
+
+def test_small_export_is_aggregated_in_process(slpd_df, no_pool):
+    with sheet_group_runner(slpd_df, PIVOT_GROUPS, ALL_COLS) as compute_group:
+        assert compute_group('DAC')
+
+def test_large_export_uses_the_pool(slpd_df, no_pool, monkeypatch):
+    monkeypatch.setattr(report, 'PARALLEL_SHEET_GROUPS_MIN_ROWS', len(slpd_df))
+    with pytest.raises(PoolUsed):
+        with sheet_group_runner(slpd_df, PIVOT_GROUPS, ALL_COLS):
+            pass
+
+def test_worker_count_uses_the_pool(slpd_df, no_pool):
+    with pytest.raises(PoolUsed):
+        with sheet_group_runner(slpd_df, PIVOT_GROUPS, ALL_COLS, workers=2):
+            pass
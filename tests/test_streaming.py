@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+
+from baseline import assert_report_matches_baseline
+from styled_pivot_automation_good_version_fix import create_final_report, diff_report_results, report_results_path
+
+@pytest.mark.parametrize('input_format', ['xlsx', 'csv', 'parquet'])
+def test_streamed_report_matches_loaded_report(slpd_files, tmp_path, capsys, input_format):
+    loaded, streamed = str(tmp_path / 'loaded.xlsx'), str(tmp_path / 'streamed.xlsx')
+    assert create_final_report(slpd_files[input_format], loaded, use_cache=False, workers=1, excel=False, raise_errors=True)
+    # a budget this small splits the export into many batches, some without rows for a table
+    assert create_final_report(slpd_files[input_format], streamed, memory_budget_mb=0.5, excel=False, raise_errors=True)
+    assert 'Aggregating in batches of' in capsys.readouterr().out
+    assert diff_report_results(loaded, streamed, str(tmp_path / 'diff.xlsx')) == 0
+
+def test_streamed_coverage_checks_match_loaded_ones(slpd_files, tmp_path):
+    loaded, streamed = str(tmp_path / 'loaded.xlsx'), str(tmp_path / 'streamed.xlsx')
+    assert create_final_report(slpd_files['csv'], loaded, use_cache=False, workers=1, excel=False, coverage_checks=True, raise_errors=True)
+    assert create_final_report(slpd_files['csv'], streamed, memory_budget_mb=0.5, excel=False, coverage_checks=True, raise_errors=True)
+    cells = pd.read_parquet(report_results_path(streamed))
+    assert (cells['sheet'] == 'Coverage_Checks').any()
+    assert diff_report_results(loaded, streamed, str(tmp_path / 'diff.xlsx')) == 0
+
+def test_streamed_report_matches_baseline(slpd_files, baseline_slpd_tables, tmp_path):
+    output_path = str(tmp_path / 'streamed.xlsx')
+    assert create_final_report(slpd_files['parquet'], output_path, memory_budget_mb=0.5, excel=False,
+                               raise_errors=True)
+    assert_report_matches_baseline(output_path, baseline_slpd_tables)
@@ -0,0 +1,113 @@
+import io
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import styled_pivot_automation_good_version_fix as report
+from styled_pivot_automation_good_version_fix import create_final_report
+
+def package_parts(path):
+    with zipfile.ZipFile(path) as package:
+        # core.xml holds the save time
+        return {name: package.read(name) for name in package.namelist() if name != 'docProps/core.xml'}
+
+@pytest.mark.parametrize('source_data_mode', ['full', 'stream'])
+def test_parallel_writer_matches_openpyxl_writer(slpd_files, tmp_path, source_data_mode):
+    outputs = {}
+    for backend in ('openpyxl', 'openpyxl-parallel'):
+        outputs[backend] = str(tmp_path / f"{backend}.xlsx")
+        assert create_final_report(slpd_files['csv'], outputs[backend], use_cache=False, workers=1, writer_backend=backend,
+                                   source_data_mode=source_data_mode, coverage_checks=True, raise_errors=True)
+    expected, parts = package_parts(outputs['openpyxl']), package_parts(outputs['openpyxl-parallel'])
+    assert sorted(parts) == sorted(expected)
+    assert [name for name in expected if parts[name] != expected[name]] == []
+
+def test_parallel_writer_falls_back_on_unchecked_openpyxl(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(report.openpyxl, '__version__', '9.0.0')
+    with report.open_report_writer(str(tmp_path / 'report.xlsx'), 'openpyxl-parallel') as writer:
+        assert type(writer) is report.OpenpyxlReportWriter
+        writer.write_title('Sheet', 1, 1, 'Title')
+    assert 'falling back to openpyxl' in capsys.readouterr().out
+
+@pytest.fixture
+def started_pools(monkeypatch):
+    """Records the process pools the report module starts."""
+    pools, executor = [], report.ProcessPoolExecutor
+
+    def pool(*args, **kwargs):
+        pools.append(executor(*args, **kwargs))
+        return pools[-1]
+    monkeypatch.setattr(report, 'ProcessPoolExecutor', pool)
+    return pools
+
+def write_sheets(path, backend, sheet_names):
+    pivot_df = pd.DataFrame({'Amount': [1.5, -2.0]}, index=pd.Index(['a', 'b'], name='Key'))
+    with report.open_report_writer(path, backend) as writer:
+        for sheet_name in sheet_names:
+            report.layout_sheet_group(writer, sheet_name, [[{'title': sheet_name, 'pivot_df': pivot_df, 'filters': {'Filter': 'x'}}]], {})
+
+@pytest.mark.parametrize('sheet_names, pools', [(['One'], 0), (['One', 'Two', 'Three'], 1)])
+def test_parallel_writer_starts_its_pool_for_a_second_sheet(started_pools, tmp_path, sheet_names, pools):
+    outputs = {backend: str(tmp_path / f"{backend}.xlsx") for backend in ('openpyxl', 'openpyxl-parallel')}
+    for backend, path in outputs.items():
+        write_sheets(path, backend, sheet_names)
+    assert len(started_pools) == pools
+    assert package_parts(outputs['openpyxl-parallel']) == package_parts(outputs['openpyxl'])
+
+def test_parallel_writer_fallback_starts_no_pool(monkeypatch, started_pools, tmp_path):
+    monkeypatch.setattr(report.openpyxl, '__version__', '9.0.0')
+    write_sheets(str(tmp_path / 'report.xlsx'), 'openpyxl-parallel', ['One', 'Two'])
+    assert started_pools == []
+
+def to_excel_cells(pivot_df):
+    """The non-empty cells pandas' to_excel writes for pivot_df, read back with openpyxl."""
+    buffer = io.BytesIO()
+    pivot_df.to_excel(buffer, sheet_name='Pivot')
+    buffer.seek(0)
+    ws = openpyxl.load_workbook(buffer)['Pivot']
+    return {(cell.row - 1, cell.column - 1): cell.value for row in ws.iter_rows() for cell in row if cell.value not in (None, '')}
+
+def report_pivots(slpd_df):
+    plan = report.FilterPlan(slpd_df, report.ALL_COLS)
+    for sheet_name, pivots in report.PIVOT_GROUPS.items():
+        for tables in report.compute_sheet_group(plan, sheet_name, pivots, report.ALL_COLS, coverage_checks=True):
+            for table in tables:
+                yield table['pivot_df']
+                if 'coverage_check' in table:
+                    yield table['coverage_check']['pivot_df']
+
+def test_pivot_cells_follow_to_excel_layout(slpd_df):
+    periods = pd.period_range('2024Q1', periods=3, freq='Q')
+    shapes = [
+        pd.DataFrame({'a': [1.0, np.nan], 'b': [np.inf, -2.5]}, index=pd.Index(['x', 'y'], name='key')),
+        pd.DataFrame({'a': [1, 2, 3]}, index=pd.MultiIndex.from_tuples([('x', None), ('x', 'q'), ('y', 'q')], names=['k1', None])),
+        pd.DataFrame([[1, 2, 3]], columns=pd.MultiIndex.from_product([['c'], periods], names=['part', 'quarter']), index=['row']),
+        pd.DataFrame({'a': [1, 2]}, index=pd.MultiIndex.from_arrays([['x', 'x'], periods[:2]])),
+        pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=['k1', 'k2'])),
+    ]
+    for pivot_df in list(report_pivots(slpd_df)) + shapes:
+        cells = {key: value for key, value in report.pivot_excel_cells(pivot_df).items() if value not in (None, '')}
+        expected = to_excel_cells(pivot_df)
+        assert sorted(cells) == sorted(expected)
+        # openpyxl saves floats to 15 significant digits
+        assert [key for key, value in cells.items() if not (value == expected[key] or (
+            isinstance(value, float) and value == pytest.approx(expected[key], rel=1e-14, abs=1e-9)))] == []
+
+def workbook_values(path):
+    book = openpyxl.load_workbook(path)
+    return {ws.title: [row for row in ws.iter_rows(values_only=True)] for ws in book.worksheets}
+
+def test_xlsxwriter_report_matches_openpyxl_report(slpd_files, tmp_path):
+    pytest.importorskip('xlsxwriter')
+    outputs = {}
+    for backend in ('openpyxl', 'xlsxwriter'):
+        outputs[backend] = str(tmp_path / f"{backend}.xlsx")
+        assert create_final_report(slpd_files['csv'], outputs[backend], use_cache=False, workers=1, writer_backend=backend,
+                                   coverage_checks=True, raise_errors=True)
+    expected, values = workbook_values(outputs['openpyxl']), workbook_values(outputs['xlsxwriter'])
+    assert list(values) == list(expected)
+    for sheet_name, rows in expected.items():
+        assert values[sheet_name] == rows, sheet_name